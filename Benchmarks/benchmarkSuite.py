@@ -0,0 +1,304 @@
+#!/usr/bin/python3
+import os
+import io
+import sys
+import math
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import contextlib
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+import gcode_lib
+import polygon_lib
+import text_lib
+import gcodeToSvg
+
+# ------------------------------------------------------------------------------
+                                                        # command line arguments
+parser = argparse.ArgumentParser(
+  description='measures the g-code generation and conversion speeds ' +
+    'on synthetic workloads'
+)
+parser.add_argument(
+    '-s', '--scale', default=1,
+    help = 'workload size factor, smaller for quick runs'
+)
+parser.add_argument(
+    '-r', '--repeat', default=3,
+    help = 'number of runs per workload, the fastest one being kept'
+)
+parser.add_argument(
+    '-w', '--workloads', default='',
+    help = 'comma-separated workload names, all by default'
+)
+parser.add_argument(
+    '-o', '--output',
+    help = 'JSON file for the results'
+)
+parser.add_argument(
+    '-b', '--baseline',
+    help = 'JSON results file to compare with'
+)
+parser.add_argument(
+    '-t', '--tolerance', default=0.2,
+    help = 'relative slowdown flagged as a regression'
+)
+parser_arguments = parser.parse_args()
+scale = float(parser_arguments.scale)
+repeat_nb = int(parser_arguments.repeat)
+tolerance = float(parser_arguments.tolerance)
+
+# ------------------------------------------------------------------------------
+                                                           # drilling parameters
+machining_parameters = dict(gcode_lib.default_machining_parameters)
+machining_parameters['drill_depth'] = 6
+machining_parameters['pass_depth']  = 1
+
+# ------------------------------------------------------------------------------
+                                                                # workload sizes
+CIRCLE_FACET_NB = 1000*1000
+POLYGON_POINT_NB = 1000*1000
+HOLE_NB = 5000
+TEXT_LENGTH = 10*1000
+SVG_LINE_NB = 2*1000*1000
+
+# ------------------------------------------------------------------------------
+                                                                       # display
+INDENT = 2 * ' '
+
+# ==============================================================================
+                                                                     # workloads
+# ..............................................................................
+                                                       # circle with many facets
+def circle_workload():
+    facet_nb = max(round(scale*CIRCLE_FACET_NB), 3)
+
+    return(lambda : len(gcode_lib.circle_gcode(100, facet_nb)))
+
+# ..............................................................................
+                                                   # star polygon as point lists
+def star_polygon(point_nb):
+    random.seed(0)
+    return([
+        [
+            random.uniform(50, 100)*math.cos(2*math.pi*index/point_nb),
+            random.uniform(50, 100)*math.sin(2*math.pi*index/point_nb)
+        ] for index in range(point_nb)
+    ])
+
+def polygon_workload():
+    polygon = star_polygon(max(round(scale*POLYGON_POINT_NB), 3))
+
+    return(lambda : len(gcode_lib.polygon_gcode(
+        gcode_lib.rotate_polygon(
+            gcode_lib.offset_polygon(polygon, 10, 20), math.pi/6
+        )
+    )))
+
+# ..............................................................................
+                                                 # star polygon as a NumPy array
+def polygon_array_workload():
+    polygon = polygon_lib.Polygon(
+        star_polygon(max(round(scale*POLYGON_POINT_NB), 3))
+    )
+
+    return(lambda : len(gcode_lib.polygon_gcode(
+        polygon.offset(10, 20).rotate(math.pi/6)
+    )))
+
+# ..............................................................................
+                                                              # random hole sets
+def random_holes():
+    random.seed(0)
+    return([
+        [random.uniform(0, 1000), random.uniform(0, 1000)]
+            for index in range(max(round(scale*HOLE_NB), 1))
+    ])
+
+def holes_workload():
+    hole_set = random_holes()
+
+    return(lambda : len(gcode_lib.build_hole_set(
+        hole_set, machining_parameters, 'holes'
+    )))
+
+def holes_optimised_workload():
+    hole_set = random_holes()
+
+    return(lambda : len(gcode_lib.build_hole_set(
+        hole_set, machining_parameters, 'holes', optimise_order=True
+    )))
+
+# ..............................................................................
+                                          # long text line, parsing the font too
+def text_workload(font_file_name):
+    pangram = 'The quick brown fox jumps over the lazy dog 0123456789 '
+    text = (pangram*math.ceil(scale*TEXT_LENGTH/len(pangram)))
+    text = text[:max(round(scale*TEXT_LENGTH), 1)]
+    font_file_spec = os.path.join(parent_dir, font_file_name)
+
+    def run():
+        text_lib.fonts.clear()
+        return(len(text_lib.line_g_code(
+            text, font_file_spec, machining_parameters
+        )))
+
+    return(run)
+
+# ..............................................................................
+                                             # synthetic g-code converted to SVG
+def write_synthetic_gcode(writer, line_nb):
+    random.seed(0)
+    writer.write(gcode_lib.go_to_start(
+        machining_parameters=machining_parameters
+    ))
+    while writer.line_nb < line_nb :
+        element = random.choice(['circle', 'polygon', 'holes'])
+        x = random.uniform(0, 100)
+        y = random.uniform(0, 100)
+        if element == 'circle' :
+            writer.write_lines(gcode_lib.build_drawing_element_lines(
+                gcode_lib.circle_gcode(random.uniform(5, 50), 128),
+                x, y, machining_parameters, element
+            ))
+        elif element == 'polygon' :
+            polygon = [
+                [random.uniform(0, 50), random.uniform(0, 50)]
+                    for index in range(random.randint(10, 1000))
+            ]
+            writer.write_lines(gcode_lib.build_drawing_element_lines(
+                gcode_lib.polygon_gcode(polygon),
+                x, y, machining_parameters, element
+            ))
+        else :
+            hole_set = [
+                [random.uniform(0, 100), random.uniform(0, 100)]
+                    for index in range(random.randint(10, 1000))
+            ]
+            writer.write_lines(gcode_lib.build_hole_set_lines(
+                hole_set, machining_parameters, element
+            ))
+        writer.write(gcode_lib.move_back_to_origin())
+
+def svg_workload():
+    (file_descriptor, gcode_file_spec) = tempfile.mkstemp(suffix='.gcode')
+    os.close(file_descriptor)
+    temporary_files.append(gcode_file_spec)
+    svg_file_spec = gcode_file_spec.replace('.gcode', '.svg')
+    temporary_files.append(svg_file_spec)
+    with gcode_lib.open_gcode_writer(gcode_file_spec) as writer :
+        write_synthetic_gcode(writer, max(round(scale*SVG_LINE_NB), 1))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()) :
+            gcodeToSvg.gcode_to_svg(gcode_file_spec, svg_file_spec)
+        return(os.path.getsize(svg_file_spec))
+
+    return(run)
+
+# ..............................................................................
+                                                             # workloads by name
+#
+# Each workload is prepared by a function returning the callable to time,
+# which returns the size of its output in bytes. All random inputs are
+# seeded for the runs to be reproducible.
+#
+workloads = {
+    'circle'          : circle_workload,
+    'polygon'         : polygon_workload,
+    'polygon_array'   : polygon_array_workload,
+    'holes'           : holes_workload,
+    'holes_optimised' : holes_optimised_workload,
+    'text_rounded'    : lambda : text_workload('text-rounded.txt'),
+    'text_squared'    : lambda : text_workload('text-squared.txt'),
+    'svg'             : svg_workload
+}
+temporary_files = []
+
+# ==============================================================================
+                                                                   # measurement
+# ..............................................................................
+                                    # fastest time of several runs of a workload
+def measure(name):
+    run = workloads[name]()
+    durations = []
+    for index in range(repeat_nb) :
+        start_time = time.perf_counter()
+        byte_nb = run()
+        durations.append(time.perf_counter() - start_time)
+
+    return({'seconds' : min(durations), 'bytes' : byte_nb})
+
+# ..............................................................................
+                                         # workloads slower than in the baseline
+def regressions(results, baseline):
+    slower = []
+    for (name, result) in results['workloads'].items() :
+        reference = baseline['workloads'].get(name)
+        if reference is None :
+            continue
+        ratio = result['seconds']/max(reference['seconds'], 1E-9)
+        print(INDENT + "%-16s %8.3f s instead of %8.3f s (%+.0f %%)" % (
+            name, result['seconds'], reference['seconds'], 100*(ratio - 1)
+        ))
+        if reference['bytes'] != result['bytes'] :
+            print(2*INDENT + "output of %d bytes instead of %d" % (
+                result['bytes'], reference['bytes']
+            ))
+        if ratio > 1 + tolerance :
+            slower.append(name)
+
+    return(slower)
+
+# ==============================================================================
+                                                                   # main script
+print('G-code library benchmark suite')
+names = list(workloads)
+if parser_arguments.workloads :
+    names = parser_arguments.workloads.split(',')
+    for name in names :
+        if name not in workloads :
+            sys.exit("unknown workload \"%s\"" % name)
+results = {
+    'python'    : platform.python_version(),
+    'machine'   : platform.machine(),
+    'scale'     : scale,
+    'repeat'    : repeat_nb,
+    'workloads' : {}
+}
+                                                                 # run workloads
+try :
+    for name in names :
+        result = measure(name)
+        results['workloads'][name] = result
+        print(INDENT + "%-16s %8.3f s, %d bytes" % (
+            name, result['seconds'], result['bytes']
+        ))
+finally :
+    for file_spec in temporary_files :
+        if os.path.exists(file_spec) :
+            os.remove(file_spec)
+                                                                  # save results
+if parser_arguments.output :
+    with open(parser_arguments.output, 'w') as output_file :
+        json.dump(results, output_file, indent=2)
+    print(INDENT + "results written to \"%s\"" % parser_arguments.output)
+                                                         # compare with baseline
+if parser_arguments.baseline :
+    with open(parser_arguments.baseline) as baseline_file :
+        baseline = json.load(baseline_file)
+    print("Comparison with \"%s\"" % parser_arguments.baseline)
+    if baseline.get('scale') != scale :
+        print(INDENT + "warning: baseline measured at scale %s" % (
+            baseline.get('scale')
+        ))
+    slower = regressions(results, baseline)
+    if slower :
+        print("Regressions: %s" % ', '.join(slower))
+        sys.exit(1)
+    print("No regression")
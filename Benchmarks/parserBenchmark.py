@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+import gcode_lib
+import gcode_parser
+
+# ------------------------------------------------------------------------------
+                                                        # command line arguments
+parser = argparse.ArgumentParser(
+  description='measures the g-code parser speed on a synthetic file'
+)
+parser.add_argument(
+    '-n', '--lines', default=10*1000*1000,
+    help = 'number of g-code lines'
+)
+parser.add_argument(
+    '-k', '--keep',
+    help = 'keep the synthetic g-code in the specified file'
+)
+parser_arguments = parser.parse_args()
+line_nb = int(parser_arguments.lines)
+
+# ------------------------------------------------------------------------------
+                                                           # drilling parameters
+machining_parameters = dict(gcode_lib.default_machining_parameters)
+machining_parameters['drill_depth'] = 6
+machining_parameters['pass_depth']  = 1
+
+# ------------------------------------------------------------------------------
+                                                                       # display
+INDENT = 2 * ' '
+
+# ==============================================================================
+                                                              # synthetic g-code
+# ..............................................................................
+                # multiple pass circles, polygons and hole sets at random places
+def write_synthetic_gcode(writer, line_nb):
+    random.seed(0)
+    writer.write(gcode_lib.go_to_start(
+        machining_parameters=machining_parameters
+    ))
+    while writer.line_nb < line_nb :
+        element = random.choice(['circle', 'polygon', 'holes'])
+        x = random.uniform(0, 100)
+        y = random.uniform(0, 100)
+        if element == 'circle' :
+            writer.write_lines(gcode_lib.build_drawing_element_lines(
+                gcode_lib.circle_gcode(random.uniform(5, 50), 128),
+                x, y, machining_parameters, element
+            ))
+        elif element == 'polygon' :
+            polygon = [
+                [random.uniform(0, 50), random.uniform(0, 50)]
+                    for index in range(random.randint(10, 1000))
+            ]
+            writer.write_lines(gcode_lib.build_drawing_element_lines(
+                gcode_lib.polygon_gcode(polygon),
+                x, y, machining_parameters, element
+            ))
+        else :
+            hole_set = [
+                [random.uniform(0, 100), random.uniform(0, 100)]
+                    for index in range(random.randint(10, 1000))
+            ]
+            writer.write_lines(gcode_lib.build_hole_set_lines(
+                hole_set, machining_parameters, element
+            ))
+        writer.write(gcode_lib.move_back_to_origin())
+
+# ==============================================================================
+                                                                   # main script
+print('G-code parser benchmark')
+if parser_arguments.keep :
+    gcode_file_spec = parser_arguments.keep
+else :
+    (file_descriptor, gcode_file_spec) = tempfile.mkstemp(suffix='.gcode')
+    os.close(file_descriptor)
+                                                             # build g-code file
+print(INDENT + "writing %d lines to \"%s\"" % (line_nb, gcode_file_spec))
+with gcode_lib.open_gcode_writer(gcode_file_spec) as writer :
+    write_synthetic_gcode(writer, line_nb)
+    written_line_nb = writer.line_nb
+                                                                # tokenizer only
+start_time = time.perf_counter()
+with open(gcode_file_spec) as gcode_file :
+    for line in gcode_file :
+        gcode_parser.tokenize(line)
+duration = time.perf_counter() - start_time
+print(INDENT + "tokenizer : %10.0f lines/s" % (written_line_nb/duration))
+                                                                   # full parser
+start_time = time.perf_counter()
+move_nb = 0
+for move in gcode_parser.parse_gcode_file(gcode_file_spec) :
+    move_nb += 1
+duration = time.perf_counter() - start_time
+print(INDENT + "parser    : %10.0f lines/s (%d moves)" % (
+    written_line_nb/duration, move_nb
+))
+                                                                      # clean up
+if not parser_arguments.keep :
+    os.remove(gcode_file_spec)
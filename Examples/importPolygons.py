@@ -45,12 +45,13 @@ g_code_file.write(gcode_lib.move_back_to_origin())
 # ------------------------------------------------------------------------------
                                                             # gear shape polygon
 print(INDENT + 'reading from %s' % polygon_file_name)
+polygons = gcode_lib.import_polygons(
+    polygon_file_name, [polygon1_name, polygon2_name]
+)
 
 comment = "polygon \"%s\"" % polygon1_name
 print(INDENT + comment)
-polygon = gcode_lib.flip_vertical(
-    gcode_lib.import_polygon(polygon_file_name, polygon1_name)
-)
+polygon = gcode_lib.flip_vertical(polygons[polygon1_name])
 (x_min, y_min, x_max, y_max) = gcode_lib.min_max(polygon)
 polygon = gcode_lib.offset_polygon(polygon, -x_min, -y_min)
 (x_offset, y_offset, polygon) = gcode_lib.extract_offset(polygon)
@@ -65,13 +66,9 @@ g_code_file.write(gcode_lib.move_back_to_origin())
 
 # ------------------------------------------------------------------------------
                                                             # star shape polygon
-print(INDENT + 'reading from %s' % polygon_file_name)
-
 comment = "polygon \"%s\"" % polygon2_name
 print(INDENT + comment)
-polygon = gcode_lib.flip_vertical(
-    gcode_lib.import_polygon(polygon_file_name, polygon2_name)
-)
+polygon = gcode_lib.flip_vertical(polygons[polygon2_name])
 polygon = gcode_lib.offset_polygon(polygon, -x_min, -y_min)
 (x_offset, y_offset, polygon) = gcode_lib.extract_offset(polygon)
 g_code_file.write(gcode_lib.build_drawing_element(
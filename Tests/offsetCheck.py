@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+import os
+import sys
+import math
+import random
+import argparse
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+import gcode_lib
+import offset_lib
+
+# ------------------------------------------------------------------------------
+                                                        # command line arguments
+parser = argparse.ArgumentParser(
+  description='checks the clearance of offset polygons on random shapes'
+)
+parser.add_argument(
+    '-n', '--number', default=200,
+    help = 'number of random polygons'
+)
+parser_arguments = parser.parse_args()
+polygon_nb = int(parser_arguments.number)
+
+# ------------------------------------------------------------------------------
+                                                                    # parameters
+DISTANCES = (1, 3, -1, -3)
+JOINS = ('miter', 'arc')
+MARGIN = 1E-6
+                                              # shapes which have shown problems
+POLYGONS = [
+    [[0, 0], [100, 5], [0, 10]],
+    [
+        [0, 0], [-11.85, -1.71], [-25.86, -3.97], [-22.1, -3.74],
+        [-37.73, -8.66], [-35.06, -13.87], [0, -20]
+    ]
+]
+                                                                       # display
+INDENT = 2 * ' '
+
+# ==============================================================================
+                                                                        # checks
+# ..............................................................................
+                                               # distance from a point to a ring
+def ring_distance(point, ring):
+    (x, y) = point
+    distances = []
+    for index in range(len(ring)) :
+        (x1, y1) = ring[index-1]
+        (x2, y2) = ring[index]
+        (dx, dy) = (x2 - x1, y2 - y1)
+        length = dx**2 + dy**2
+        t = 0
+        if length > 0 :
+            t = min(max(((x - x1)*dx + (y - y1)*dy)/length, 0), 1)
+        distances.append(math.hypot(x - x1 - t*dx, y - y1 - t*dy))
+
+    return(min(distances))
+
+# ..............................................................................
+                                   # random star-shaped counterclockwise polygon
+def random_polygon():
+    while True :
+        point_nb = random.randint(3, 40)
+        angles = sorted(
+            random.uniform(0, 2*math.pi) for index in range(point_nb)
+        )
+        gaps = [
+            end - start for (start, end) in
+                zip(angles, angles[1:] + [angles[0] + 2*math.pi])
+        ]
+        if max(gaps) < math.pi :
+            break
+    polygon = []
+    for angle in angles :
+        radius = random.uniform(5, 40)
+        polygon.append([radius*math.cos(angle), radius*math.sin(angle)])
+
+    return(polygon)
+
+# ..............................................................................
+                # offset vertices closer to the polygon than the offset distance
+#
+# The arc joins may cut corners by the arc tolerance.
+#
+def clearance_failures(polygon):
+    failures = []
+    for distance in DISTANCES :
+        for join in JOINS :
+            for ring in offset_lib.offset_rings([polygon], distance, join) :
+                clearance = min(
+                    ring_distance(point, polygon) for point in ring
+                )
+                if clearance < abs(distance) \
+                    - offset_lib.DEFAULT_ARC_TOLERANCE - MARGIN \
+                :
+                    failures.append((distance, join, clearance))
+
+    return(failures)
+
+# ==============================================================================
+                                                                   # main script
+print('Offset clearance check')
+random.seed(0)
+polygons = POLYGONS + [random_polygon() for index in range(polygon_nb)]
+failed = 0
+for (index, polygon) in enumerate(polygons) :
+    for (distance, join, clearance) in clearance_failures(polygon) :
+        failed += 1
+        print(INDENT + "polygon %d, distance %g, %s join: clearance %.3f" % (
+            index, distance, join, clearance
+        ))
+                                        # clockwise rings keep their start point
+expanded = gcode_lib.expand_polygon([[0, 0], [0, 10], [10, 10], [10, 0]], 1)
+if expanded[0] != [1, 1] :
+    failed += 1
+    print(INDENT + "clockwise square starting at %s" % expanded[0])
+if failed :
+    print("%d failures" % failed)
+    sys.exit(1)
+print("No failure on %d polygons" % len(polygons))
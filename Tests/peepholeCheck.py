@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+import os
+import sys
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+sys.path.append(parent_dir)
+import peephole_lib
+
+# ------------------------------------------------------------------------------
+                                                                    # parameters
+                     # programs where each move has to be kept, with their names
+PROGRAMS = [
+    ('units change', ['G21', 'G0 X10 Y10', 'G20', 'G0 X10 Y10']),
+    ('tool length offset', ['G43 H1', 'G0 Z5', 'G49', 'G0 Z5']),
+    ('coordinate system', ['G55', 'G0 X1 Y1', 'G54', 'G0 X1 Y1']),
+    ('relative full circle', ['G91', 'G1 X1 f100', 'G2 X0 Y0 I5 J0'])
+]
+MOTIONS = ('G0', 'G1', 'G2', 'G3')
+                                                                       # display
+INDENT = 2 * ' '
+
+# ==============================================================================
+                                                                        # checks
+# ..............................................................................
+                                              # moves which have lost their axes
+def missing_moves(program):
+    optimiser = peephole_lib.PeepholeOptimiser()
+    moves = [
+        line.split() for line in optimiser.optimise(program)
+            if line.split()[0] in MOTIONS
+    ]
+    move_nb = len([line for line in program if line.split()[0] in MOTIONS])
+    lost = move_nb - len(moves)
+    lost += len([
+        words for words in moves
+            if not any(word[0] in 'XYZ' for word in words[1:])
+    ])
+
+    return(lost)
+
+# ==============================================================================
+                                                                   # main script
+print('Peephole optimiser check')
+failed = 0
+for (name, program) in PROGRAMS :
+    lost = missing_moves(program)
+    if lost :
+        failed += 1
+        print(INDENT + "%s: %d moves lost" % (name, lost))
+if failed :
+    print("%d failures" % failed)
+    sys.exit(1)
+print("No failure on %d programs" % len(PROGRAMS))
@@ -0,0 +1,230 @@
+import numpy
+import gcode_parser
+import toolpath_lib
+
+# ==============================================================================
+                                                            # machine parameters
+#
+# Rates are in mm/min as the feed words, accelerations in mm/s^2, per axis
+# X, Y and Z, as the GRBL $110-$112 and $120-$122 settings.
+#
+default_machine_parameters = {
+    'max_rates'           : (3000, 3000, 1000),
+    'accelerations'       : (100, 100, 50),
+    'junction_deviation'  : 0.01,
+    'rapids_use_feed'     : True,
+}
+
+MIN_LENGTH = 1E-9
+START_SECTION = 'start'
+
+# ==============================================================================
+                                                              # segment geometry
+# ..............................................................................
+              # length and start and end unit vectors of the moves of a toolpath
+def segment_geometry(toolpath):
+    delta = numpy.stack((
+        toolpath.x2 - toolpath.x1,
+        toolpath.y2 - toolpath.y1,
+        toolpath.z2 - toolpath.z1
+    ), axis=1)
+    length = numpy.sqrt((delta*delta).sum(axis=1))
+    start_direction = delta.copy()
+    end_direction = delta.copy()
+    radius = numpy.zeros(len(toolpath))
+                                # arcs: helical length and tangents at both ends
+    is_arc = toolpath.kind >= toolpath_lib.KIND_CODES['G2']
+    if is_arc.any() :
+        clockwise = toolpath.kind[is_arc] == toolpath_lib.KIND_CODES['G2']
+        center_x = toolpath.center_x[is_arc]
+        center_y = toolpath.center_y[is_arc]
+        x1 = toolpath.x1[is_arc] - center_x
+        y1 = toolpath.y1[is_arc] - center_y
+        x2 = toolpath.x2[is_arc] - center_x
+        y2 = toolpath.y2[is_arc] - center_y
+        arc_radius = numpy.hypot(x1, y1)
+        start_angle = numpy.arctan2(y1, x1)
+        end_angle = numpy.arctan2(y2, x2)
+        sweep = numpy.where(
+            clockwise,
+            (start_angle - end_angle) % (2*numpy.pi),
+            (end_angle - start_angle) % (2*numpy.pi)
+        )
+        sweep[sweep < 1E-9] = 2*numpy.pi
+        planar_length = arc_radius*sweep
+        delta_z = delta[is_arc, 2]
+        length[is_arc] = numpy.hypot(planar_length, delta_z)
+        direction = numpy.where(clockwise, -1.0, 1.0)
+        start_direction[is_arc] = numpy.stack((
+            -direction*numpy.sin(start_angle)*planar_length,
+            direction*numpy.cos(start_angle)*planar_length,
+            delta_z
+        ), axis=1)
+        end_direction[is_arc] = numpy.stack((
+            -direction*numpy.sin(end_angle)*planar_length,
+            direction*numpy.cos(end_angle)*planar_length,
+            delta_z
+        ), axis=1)
+        radius[is_arc] = arc_radius
+    safe_length = numpy.maximum(length, MIN_LENGTH)[:, None]
+
+    return(
+        length, start_direction/safe_length, end_direction/safe_length, radius
+    )
+
+# ..............................................................................
+               # per-segment limit from per-axis limits and direction components
+def directional_limit(components, axis_limits):
+    with numpy.errstate(divide='ignore') :
+        limits = numpy.asarray(axis_limits, dtype=numpy.float64) / components
+
+    return(limits.min(axis=1))
+
+# ==============================================================================
+                                                               # motion planning
+# ..............................................................................
+                                 # largest squared speeds reachable at the nodes
+#
+# With the squared speed w at node i, the next node can be reached at most
+# with w + 2*a*L, and never above its own limit c. This min-plus recurrence
+# is solved for all nodes at once: w[i] = D[i] + min(c[k] - D[k], k <= i)
+# where D is the running sum of 2*a*L.
+#
+def reachable_speeds(limits, increments):
+    running_sum = numpy.concatenate(([0.0], numpy.cumsum(increments)))
+
+    return(running_sum + numpy.minimum.accumulate(limits - running_sum))
+
+# ..............................................................................
+                                            # time of trapezoidal speed profiles
+def profile_times(length, entry_speed, exit_speed, cruise_speed, acceleration):
+    peak_squared = (
+        2*acceleration*length + entry_speed**2 + exit_speed**2
+    ) / 2
+    triangular = peak_squared <= cruise_speed**2
+    peak_speed = numpy.sqrt(numpy.minimum(peak_squared, cruise_speed**2))
+    ramp_time = (2*peak_speed - entry_speed - exit_speed) / acceleration
+    ramp_length = (
+        2*peak_speed**2 - entry_speed**2 - exit_speed**2
+    ) / (2*acceleration)
+    cruise_time = numpy.where(
+        triangular, 0, (length - ramp_length) / cruise_speed
+    )
+
+    return(ramp_time + numpy.maximum(cruise_time, 0))
+
+# ..............................................................................
+                                   # time of each move of a toolpath, in seconds
+def move_times(toolpath, machine_parameters=default_machine_parameters):
+    times = numpy.zeros(len(toolpath))
+    (length, start_direction, end_direction, radius) = \
+        segment_geometry(toolpath)
+    moving = numpy.flatnonzero(length > MIN_LENGTH)
+    if len(moving) == 0 :
+        return(times)
+    length = length[moving]
+    start_direction = start_direction[moving]
+    end_direction = end_direction[moving]
+    radius = radius[moving]
+                     # acceleration and cruise speed along each segment, in mm/s
+    components = numpy.maximum(
+        numpy.abs(start_direction), numpy.abs(end_direction)
+    )
+    is_arc = radius > 0
+    components[is_arc, :2] = numpy.hypot(
+        start_direction[is_arc, 0], start_direction[is_arc, 1]
+    )[:, None]
+    acceleration = directional_limit(
+        components, machine_parameters['accelerations']
+    )
+    max_rate = directional_limit(components, machine_parameters['max_rates'])
+    feed = toolpath.feed[moving]
+    if not machine_parameters['rapids_use_feed'] :
+        is_rapid = toolpath.kind[moving] == toolpath_lib.KIND_CODES['G0']
+        feed = numpy.where(is_rapid, max_rate, feed)
+    feed = numpy.where(feed > 0, feed, max_rate)
+    cruise_speed = numpy.minimum(feed, max_rate) / 60
+                        # arcs are slowed down to their centripetal acceleration
+    cruise_speed[is_arc] = numpy.minimum(
+        cruise_speed[is_arc], numpy.sqrt(acceleration[is_arc]*radius[is_arc])
+    )
+                        # junction speeds with the GRBL junction deviation model
+    cos_theta = -(end_direction[:-1]*start_direction[1:]).sum(axis=1)
+    cos_theta = numpy.clip(cos_theta, -1, 1)
+    sin_half_theta = numpy.sqrt((1 - cos_theta) / 2)
+    junction_acceleration = numpy.minimum(acceleration[:-1], acceleration[1:])
+    with numpy.errstate(divide='ignore', invalid='ignore') :
+        junction_limit = junction_acceleration \
+            * machine_parameters['junction_deviation'] \
+            * sin_half_theta / (1 - sin_half_theta)
+    junction_limit[cos_theta < -0.999999] = numpy.inf
+    junction_limit[cos_theta > 0.999999] = 0
+    node_limits = numpy.concatenate((
+        [0.0],
+        numpy.minimum(
+            junction_limit,
+            numpy.minimum(cruise_speed[:-1], cruise_speed[1:])**2
+        ),
+        [0.0]
+    ))
+                         # forward acceleration and backward deceleration passes
+    increments = 2*acceleration*length
+    forward = reachable_speeds(node_limits, increments)
+    backward = reachable_speeds(node_limits[::-1], increments[::-1])[::-1]
+    node_speeds = numpy.sqrt(numpy.maximum(
+        numpy.minimum(forward, backward), 0
+    ))
+    times[moving] = profile_times(
+        length, node_speeds[:-1], node_speeds[1:], cruise_speed, acceleration
+    )
+
+    return(times)
+
+# ==============================================================================
+                                                                      # sections
+# ..............................................................................
+                  # line numbers and texts of the comment lines of a g-code file
+def comment_sections(gcode_file_spec):
+    line_nbs = []
+    names = []
+    lines = gcode_parser.read_gcode_lines(gcode_file_spec)
+    for (line_nb, line) in enumerate(lines, 1) :
+        if line.lstrip()[:1] == b';' :
+            name = line.strip()[1:].strip().decode(errors='replace')
+            if name :
+                line_nbs.append(line_nb)
+                names.append(name)
+
+    return(line_nbs, names)
+
+# ..............................................................................
+                                       # time per comment section, in file order
+def section_times(toolpath, times, line_nbs, names):
+    section_indexes = numpy.searchsorted(
+        numpy.asarray(line_nbs, dtype=numpy.int64), toolpath.line_nb,
+        side='right'
+    )
+    totals = numpy.bincount(
+        section_indexes, weights=times, minlength=len(names)+1
+    )
+    sections = []
+    if totals[0] > 0 :
+        sections.append((0, START_SECTION, float(totals[0])))
+    for (index, (line_nb, name)) in enumerate(zip(line_nbs, names)) :
+        if totals[index+1] > 0 :
+            sections.append((line_nb, name, float(totals[index+1])))
+
+    return(sections)
+
+# ..............................................................................
+                     # estimated time of a g-code file, per section and in total
+def estimate_cycle_time(
+    gcode_file_spec, machine_parameters=default_machine_parameters,
+    use_cache=False
+):
+    toolpath = toolpath_lib.load_gcode_toolpath(gcode_file_spec, use_cache)
+    times = move_times(toolpath, machine_parameters)
+    (line_nbs, names) = comment_sections(gcode_file_spec)
+    sections = section_times(toolpath, times, line_nbs, names)
+
+    return(sections, float(times.sum()))
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+import os
+import argparse
+import peephole_lib
+
+# ==============================================================================
+# Command line interface
+#
+if __name__ == '__main__' :
+                                                             # specify arguments
+    parser = argparse.ArgumentParser(
+      description='shortens a g-code file without changing the toolpath'
+    )
+                                                                   # g-code file
+    parser.add_argument('gcodeFile')
+                                                                   # output file
+    parser.add_argument(
+        '-o', '--output',
+        help = 'optimised g-code file, "*-optimised.gcode" by default'
+    )
+                                                                     # tolerance
+    parser.add_argument(
+        '-t', '--tolerance', default=peephole_lib.DEFAULT_TOLERANCE,
+        help = 'maximal deviation of merged segments in mm'
+    )
+                                                                      # decimals
+    parser.add_argument(
+        '-d', '--decimals', default=peephole_lib.DEFAULT_DECIMALS,
+        help = 'number of decimals of the coordinates'
+    )
+                                                                      # comments
+    parser.add_argument(
+        '-c', '--strip_comments', action='store_true',
+        help = 'remove the comment lines'
+    )
+                                                                   # rapid moves
+    parser.add_argument(
+        '-r', '--rapid_feeds', action='store_true',
+        help = 'remove the feed of G0 moves, run at the maximal rates'
+    )
+                                                             # process arguments
+    parser_arguments = parser.parse_args()
+
+    gcode_file_spec = parser_arguments.gcodeFile
+    output_file_spec = parser_arguments.output
+    if not output_file_spec :
+        output_file_spec = os.path.splitext(gcode_file_spec)[0] + \
+            '-optimised.gcode'
+                                                                      # optimise
+    optimiser = peephole_lib.optimise_gcode_file(
+        gcode_file_spec, output_file_spec,
+        tolerance=float(parser_arguments.tolerance),
+        decimals=int(parser_arguments.decimals),
+        strip_comments=parser_arguments.strip_comments,
+        drop_rapid_feeds=parser_arguments.rapid_feeds
+    )
+    print(optimiser.report())
@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+import os
+import sys
+import runpy
+import argparse
+import profile_lib
+
+# ==============================================================================
+# Command line interface
+#
+if __name__ == '__main__' :
+                                                             # specify arguments
+    parser = argparse.ArgumentParser(
+      description='profiles the g-code generation of a job script'
+    )
+                                                                    # job script
+    parser.add_argument('script')
+                                                              # script arguments
+    parser.add_argument('arguments', nargs=argparse.REMAINDER)
+                                                                   # JSON output
+    parser.add_argument(
+        '-j', '--json',
+        help = 'write the counters to the specified JSON file'
+    )
+                                                             # process arguments
+    parser_arguments = parser.parse_args()
+
+    script_file_spec = os.path.abspath(parser_arguments.script)
+    sys.argv = [script_file_spec] + parser_arguments.arguments
+    sys.path.insert(0, os.path.dirname(script_file_spec))
+                                                           # run profiled script
+    profile_lib.enable()
+    try :
+        runpy.run_path(script_file_spec, run_name='__main__')
+    finally :
+        profile_lib.disable()
+                                                                 # show counters
+        print()
+        print(profile_lib.summary_table(), end='')
+        if parser_arguments.json :
+            profile_lib.dump_json(parser_arguments.json)
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+import os
+import argparse
+import cycle_time_lib
+
+# ==============================================================================
+# Constants
+#
+INDENT = 2 * ' '
+
+# ------------------------------------------------------------------------------
+                                                                     # functions
+# ..............................................................................
+                                                    # hours, minutes and seconds
+def time_string(seconds):
+    (minutes, seconds) = divmod(seconds, 60)
+    (hours, minutes) = divmod(int(minutes), 60)
+
+    return("%d:%02d:%04.1f" % (hours, minutes, seconds))
+
+# ..............................................................................
+                                       # comma-separated per-axis values X, Y, Z
+def axis_values(text):
+    values = [float(value) for value in text.split(',')]
+    if len(values) == 1 :
+        values = 3*values
+
+    return(tuple(values))
+
+# ==============================================================================
+# Command line interface
+#
+if __name__ == '__main__' :
+                                                             # specify arguments
+    parser = argparse.ArgumentParser(
+      description='estimates the machining time of a g-code file'
+    )
+                                                                   # g-code file
+    parser.add_argument('gcodeFile')
+                                                                     # max rates
+    parser.add_argument(
+        '-r', '--rates',
+        default=','.join(str(rate) for rate in
+            cycle_time_lib.default_machine_parameters['max_rates']
+        ),
+        help = 'maximal X,Y,Z rates in mm/min'
+    )
+                                                                 # accelerations
+    parser.add_argument(
+        '-a', '--accelerations',
+        default=','.join(str(acceleration) for acceleration in
+            cycle_time_lib.default_machine_parameters['accelerations']
+        ),
+        help = 'X,Y,Z accelerations in mm/s^2'
+    )
+                                                            # junction deviation
+    parser.add_argument(
+        '-j', '--junction',
+        default=cycle_time_lib.default_machine_parameters['junction_deviation'],
+        help = 'junction deviation in mm'
+    )
+                                                                   # rapid moves
+    parser.add_argument(
+        '-m', '--max_rapids', action='store_true',
+        help = 'run G0 moves at the maximal rates instead of their feed'
+    )
+                                                                # toolpath cache
+    parser.add_argument(
+        '-c', '--cache', action='store_true',
+        help = 'keep the parsed toolpath in a sidecar file'
+    )
+                                                                # verbose output
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help = 'display the time of each comment section'
+    )
+                                                             # process arguments
+    parser_arguments = parser.parse_args()
+
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    gcode_file_spec = parser_arguments.gcodeFile
+    if not os.path.exists(gcode_file_spec) :
+        gcode_file_spec = os.sep.join([script_directory, gcode_file_spec])
+    machine_parameters = dict(cycle_time_lib.default_machine_parameters)
+    machine_parameters['max_rates'] = axis_values(parser_arguments.rates)
+    machine_parameters['accelerations'] = \
+        axis_values(parser_arguments.accelerations)
+    machine_parameters['junction_deviation'] = \
+        float(parser_arguments.junction)
+    machine_parameters['rapids_use_feed'] = not parser_arguments.max_rapids
+    verbose = parser_arguments.verbose
+                                                                      # estimate
+    (sections, total_time) = cycle_time_lib.estimate_cycle_time(
+        gcode_file_spec, machine_parameters, parser_arguments.cache
+    )
+    if verbose :
+        for (line_nb, name, section_time) in sections :
+            print(INDENT + "%10s  %6d  %s" % (
+                time_string(section_time), line_nb, name
+            ))
+        print()
+    print("Total time: %s" % time_string(total_time))
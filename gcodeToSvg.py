@@ -1,8 +1,11 @@
 #!/usr/bin/python3
 import os
+import math
 import argparse
-import sys
-import re
+import shutil
+import tempfile
+import gcode_parser
+import toolpath_lib
 
 # ==============================================================================
 # Constants
@@ -11,99 +14,30 @@ inch_to_mm = 25.4
 inch_to_px = 96
 mm_to_px = inch_to_px/inch_to_mm  # ~ 3.7795
 displacement_line_width = 1
+LAYER_SPOOL_SIZE = 1024*1024
 
 INDENT = 2 * ' '
 
 # ==============================================================================
-# Command line arguments
+# Drawing parameters, overwritten by the command line arguments
 #
-                                                             # specify arguments
-parser = argparse.ArgumentParser(
-  description='creates an SVG representation a g-code file'
-)
-                                                                   # g-code file
-parser.add_argument('gcodeFile')
-                                                                    # page width
-parser.add_argument(
-    '-x', '--width', default=1000,
-    help = 'page width in mm'
-)
-                                                                   # page height
-parser.add_argument(
-    '-y', '--height', default=1000,
-    help = 'page height in mm'
-)
-                                                                # drill diameter
-parser.add_argument(
-    '-d', '--diameter', default=1/4*inch_to_mm,
-    help = 'default drill diameter in mm'
-)
-                                                               # plate thickness
-parser.add_argument(
-    '-t', '--thickness', default=20,
-    help = 'board thickness in mm'
-)
-                                                                # verbose output
-parser.add_argument(
-    '-v', '--verbose', action='store_true',
-    help = 'verbose display'
-)
-                                                             # process arguments
-parser_arguments = parser.parse_args()
-
-script_directory = os.path.dirname(os.path.realpath(__file__))
-gcode_file_spec = parser_arguments.gcodeFile
-if not os.path.isfile(gcode_file_spec) :
-    gcode_file_spec = os.sep.join([script_directory, gcode_file_spec])
-page_width = int(parser_arguments.width)
-page_height = int(parser_arguments.height)
-drill_diameter = float(parser_arguments.diameter)
-plate_thickness = float(parser_arguments.thickness)
-verbose = parser_arguments.verbose
-
-svg_file_spec = '.'.join(gcode_file_spec.split('.')[:-1]) + '.svg'
-drill_line_width = drill_diameter
+page_width = 1000
+page_height = 1000
+drill_diameter = 1/4*inch_to_mm
+plate_thickness = 20
+verbose = False
+job_nb = 1
+use_cache = False
 
 # ------------------------------------------------------------------------------
                                                                      # functions
 # ..............................................................................
-                                  # dertemine new coordinates after displacement
-def new_coordinates(code, absolute_mode,
-    old_x, old_y, old_z,
-    origin_x, origin_y, origin_z
-):
-                                                       # values if not specified
-    if absolute_mode :
-        x = old_x - origin_x
-        y = old_y - origin_y
-        z = old_z - origin_z
-    else :
-        x = 0
-        y = 0
-        z = 0
-                                              # extract coordinates if specified
-    for part in code:
-        if part[0] == 'X':
-            x = float(part[1:])
-        if part[0] == 'Y':
-            y = float(part[1:])
-        if part[0] == 'Z':
-            z = float(part[1:])
-                                                      # add corresponding offset
-    if absolute_mode:
-        x = origin_x + x
-        y = origin_y + y
-        z = origin_z + z
-    else:
-        x = old_x + x
-        y = old_y + y
-        z = old_z + z
-
-    return(x, y, z)
+                                     # color for drill depth, memoized per depth
+color_codes = {}
 
-# ..............................................................................
-                                                         # color for drill depth
 def color_code(z):
+    if z in color_codes :
+        return(color_codes[z])
     color = 'green'
     if z == 0 :
         color = 'orange'
@@ -113,40 +47,42 @@ def color_code(z):
             color = "rgb(%d, %d, %d)" % tuple(intensity*i for i in (1, 1, 1))
         else :
             color = 'black'
+    color_codes[z] = color
 
     return(color)
 
 # ..............................................................................
-                                           # add layer name in front of SVG code
-def addd_layer_name(code, z):
+                                # layer name for drill depth, memoized per depth
+layer_names = {}
+
+def layer_name(z):
+    if z in layer_names :
+        return(layer_names[z])
     layer_depth = "%06.3f" % -z
     layer_depth = layer_depth.rstrip('0')
     layer_depth = layer_depth.rstrip('.')
     if layer_depth == '-0' :
         layer_depth = '0'
+    layer_names[z] = "depth_%s" % layer_depth
 
-    code = "depth_%s %s" % (layer_depth, code)
-
-    return(code)
+    return(layer_names[z])
 
 # ..............................................................................
                                                   # SVG code for drilling a hole
-def drill_hole(x, y, z):
+def drill_hole(x, y, z, diameter):
                                                                   # build vector
     svg_code = '<circle'
     svg_code += " cx=\"%d\"" % (mm_to_px*x)
     svg_code += " cy=\"%d\"" % (mm_to_px*(page_height-y))
-    svg_code += " r=\"%.3f\"" % (mm_to_px*drill_diameter/2)
+    svg_code += " r=\"%.3f\"" % (mm_to_px*diameter/2)
     svg_code += " stroke=\"none\" fill=\"%s\"" % color_code(z)
     svg_code += ' />'
-                                                                # add layer name
-    svg_code = addd_layer_name(svg_code, z)
 
-    return(svg_code)
+    return(layer_name(z), svg_code)
 
 # ..............................................................................
                                             # SVG code for drilling displacement
-def drill_line(x1, y1, x2, y2, z):
+def drill_line(x1, y1, x2, y2, z, line_width):
                                                                   # build vector
     svg_code = '<line'
     svg_code += " x1=\"%.3f\"" % (mm_to_px*x1)
@@ -154,13 +90,72 @@ def drill_line(x1, y1, x2, y2, z):
     svg_code += " x2=\"%.3f\"" % (mm_to_px*x2)
     svg_code += " y2=\"%.3f\"" % (mm_to_px*(page_height-y2))
     svg_code += " stroke=\"%s\"" % color_code(z)
-    svg_code += " stroke-width=\"%.3f\"" % (mm_to_px*drill_line_width)
+    svg_code += " stroke-width=\"%.3f\"" % (mm_to_px*line_width)
     svg_code += " stroke-linecap=\"round\""
     svg_code += ' />'
-                                                                # add layer name
-    svg_code = addd_layer_name(svg_code, z)
 
-    return(svg_code)
+    return(layer_name(z), svg_code)
+
+# ..............................................................................
+                                                # SVG path data for a circle arc
+def arc_path_data(x1, y1, x2, y2, center_x, center_y, clockwise):
+    radius = math.hypot(x1-center_x, y1-center_y)
+    start_angle = math.atan2(y1-center_y, x1-center_x)
+    end_angle = math.atan2(y2-center_y, x2-center_x)
+              # swept angle, a full circle when the end point is the start point
+    if clockwise :
+        sweep_angle = (start_angle - end_angle) % (2*math.pi)
+        direction = -1
+    else :
+        sweep_angle = (end_angle - start_angle) % (2*math.pi)
+        direction = 1
+    if sweep_angle < 1E-9 :
+        sweep_angle = 2*math.pi
+                                        # split in pieces of at most half a turn
+    piece_nb = math.ceil(sweep_angle/math.pi - 1E-9)
+    path_data = "M %.3f %.3f" % (mm_to_px*x1, mm_to_px*(page_height-y1))
+    for index in range(1, piece_nb+1) :
+        if index < piece_nb :
+            angle = start_angle + direction*index*sweep_angle/piece_nb
+            x = center_x + radius*math.cos(angle)
+            y = center_y + radius*math.sin(angle)
+        else :
+            (x, y) = (x2, y2)
+        path_data += " A %.3f %.3f 0 0 %d %.3f %.3f" % (
+            mm_to_px*radius, mm_to_px*radius, clockwise,
+            mm_to_px*x, mm_to_px*(page_height-y)
+        )
+
+    return(path_data)
+
+# ..............................................................................
+                                            # SVG code for drilling along an arc
+def drill_arc(x1, y1, x2, y2, center_x, center_y, clockwise, z, line_width):
+                                                                  # build vector
+    svg_code = '<path'
+    svg_code += " d=\"%s\"" % arc_path_data(
+        x1, y1, x2, y2, center_x, center_y, clockwise
+    )
+    svg_code += " stroke=\"%s\" fill=\"none\"" % color_code(z)
+    svg_code += " stroke-width=\"%.3f\"" % (mm_to_px*line_width)
+    svg_code += " stroke-linecap=\"round\""
+    svg_code += ' />'
+
+    return(layer_name(z), svg_code)
+
+# ..............................................................................
+                             # SVG code for in the air displacement along an arc
+def displacement_arc(x1, y1, x2, y2, center_x, center_y, clockwise, z):
+                                                                  # build vector
+    svg_code = '<path'
+    svg_code += " d=\"%s\"" % arc_path_data(
+        x1, y1, x2, y2, center_x, center_y, clockwise
+    )
+    svg_code += " stroke=\"%s\" fill=\"none\"" % color_code(z)
+    svg_code += " stroke-width=\"%.3fmm\"" % displacement_line_width
+    svg_code += ' />'
+
+    return('displacements', svg_code)
 
 # ..............................................................................
                                           # SVG code for in the air displacement
@@ -174,150 +169,183 @@ def displacement_line(x1, y1, x2, y2, z):
     svg_code += " stroke=\"%s\"" % color_code(z)
     svg_code += " stroke-width=\"%.3fmm\"" % displacement_line_width
     svg_code += ' />'
-                                                                # add layer name
-    svg_code = 'displacements ' + svg_code
 
-    return(svg_code)
+    return('displacements', svg_code)
 
-# ------------------------------------------------------------------------------
-                                                                   # main script
-print("Reading \"%s\"" % gcode_file_spec)
-absolute_mode = True
-origin_x = 0
-origin_y = 0
-origin_z = 0
-old_x = 0
-old_y = 0
-old_z = 0
-new_x = 0
-new_y = 0
-new_z = 0
-vector_list = []
-                                                              # loop on commands
-with open(gcode_file_spec) as gcode_file:
-    for line in gcode_file:
-        code = line.rstrip().upper()
-        while ('(' in code) :
-            code = re.sub('\s*\(.*\)', '', code)
-        # print(code)
-        draw_move = False
-        if code != '' :
-            code_elements = code.split()
-            # print(code_elements[0])
-                                                                # drill diameter
-            if code_elements[0][0] == 'T' :
-                # print('T : tool')
-                drill_diameter = float(code_elements[0][1:]) # * inch_to_mm
-                drill_line_width = drill_diameter
-                                                    # set position as new origin
-            if code_elements[0] == 'G92' :
-                # print('G92 : origin')
-                (origin_x, origin_y, origin_z) = new_coordinates(
-                    code_elements[1:], absolute_mode,
-                    old_x, old_y, old_z,
-                    origin_x, origin_y, origin_z
-                )
-                                                        # absolute/relative mode
-            if code_elements[0] == 'G90' :
-                # print('G90 : absolute')
-                absolute_mode = True
-            if code_elements[0] == 'G91' :
-                # print('G91 : relative')
-                absolute_mode = False
-                                                            # find displacements
-            if code_elements[0] == 'G0' :
-                # print('G0 : move')
-                (new_x, new_y, new_z) = new_coordinates(
-                    code_elements[1:], absolute_mode,
-                    old_x, old_y, old_z,
-                    origin_x, origin_y, origin_z
-                )
-                draw_move = True
-            if code_elements[0] == 'G1' :
-                # print('G1 : move')
-                (new_x, new_y, new_z) = new_coordinates(
-                    code_elements[1:], absolute_mode,
-                    old_x, old_y, old_z,
-                    origin_x, origin_y, origin_z
-                )
-                draw_move = True
-            # print(draw_move)
-                                                            # draw displacements
-        if draw_move :
+# ..............................................................................
+                       # layer and SVG code for a move, None if nothing is drawn
+def move_vector(move):
+    diameter = drill_diameter
+    if move.tool is not None :
+        diameter = move.tool
+    is_arc = move.kind in ('G2', 'G3')
+    clockwise = (move.kind == 'G2')
                                                              # draw displacement
-            if new_z == old_z :
-                if new_z <= 0 :
-                    vector = drill_line(old_x, old_y, new_x, new_y, new_z)
-                    vector_list.append(vector)
-                else :
-                    vector = displacement_line(old_x, old_y, new_x, new_y, new_z)
-                    vector_list.append(vector)
+    if move.z2 == move.z1 :
+        if is_arc and (move.z2 <= 0) :
+            return(drill_arc(
+                move.x1, move.y1, move.x2, move.y2,
+                move.center_x, move.center_y, clockwise, move.z2, diameter
+            ))
+        elif is_arc :
+            return(displacement_arc(
+                move.x1, move.y1, move.x2, move.y2,
+                move.center_x, move.center_y, clockwise, move.z2
+            ))
+        elif move.z2 <= 0 :
+            return(drill_line(
+                move.x1, move.y1, move.x2, move.y2, move.z2, diameter
+            ))
+        else :
+            return(displacement_line(
+                move.x1, move.y1, move.x2, move.y2, move.z2
+            ))
                                                                # draw drill hole
-            else :
-                if new_z <= 0 :
-                    vector = drill_hole(new_x, new_y, new_z)
-                    vector_list.append(vector)
-                                                        # update old coordinates
-            old_x = new_x
-            old_y = new_y
-            old_z = new_z
+    elif move.z2 <= 0 :
+        return(drill_hole(move.x2, move.y2, move.z2, diameter))
+
+    return(None)
+
+# ..............................................................................
+                                   # write the SVG file from a sequence of moves
+def write_svg(moves, svg_file_spec):
+    color_codes.clear()
+                                     # bucket vectors into per-layer spool files
+    layer_files = {}
+    for move in moves :
+        vector = move_vector(move)
+        if vector is not None :
+            (layer, svg_code) = vector
+            if layer not in layer_files :
+                layer_files[layer] = tempfile.SpooledTemporaryFile(
+                    max_size=LAYER_SPOOL_SIZE, mode='w+'
+                )
+            layer_files[layer].write(2*INDENT + svg_code + "\n")
                                                                  # init SVG file
-if verbose :
-    print()
-print("Writing file \"%s\"" % svg_file_spec)
-svg_file = open(svg_file_spec, "w")
-svg_file.write("<svg\n")
-svg_file.write(
-    INDENT + "width=\"%dmm\" height=\"%dmm\"\n" % (page_width, page_height)
-)
-svg_file.write(
-    INDENT + "viewBox=\"0 0 %g %g\"\n" % (
-        page_width*mm_to_px, page_height*mm_to_px
+    if verbose :
+        print()
+    print("Writing file \"%s\"" % svg_file_spec)
+    svg_file = open(svg_file_spec, "w")
+    svg_file.write("<svg\n")
+    svg_file.write(
+        INDENT + "width=\"%dmm\" height=\"%dmm\"\n" % (page_width, page_height)
+    )
+    svg_file.write(
+        INDENT + "viewBox=\"0 0 %g %g\"\n" % (
+            page_width*mm_to_px, page_height*mm_to_px
+        )
     )
-)
-svg_file.write(">\n")
+    svg_file.write(">\n")
                                                    # set Inkscape units and grid
-svg_file.write(
-    INDENT + "<sodipodi:namedview\n" +
-    2*INDENT + "inkscape:document-units=\"cm\"\n" +
-    2*INDENT + "showgrid=\"true\"\n" +
-    INDENT + ">\n" +
-    2*INDENT + "<inkscape:grid\n" +
-    3*INDENT + "type=\"xygrid\"\n" +
-    3*INDENT + "id=\"cm\"\n" +
-    3*INDENT + "units=\"cm\"\n" +
-    3*INDENT + "spacingx=\"%g\"\n" % (10*mm_to_px) +
-    3*INDENT + "spacingy=\"%g\"\n" % (10*mm_to_px) +
-    3*INDENT + "emspacing=\"10\"\n" +
-    3*INDENT + "originx=\"0\"\n" +
-    3*INDENT + "originy=\"0\"\n" +
-    2*INDENT + "/>\n" +
-    INDENT + "</sodipodi:namedview>\n"
-)
-
-                                                              # build layer list
-layer_list = []
-for vector in vector_list :
-    layer = vector.split()[0]
-    if layer not in layer_list :
-        layer_list.append(layer)
-layer_list.sort(reverse=True)
-                                               # group and write vectors to file
-for layer in layer_list :
-    if verbose :
-        print(INDENT + layer)
-    svg_file.write(INDENT + "<g\n")
-    svg_file.write(2*INDENT + "inkscape:groupmode=\"layer\"\n")
-    svg_file.write(2*INDENT + "id=\"%s\"\n" % layer)
-    svg_file.write(2*INDENT + "inkscape:label=\"%s\"\n" %layer)
-    svg_file.write(INDENT + ">\n")
-    for vector in vector_list :
-        vector_layer = vector.split()[0]
-        if vector_layer == layer :
-            vector = vector.split(' ', 1)[1]
-#            print(2*INDENT + vector)
-            svg_file.write(2*INDENT + vector + "\n")
-    svg_file.write(INDENT + "</g>\n")
+    svg_file.write(
+        INDENT + "<sodipodi:namedview\n" +
+        2*INDENT + "inkscape:document-units=\"cm\"\n" +
+        2*INDENT + "showgrid=\"true\"\n" +
+        INDENT + ">\n" +
+        2*INDENT + "<inkscape:grid\n" +
+        3*INDENT + "type=\"xygrid\"\n" +
+        3*INDENT + "id=\"cm\"\n" +
+        3*INDENT + "units=\"cm\"\n" +
+        3*INDENT + "spacingx=\"%g\"\n" % (10*mm_to_px) +
+        3*INDENT + "spacingy=\"%g\"\n" % (10*mm_to_px) +
+        3*INDENT + "emspacing=\"10\"\n" +
+        3*INDENT + "originx=\"0\"\n" +
+        3*INDENT + "originy=\"0\"\n" +
+        2*INDENT + "/>\n" +
+        INDENT + "</sodipodi:namedview>\n"
+    )
+                                                          # write layers to file
+    for layer in sorted(layer_files, reverse=True) :
+        if verbose :
+            print(INDENT + layer)
+        svg_file.write(INDENT + "<g\n")
+        svg_file.write(2*INDENT + "inkscape:groupmode=\"layer\"\n")
+        svg_file.write(2*INDENT + "id=\"%s\"\n" % layer)
+        svg_file.write(2*INDENT + "inkscape:label=\"%s\"\n" %layer)
+        svg_file.write(INDENT + ">\n")
+        layer_file = layer_files[layer]
+        layer_file.seek(0)
+        shutil.copyfileobj(layer_file, svg_file)
+        layer_file.close()
+        svg_file.write(INDENT + "</g>\n")
                                                             # terminate SVG file
-svg_file.write("</svg>\n")
-svg_file.close()
+    svg_file.write("</svg>\n")
+    svg_file.close()
+
+# ..............................................................................
+                                                  # convert a g-code file to SVG
+def gcode_to_svg(gcode_file_spec, svg_file_spec):
+    print("Reading \"%s\"" % gcode_file_spec)
+    if use_cache :
+        moves = toolpath_lib.load_gcode_toolpath(
+            gcode_file_spec, worker_nb=job_nb
+        )
+    elif job_nb > 1 :
+        moves = gcode_parser.parse_gcode_file_parallel(gcode_file_spec, job_nb)
+    else :
+        moves = gcode_parser.parse_gcode_file(gcode_file_spec)
+    write_svg(moves, svg_file_spec)
+
+# ==============================================================================
+# Command line interface
+#
+if __name__ == '__main__' :
+                                                             # specify arguments
+    parser = argparse.ArgumentParser(
+      description='creates an SVG representation a g-code file'
+    )
+                                                                   # g-code file
+    parser.add_argument('gcodeFile')
+                                                                    # page width
+    parser.add_argument(
+        '-x', '--width', default=1000,
+        help = 'page width in mm'
+    )
+                                                                   # page height
+    parser.add_argument(
+        '-y', '--height', default=1000,
+        help = 'page height in mm'
+    )
+                                                                # drill diameter
+    parser.add_argument(
+        '-d', '--diameter', default=1/4*inch_to_mm,
+        help = 'default drill diameter in mm'
+    )
+                                                               # plate thickness
+    parser.add_argument(
+        '-t', '--thickness', default=20,
+        help = 'board thickness in mm'
+    )
+                                                              # parallel parsing
+    parser.add_argument(
+        '-j', '--jobs', default=1,
+        help = 'number of parser processes for large files'
+    )
+                                                                # toolpath cache
+    parser.add_argument(
+        '-c', '--cache', action='store_true',
+        help = 'keep the parsed toolpath in a sidecar file'
+    )
+                                                                # verbose output
+    parser.add_argument(
+        '-v', '--verbose', action='store_true',
+        help = 'verbose display'
+    )
+                                                             # process arguments
+    parser_arguments = parser.parse_args()
+
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    gcode_file_spec = parser_arguments.gcodeFile
+    if not os.path.exists(gcode_file_spec) :
+        gcode_file_spec = os.sep.join([script_directory, gcode_file_spec])
+    page_width = int(parser_arguments.width)
+    page_height = int(parser_arguments.height)
+    drill_diameter = float(parser_arguments.diameter)
+    plate_thickness = float(parser_arguments.thickness)
+    verbose = parser_arguments.verbose
+    job_nb = int(parser_arguments.jobs)
+    use_cache = parser_arguments.cache
+
+    svg_file_spec = '.'.join(gcode_file_spec.split('.')[:-1]) + '.svg'
+                                                                       # convert
+    gcode_to_svg(gcode_file_spec, svg_file_spec)
@@ -1,4 +1,7 @@
+import os
+import re
 import math
+import xml.etree.ElementTree
 
 # ==============================================================================
                                                                 # default values
@@ -10,8 +13,17 @@ default_machining_parameters = {
     'drill_diameter'           : 4,
     'fast_displacement_speed'  : 1000,
     'drill_displacement_speed' : default_drill_displacement_speed,
-    'drill_bore_speed'         : 500
+    'drill_bore_speed'         : 500,
+    'use_arcs'                 : False,
+    'pass_mode'                : 'unrolled'
 }
+                                                  # multiple passes g-code modes
+PASS_MODES = ('unrolled', 'subroutine', 'loop')
+                 # LinuxCNC o-word numbers, from FIRST_O_WORD up in each program
+FIRST_O_WORD = 100
+o_words = {'next' : FIRST_O_WORD}
+                            # svg curve flattening chord tolerance, in svg units
+default_curve_tolerance = 0.05
 
 # ==============================================================================
                                                                  # basic g-codes
@@ -100,6 +112,29 @@ def move_steady(dx=0, dy=0, dz=0, speed=0):
     else :
         return(g_code + "\n")
 
+# ..............................................................................
+                                                  # g-code for circular movement
+                               # the center is given relative to the start point
+def move_circular(
+    dx=0, dy=0, center_dx=0, center_dy=0, clockwise=False, speed=0
+):
+    if clockwise :
+        g_code = 'G2'
+    else :
+        g_code = 'G3'
+    if dx != 0 :
+        g_code += " X%.3f" % dx
+    if dy != 0 :
+        g_code += " Y%.3f" % dy
+                                       # center offsets, avoiding negative zeros
+    g_code += " I%.3f J%.3f" % (
+        round(center_dx, 3) + 0, round(center_dy, 3) + 0
+    )
+    if speed != 0 :
+        g_code += " f%g" % speed
+
+    return(g_code + "\n")
+
 # ..............................................................................
                                          # g-codes for moving back to the origin
 def move_back_to_origin(move_x=True, move_y=True, move_z=False):
@@ -132,76 +167,109 @@ def line_gcode(delta_x, delta_y, speed=default_drill_displacement_speed):
 
 # ..............................................................................
                                                                      # rectangle
-def rectangle_gcode(base, height, speed=default_drill_displacement_speed):
-    g_code = ''
+def rectangle_gcode_lines(base, height, speed=default_drill_displacement_speed):
                                                                    # drill sides
-    g_code += move_steady( base,  0     , 0, speed)
-    g_code += move_steady( 0   ,  height, 0, speed)
-    g_code += move_steady(-base,  0     , 0, speed)
-    g_code += move_steady( 0   , -height, 0, speed)
+    yield move_steady( base,  0     , 0, speed)
+    yield move_steady( 0   ,  height, 0, speed)
+    yield move_steady(-base,  0     , 0, speed)
+    yield move_steady( 0   , -height, 0, speed)
 
-    return(g_code)
+def rectangle_gcode(base, height, speed=default_drill_displacement_speed):
+    return(''.join(rectangle_gcode_lines(base, height, speed)))
 
 # ..............................................................................
                                                                         # circle
-def circle_gcode(
+def circle_gcode_lines(
     diameter, facet_nb=64, start_angle=0,
-    speed=default_drill_displacement_speed
+    speed=default_drill_displacement_speed, use_arcs=False
 ):
-    g_code = ''
-                                                                  # drill facets
     old_x = diameter/2 * math.cos(start_angle)
     old_y = diameter/2 * math.sin(start_angle)
+                                                       # single full circle move
+    if use_arcs :
+        yield move_circular(0, 0, -old_x, -old_y, False, speed)
+        return
+                                                                  # drill facets
     for index in range(1, facet_nb+1) :
         new_x = diameter/2 * math.cos(start_angle + index*2*math.pi/facet_nb)
         new_y = diameter/2 * math.sin(start_angle + index*2*math.pi/facet_nb)
-        g_code += move_steady(new_x-old_x, new_y-old_y, 0, speed)
+        yield move_steady(new_x-old_x, new_y-old_y, 0, speed)
         old_x = new_x
         old_y = new_y
 
-    return(g_code)
+def circle_gcode(
+    diameter, facet_nb=64, start_angle=0,
+    speed=default_drill_displacement_speed, use_arcs=False
+):
+    return(''.join(circle_gcode_lines(
+        diameter, facet_nb, start_angle, speed, use_arcs
+    )))
 
 # ..............................................................................
                                                                         # circle
-def circle_arc_gcode(
+def circle_arc_gcode_lines(
     radius, facet_nb=64, start_angle=0, end_angle=90,
-    speed=default_drill_displacement_speed
+    speed=default_drill_displacement_speed, use_arcs=False
 ):
-    g_code = ''
     step_angle = (end_angle - start_angle)/facet_nb
-                                                                  # drill facets
     old_x = radius * math.cos(start_angle)
     old_y = radius * math.sin(start_angle)
+                                            # full turns, then a single arc move
+    if use_arcs :
+        clockwise = end_angle < start_angle
+        full_turn_nb = int(abs(end_angle - start_angle) // (2*math.pi))
+        for index in range(full_turn_nb) :
+            yield move_circular(0, 0, -old_x, -old_y, clockwise, speed)
+        dx = round(radius*math.cos(end_angle) - old_x, 3)
+        dy = round(radius*math.sin(end_angle) - old_y, 3)
+                          # coincident end points would be read as one more turn
+        if (dx != 0) or (dy != 0) :
+            yield move_circular(dx, dy, -old_x, -old_y, clockwise, speed)
+        return
+                                                                  # drill facets
     for index in range(1, facet_nb+1) :
         new_x = radius * math.cos(start_angle + index*step_angle)
         new_y = radius * math.sin(start_angle + index*step_angle)
-        g_code += move_steady(new_x-old_x, new_y-old_y, 0, speed)
+        yield move_steady(new_x-old_x, new_y-old_y, 0, speed)
         old_x = new_x
         old_y = new_y
 
-    return(g_code)
+def circle_arc_gcode(
+    radius, facet_nb=64, start_angle=0, end_angle=90,
+    speed=default_drill_displacement_speed, use_arcs=False
+):
+    return(''.join(circle_arc_gcode_lines(
+        radius, facet_nb, start_angle, end_angle, speed, use_arcs
+    )))
 
 # ..............................................................................
                                                                        # polygon
-def polygon_gcode(
+def polygon_gcode_lines(
     polygon, close_shape=True,
-    speed=default_drill_displacement_speed
+    speed=default_drill_displacement_speed, tolerance=0
 ):
-    g_code = ''
+                                  # drop the points within tolerance of the path
+    if tolerance > 0 :
+        polygon = simplify_polygon(
+            [[0, 0]] + [list(point) for point in polygon],
+            tolerance, close_shape
+        )[1:]
                                                                    # drill lines
     old_x = 0
     old_y = 0
-    for index in range(len(polygon)) :
-        new_x = polygon[index][0]
-        new_y = polygon[index][1]
-        g_code += move_steady(new_x-old_x, new_y-old_y, 0, speed)
+    for [new_x, new_y] in polygon :
+        yield move_steady(new_x-old_x, new_y-old_y, 0, speed)
         old_x = new_x
         old_y = new_y
                                                                  # close polygon
     if close_shape:
-        g_code += move_steady(-old_x, -old_y, 0, speed)
+        yield move_steady(-old_x, -old_y, 0, speed)
 
-    return(g_code)
+def polygon_gcode(
+    polygon, close_shape=True,
+    speed=default_drill_displacement_speed, tolerance=0
+):
+    return(''.join(polygon_gcode_lines(polygon, close_shape, speed, tolerance)))
 
 # ==============================================================================
                                                        # polygons and transforms
@@ -230,101 +298,337 @@ def build_regular_polygon(diameter, facet_nb=64):
     return coordinates
 
 # ..............................................................................
-                                                         # polygon from svg file
-def import_polygon(file_specification, polygon_id, close_path=False):
-                                          # initial coordinate for relative mode
-    coordinates = [[0, 0]]
-                                                                     # read file
-    svg_file = open(file_specification, 'r')
-    svg_data = svg_file.read()
-    svg_file.close()
-                                                          # remove all line ends
-    svg_data = svg_data.replace("\n", '')
-                                                        # remove multiple spaces
-    svg_data = ' '.join(svg_data.split())
-                                                     # separate paths into lines
-    replacements = {'<path ': "\n<path ", '/>': "/>\n"}
-    for (source, replacement) in replacements.items() :
-        svg_data = svg_data.replace(source, replacement)
-                                                            # find selected path
-    polygon_path = ''
-    for path in svg_data.split("\n") :
-        if path.startswith('<path ') :
-            if (" id=\"%s\" " % polygon_id) in path :
-                polygon_path = path
-                                                         # keep only coordinates
-    if polygon_path :
-        polygon_path = polygon_path[polygon_path.find(' d="')+4 :]
-        polygon_path = polygon_path[: polygon_path.find('"')]
-                                                      # loop through description
-        mode = ''
-        command = ''
-        for data in polygon_path.split(' ') :
-            coordinate = ''
-            if len(data) == 1 :
-                command = ''
-                if data == 'm' :
-                    command = 'move to'
-                    mode = 'relative'
-                if data == 'M' :
-                    command = 'move to'
-                    mode = 'absolute'
-                elif data == 'l' :
-                    command = 'line to'
-                    mode = 'relative'
-                elif data == 'L' :
-                    command = 'line to'
-                    mode = 'absolute'
-                elif data == 'h' :
-                    command = 'horizontal line to'
-                    mode = 'relative'
-                elif data == 'H' :
-                    command = 'horizontal line to'
-                    mode = 'absolute'
-                elif data == 'v' :
-                    command = 'vertical line to'
-                    mode = 'relative'
-                elif data == 'V' :
-                    command = 'vertical line to'
-                    mode = 'absolute'
-                elif (data == 'Z') or (data == 'z') :
-                    command = 'close path'
+       # id to path data index of an svg file, cached per file modification time
+svg_path_indexes = {}
+
+def svg_path_index(file_specification):
+    file_specification = os.path.abspath(file_specification)
+    modification_time = os.stat(file_specification).st_mtime_ns
+    cached = svg_path_indexes.get(file_specification)
+    if cached and (cached[0] == modification_time) :
+        return(cached[1])
+                           # stream through the elements, keeping only the paths
+    path_index = {}
+    for (event, element) in xml.etree.ElementTree.iterparse(
+        file_specification, events=('end',)
+    ) :
+        if element.tag.rsplit('}', 1)[-1] == 'path' :
+            path_id = element.get('id')
+            if path_id is not None :
+                path_index[path_id] = ' '.join(element.get('d', '').split())
+        element.clear()
+    svg_path_indexes[file_specification] = (modification_time, path_index)
+
+    return(path_index)
+
+# ..............................................................................
+         # svg path data commands, with implicit repeated commands made explicit
+PATH_TOKEN_PATTERN = re.compile(
+    r'[MmLlHhVvCcSsQqTtAaZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+)
+PATH_ARGUMENT_NBS = {
+    'M' : 2, 'L' : 2, 'H' : 1, 'V' : 1, 'C' : 6, 'S' : 4, 'Q' : 4, 'T' : 2,
+    'A' : 7, 'Z' : 0
+}
+ARC_FLAG_INDEXES = (3, 4)
+
+def path_data_commands(path_data):
+    tokens = PATH_TOKEN_PATTERN.findall(path_data)
+    tokens.reverse()
+    command = ''
+    while tokens :
+        if tokens[-1].isalpha() :
+            command = tokens.pop()
+        elif not command :
+            tokens.pop()
+            continue
+        argument_nb = PATH_ARGUMENT_NBS[command.upper()]
+        arguments = []
+        while (len(arguments) < argument_nb) and tokens :
+            token = tokens.pop()
+            if token.isalpha() :
+                tokens.append(token)
+                break
+                 # arc flags may be packed with the next number: "a 1 1 0 011 1"
+            if (command in 'Aa') and (len(arguments) in ARC_FLAG_INDEXES) :
+                if len(token) > 1 :
+                    tokens.append(token[1:])
+                    token = token[0]
+            arguments.append(float(token))
+        if len(arguments) < argument_nb :
+            break
+        yield (command, arguments)
+                                        # pairs following a move to are line tos
+        if command in 'Mm' :
+            command = {'M' : 'L', 'm' : 'l'}[command]
+        elif command in 'Zz' :
+            command = ''
+
+# ..............................................................................
+                 # number of segments keeping a curve within the chord tolerance
+#
+# A curve of parameter t with a second derivative bounded by M deviates
+# from its chords of parameter length 1/n by at most M/(8*n^2).
+#
+def curve_segment_nb(second_derivative_bound, tolerance):
+    segment_nb = math.sqrt(second_derivative_bound / (8*tolerance))
+
+    return(max(1, math.ceil(segment_nb)))
+
+# ..............................................................................
+          # quadratic and cubic Bezier curves as polylines, start point excluded
+def flatten_quadratic(start, control, end, tolerance):
+    bound = 2*math.hypot(
+        start[0] - 2*control[0] + end[0], start[1] - 2*control[1] + end[1]
+    )
+    segment_nb = curve_segment_nb(bound, tolerance)
+    points = []
+    for index in range(1, segment_nb+1) :
+        t = index/segment_nb
+        (a, b, c) = ((1-t)**2, 2*(1-t)*t, t**2)
+        points.append([
+            a*start[0] + b*control[0] + c*end[0],
+            a*start[1] + b*control[1] + c*end[1]
+        ])
+    points[-1] = list(end)
+
+    return(points)
+
+def flatten_cubic(start, control1, control2, end, tolerance):
+    bound = 6*max(
+        math.hypot(
+            start[0] - 2*control1[0] + control2[0],
+            start[1] - 2*control1[1] + control2[1]
+        ),
+        math.hypot(
+            control1[0] - 2*control2[0] + end[0],
+            control1[1] - 2*control2[1] + end[1]
+        )
+    )
+    segment_nb = curve_segment_nb(bound, tolerance)
+    points = []
+    for index in range(1, segment_nb+1) :
+        t = index/segment_nb
+        (a, b, c, d) = ((1-t)**3, 3*(1-t)**2*t, 3*(1-t)*t**2, t**3)
+        points.append([
+            a*start[0] + b*control1[0] + c*control2[0] + d*end[0],
+            a*start[1] + b*control1[1] + c*control2[1] + d*end[1]
+        ])
+    points[-1] = list(end)
+
+    return(points)
+
+# ..............................................................................
+                        # svg elliptical arc as a polyline, start point excluded
+#
+# The endpoint parametrization is converted to a center one as described in
+# the SVG implementation notes, section "Elliptical arc implementation".
+#
+def flatten_elliptical_arc(
+    start, radius_x, radius_y, rotation, large_arc, sweep, end, tolerance
+):
+    (radius_x, radius_y) = (abs(radius_x), abs(radius_y))
+    if (radius_x == 0) or (radius_y == 0) or (list(start) == list(end)) :
+        return([list(end)])
+    (cosine, sine) = (
+        math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+    )
+                 # start point in the ellipse axes, relative to the chord middle
+    half_dx = (start[0] - end[0])/2
+    half_dy = (start[1] - end[1])/2
+    x1 =  cosine*half_dx + sine*half_dy
+    y1 = -sine*half_dx + cosine*half_dy
+                            # scale radii up when the end point can't be reached
+    scale = (x1/radius_x)**2 + (y1/radius_y)**2
+    if scale > 1 :
+        radius_x *= math.sqrt(scale)
+        radius_y *= math.sqrt(scale)
+                                                                        # center
+    numerator = (radius_x*radius_y)**2 - (radius_x*y1)**2 - (radius_y*x1)**2
+    denominator = (radius_x*y1)**2 + (radius_y*x1)**2
+    factor = math.sqrt(max(0, numerator/denominator))
+    if bool(large_arc) == bool(sweep) :
+        factor = -factor
+    center_x1 =  factor*radius_x*y1/radius_y
+    center_y1 = -factor*radius_y*x1/radius_x
+    center_x = cosine*center_x1 - sine*center_y1 + (start[0] + end[0])/2
+    center_y = sine*center_x1 + cosine*center_y1 + (start[1] + end[1])/2
+                                                        # start and swept angles
+    start_angle = math.atan2(
+        (y1 - center_y1)/radius_y, (x1 - center_x1)/radius_x
+    )
+    end_angle = math.atan2(
+        (-y1 - center_y1)/radius_y, (-x1 - center_x1)/radius_x
+    )
+    sweep_angle = (end_angle - start_angle) % (2*math.pi)
+    if not sweep :
+        sweep_angle -= 2*math.pi
+                            # facets from the chord sagitta of the larger radius
+    radius = max(radius_x, radius_y)
+    facet_angle = 2*math.acos(max(-1, 1 - tolerance/radius))
+    segment_nb = max(1, math.ceil(abs(sweep_angle)/facet_angle))
+    points = []
+    for index in range(1, segment_nb+1) :
+        angle = start_angle + sweep_angle*index/segment_nb
+        x = radius_x*math.cos(angle)
+        y = radius_y*math.sin(angle)
+        points.append([
+            center_x + cosine*x - sine*y, center_y + sine*x + cosine*y
+        ])
+    points[-1] = list(end)
+
+    return(points)
+
+# ..............................................................................
+                                                    # polygon from svg path data
+#
+# Lines are kept as they are, curves are flattened so that the polygon
+# stays within tolerance of them.
+#
+def path_data_polygon(
+    polygon_path, close_path=False, tolerance=default_curve_tolerance
+):
+    coordinates = []
+    (x, y) = (0, 0)
+    subpath_start = [0, 0]
+    control = None
+    command = ''
+    for (command, arguments) in path_data_commands(polygon_path) :
+        upper_command = command.upper()
+                         # relative coordinates are given from the current point
+        (base_x, base_y) = (0, 0)
+        if command.islower() :
+            (base_x, base_y) = (x, y)
+        points = [
+            [base_x + arguments[index], base_y + arguments[index+1]]
+                for index in range(0, len(arguments)-1, 2)
+        ]
+        previous_control = control
+        control = None
+                                                                # straight lines
+        if upper_command == 'M' :
+            new_points = points
+            subpath_start = points[0]
+        elif upper_command == 'L' :
+            new_points = points
+        elif upper_command == 'H' :
+            new_points = [[base_x + arguments[0], y]]
+        elif upper_command == 'V' :
+            new_points = [[x, base_y + arguments[0]]]
+        elif upper_command == 'Z' :
+            new_points = []
+            (x, y) = subpath_start
+          # Bezier curves, the smooth ones reflecting the previous control point
+        elif upper_command in 'CS' :
+            if upper_command == 'C' :
+                (control1, control2, end) = points
+            else :
+                (control2, end) = points
+                control1 = [x, y]
+                if previous_control and (previous_control[0] in 'CS') :
+                    control1 = [
+                        2*x - previous_control[1][0],
+                        2*y - previous_control[1][1]
+                    ]
+            new_points = flatten_cubic(
+                [x, y], control1, control2, end, tolerance
+            )
+            control = (upper_command, control2)
+        elif upper_command in 'QT' :
+            if upper_command == 'Q' :
+                (control1, end) = points
             else :
-                previous_x_coordinate = coordinates[-1][0]
-                previous_y_coordinate = coordinates[-1][1]
-                if (command == 'move to') or (command == 'line to') :
-                    coordinate = data.split(',')
-                    x_coordinate = float(coordinate[0])
-                    y_coordinate = float(coordinate[1])
-                    if mode == 'relative' :
-                        x_coordinate = previous_x_coordinate + x_coordinate
-                        y_coordinate = previous_y_coordinate + y_coordinate
-                    coordinate = [x_coordinate, y_coordinate]
-                elif command == 'horizontal line to' :
-                    x_coordinate = float(data)
-                    y_coordinate = previous_y_coordinate
-                    if mode == 'relative' :
-                        x_coordinate = previous_x_coordinate + x_coordinate
-                    coordinate = [x_coordinate, y_coordinate]
-                elif command == 'vertical line to' :
-                    x_coordinate = previous_x_coordinate
-                    y_coordinate = float(data)
-                    if mode == 'relative' :
-                        y_coordinate = previous_y_coordinate + y_coordinate
-                    coordinate = [x_coordinate, y_coordinate]
-            if coordinate :
-                coordinates.append([x_coordinate, y_coordinate])
+                end = points[0]
+                control1 = [x, y]
+                if previous_control and (previous_control[0] in 'QT') :
+                    control1 = [
+                        2*x - previous_control[1][0],
+                        2*y - previous_control[1][1]
+                    ]
+            new_points = flatten_quadratic([x, y], control1, end, tolerance)
+            control = (upper_command, control1)
+                                                               # elliptical arcs
+        elif upper_command == 'A' :
+            new_points = flatten_elliptical_arc(
+                [x, y], arguments[0], arguments[1], arguments[2],
+                arguments[3], arguments[4],
+                [base_x + arguments[5], base_y + arguments[6]],
+                tolerance
+            )
+        coordinates += new_points
+        if new_points :
+            (x, y) = new_points[-1]
                                                                  # close polygon
-        if (command == 'close path') and close_path :
-            coordinates.append(coordinates[1])
-                                               # remove first (dummy) coordinate
-    coordinates = coordinates[1:]
+    if (command in 'Zz') and command and close_path and coordinates :
+        coordinates.append(list(coordinates[0]))
 
     return(coordinates)
 
+# ..............................................................................
+                                                         # polygon from svg file
+def import_polygon(
+    file_specification, polygon_id, close_path=False,
+    tolerance=default_curve_tolerance
+):
+    polygon_path = svg_path_index(file_specification).get(polygon_id, '')
+
+    return(path_data_polygon(polygon_path, close_path, tolerance))
+
+# ..............................................................................
+                       # polygons from svg file, the file being parsed only once
+def import_polygons(
+    file_specification, polygon_ids, close_path=False,
+    tolerance=default_curve_tolerance
+):
+    path_index = svg_path_index(file_specification)
+
+    return({
+        polygon_id : path_data_polygon(
+            path_index.get(polygon_id, ''), close_path, tolerance
+        )
+            for polygon_id in polygon_ids
+    })
+
+# ..............................................................................
+                    # polygon without the points within tolerance of its outline
+#
+# Ramer-Douglas-Peucker simplification from polygon_lib, which needs NumPy.
+# Closed polygons are also simplified around their closing segment.
+#
+def simplify_polygon(polygon, tolerance, closed=False):
+    import polygon_lib
+                                                          # array-backed polygon
+    if hasattr(polygon, 'simplify') :
+        return(polygon.simplify(tolerance, closed))
+
+    return(polygon_lib.simplify_points(polygon, tolerance, closed).tolist())
+
+# ..............................................................................
+                         # points reordered for a shorter travel from the origin
+#
+# Nearest neighbour tour improved by 2-opt and Or-opt moves from route_lib,
+# which needs NumPy. Also returns the travel lengths of the original and
+# new orders.
+#
+def optimise_travel(points, start=(0, 0), return_order=False):
+    import route_lib
+    (order, original_travel, travel) = route_lib.optimise_order(points, start)
+    if return_order :
+        return(order, original_travel, travel)
+
+    return([list(points[index]) for index in order], original_travel, travel)
+
+# ..............................................................................
+                                     # comment on the travel saved by reordering
+def travel_comment(original_travel, travel):
+    return("; travel %.1f mm instead of %.1f mm\n" % (travel, original_travel))
+
 # ..............................................................................
                                           # min and max coordinates of a polygon
 def min_max(polygon):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'min_max') :
+        return(polygon.min_max())
     x_min = polygon[0][0]
     y_min = polygon[0][1]
     x_max = x_min
@@ -342,6 +646,9 @@ def min_max(polygon):
 # ..............................................................................
                      # extract first coordinate of a polygon and offset the rest
 def extract_offset(polygon, close_shape=True):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'extract_offset') :
+        return(polygon.extract_offset(close_shape))
                                                   # offsets are first coordinate
     [x_offset, y_offset] = polygon[0]
     extracted_polygon = []
@@ -361,6 +668,9 @@ def extract_offset(polygon, close_shape=True):
 # ..............................................................................
                                      # flip polygon vertically around the x-axis
 def flip_vertical(polygon):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'flip_vertical') :
+        return(polygon.flip_vertical())
     coordinates = []
 
     for coordinate in polygon :
@@ -373,6 +683,9 @@ def flip_vertical(polygon):
 # ..............................................................................
                                    # flip polygon horizontally around the y-axis
 def flip_horizontal(polygon):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'flip_horizontal') :
+        return(polygon.flip_horizontal())
     coordinates = []
 
     for coordinate in polygon :
@@ -385,6 +698,9 @@ def flip_horizontal(polygon):
 # ..............................................................................
                                            # offset polygon by a constant vector
 def offset_polygon(polygon, delta_x, delta_y):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'offset') :
+        return(polygon.offset(delta_x, delta_y))
     coordinates = []
 
     for coordinate in polygon :
@@ -397,6 +713,9 @@ def offset_polygon(polygon, delta_x, delta_y):
 # ..............................................................................
                                                   # scale polygon by x-y factors
 def scale_polygon(polygon, scale_x, scale_y=0):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'scale') :
+        return(polygon.scale(scale_x, scale_y))
     coordinates = []
     scale_y_effective = scale_y
     if scale_y == 0 :
@@ -412,6 +731,9 @@ def scale_polygon(polygon, scale_x, scale_y=0):
 # ..............................................................................
                                        # rotate polygon around coordinate [0, 0]
 def rotate_polygon(polygon, angle):
+                                                          # array-backed polygon
+    if hasattr(polygon, 'rotate') :
+        return(polygon.rotate(angle))
     coordinates = []
 
     for coordinate in polygon :
@@ -425,87 +747,54 @@ def rotate_polygon(polygon, angle):
 
 # ..............................................................................
                                            # expand polygon by a specified width
-     # https://stackoverflow.com/questions/3749678/expand-fill-of-convex-polygon
-def expand_polygon(polygon, distance):
-    coordinates = []
+#
+# The points are moved to the right of the edges, which is outwards for a
+# counterclockwise polygon, with mitered corners or with arc corners within
+# a tolerance. The loops made by concave parts are removed by offset_lib,
+# which needs NumPy, and the main outline is returned.
+#
+def expand_polygon(
+    polygon, distance, tolerance=0, join='miter',
+    arc_tolerance=default_curve_tolerance
+):
+    import offset_lib
+    if tolerance > 0 :
+        polygon = simplify_polygon(polygon, tolerance, closed=True)
 
-    for index in range(len(polygon)) :
-                                    # find previous, actual and next coordinates
-        if index > 0 :
-            x1 = polygon[index-1][0]
-            y1 = polygon[index-1][1]
-        else :
-            x1 = polygon[-1][0]
-            y1 = polygon[-1][1]
-        x = polygon[index][0]
-        y = polygon[index][1]
-        if index < len(polygon)-1 :
-            x2 = polygon[index+1][0]
-            y2 = polygon[index+1][1]
-        else :
-            x2 = polygon[0][0]
-            y2 = polygon[0][1]
-                                                   # calculate parallel vector 1
-        amplitude1 = math.sqrt((x-x1)**2 + (y-y1)**2)
-        dx1 =  (y-y1)/amplitude1 * distance
-        dy1 = -(x-x1)/amplitude1 * distance
-        x1_p = x1 + dx1
-        y1_p = y1 + dy1
-        x_p1 = x + dx1
-        y_p1 = y + dy1
-                                                   # calculate parallel vector 2
-        amplitude2 = math.sqrt((x2-x)**2 + (y2-y)**2)
-        dx2 =  (y2-y)/amplitude2 * distance
-        dy2 = -(x2-x)/amplitude2 * distance
-        x_p2 = x + dx2
-        y_p2 = y + dy2
-        x2_p = x2 + dx2
-        y2_p = y2 + dy2
-                                                  # calculate lines intersection
-        if x_p1 == x1_p :    # first line vertical
-            b1 = x_p1
-            a2 = (y_p2 - y2_p) / (x_p2 - x2_p)
-            b2 = y_p2 - a2*x_p2
-            x_intersection = b1
-            y_intersection = a2*b1 + b2
-        elif x_p2 == x2_p :    # second line vertical
-            a1 = (y_p1 - y1_p) / (x_p1 - x1_p)
-            b1 = y_p1 - a1*x_p1
-            b2 = x_p2
-            x_intersection = b2
-            y_intersection = a1*b2 + b1
-        else :
-            a1 = (y_p1 - y1_p) / (x_p1 - x1_p)
-            b1 = y_p1 - a1*x_p1
-            a2 = (y_p2 - y2_p) / (x_p2 - x2_p)
-            b2 = y_p2 - a2*x_p2
-            x_intersection = (b2 - b1) / (a1 - a2)
-            y_intersection = (a2*b1 - a1*b2) / (a2 - a1)
-                                                                # append to list
-        coordinates.append([x_intersection, y_intersection])
+    return(offset_lib.offset_ring(polygon, distance, join, arc_tolerance))
 
-    return coordinates
+# ..............................................................................
+                                    # expand a region made of outlines and holes
+#
+# Outlines run counterclockwise and holes clockwise. A negative distance
+# shrinks the region. The result is a list of outlines and holes.
+#
+def expand_polygons(
+    polygons, distance, join='miter', arc_tolerance=default_curve_tolerance
+):
+    import offset_lib
+
+    return(offset_lib.offset_rings(polygons, distance, join, arc_tolerance))
 
 # ..............................................................................
                                  # find hole set for compensating drill diameter
-def find_hole_set(polygon, start_angle=0):
+#
+# The holes are placed at the corners turning right by more than
+# start_angle. With a distance, these are the corners of the polygon
+# expanded by that distance, as when following it with the drill center.
+#
+def find_hole_set(polygon, start_angle=0, distance=0):
+    import offset_lib
+    if distance != 0 :
+        polygon = expand_polygon(polygon, distance)
+    else :
+        polygon = offset_lib.clean_ring(polygon)
     holes = []
 
     for index in range(len(polygon)) :
-        if index > 0 :
-            x_p = polygon[index-1][0]
-            y_p = polygon[index-1][1]
-        else :
-            x_p = polygon[-1][0]
-            y_p = polygon[-1][1]
-        x = polygon[index][0]
-        y = polygon[index][1]
-        if index < len(polygon)-1 :
-            x_n = polygon[index+1][0]
-            y_n = polygon[index+1][1]
-        else :
-            x_n = polygon[0][0]
-            y_n = polygon[0][1]
+        (x_p, y_p) = polygon[index-1]
+        (x, y) = polygon[index]
+        (x_n, y_n) = polygon[(index+1) % len(polygon)]
         angle_p = math.atan2(y-y_p, x-x_p)
         angle_n = math.atan2(y_n-y, x_n-x)
         turn_angle = angle_n - angle_p
@@ -513,9 +802,7 @@ def find_hole_set(polygon, start_angle=0):
             turn_angle = turn_angle - 2*math.pi
         if turn_angle < -math.pi :
             turn_angle = turn_angle + 2*math.pi
-        #print(turn_angle*180/math.pi)
         if turn_angle < start_angle :
-            #print("%g => [%g, %g]" % (turn_angle*180/math.pi, x, y))
             holes.append([x, y])
 
     return holes
@@ -529,85 +816,58 @@ def are_in_row(x1, x, x2):
 
     return x_is_between
 
+# ..............................................................................
+                                # polygon prepared for many intersection queries
+#
+# The edges are indexed in a grid by polygon_lib, which needs NumPy. A
+# closed polygon also has an edge from its last point back to the first
+# one, and the holes are closed rings.
+#
+def prepare_polygon(polygon, holes=(), closed=False):
+    import polygon_lib
+
+    return(polygon_lib.PreparedPolygon(polygon, holes, closed))
+
 # ..............................................................................
                                  # find intersection between segment and polygon
+#
+# Returns the crossing points and the indexes of the crossed edges, in
+# edge order. The polygon can be prepared once for repeated queries.
+#
 def segment_polygon_intersection(segment, polygon):
-    coordinates = []
-    intersections = []
-                                                           # segment coordinates
-    [x1, y1] = segment[0]
-    [x2, y2] = segment[1]
-                                              # special case of vertical segment
-    if x1 == x2 :
-#        print("x1 = x2 = %g" % x1)
-        for index in range(len(polygon)-1) :
-            [x_a, y_a] = polygon[index]
-            [x_b, y_b] = polygon[index+1]
-#            print([x_a, y_a])
-            if are_in_row(x_a, x1, x_b) :
-                a = (y_b-y_a) / (x_b-x_a)
-                b = y_a - a*x_a
-                x_i = x1
-                y_i = a*x_i + b
-                if are_in_row(y1, y_i, y2) :
-                    coordinates.append([x_i, y_i])
-                    intersections.append(index)
-                                            # special case of horizontal segment
-# not tested yet
-    elif y1 == y2 :
-#        print("y1 = y2 = %g" % y1)
-        for index in range(len(polygon)-1) :
-            [x_a, y_a] = polygon[index]
-            [x_b, y_b] = polygon[index+1]
-#            print([x_a, y_a])
-            if are_in_row(y_a, y1, y_b) :
-                           # very special case of a horizontal-vertical crossing
-                if x_a == x_b :
-                    x_i = x_a
-                    y_i = y1
-                                 # horizontal segment crossing non-infinite sope
-                else :
-                    a = (y_b-y_a) / (x_b-x_a)
-                    b = y_a - a*x_a
-                    y_i = y1
-                    x_i = (y_i - b) / a
-                if are_in_row(y1, y_i, y2) :
-                    coordinates.append([x_i, y_i])
-                    intersections.append(index)
-                                   # segment with non-zero and non-infinite sope
-    else :
-        for index in range(len(polygon)-1) :
-            [x_a, y_a] = polygon[index]
-            [x_b, y_b] = polygon[index+1]
-                                      # special case of vertical polygon segment
-# not tested yet
-            if (x_a == x_b) and (x1 == x_a) :
-                coordinates.append([x1, y1])
-                intersections.append(index)
-                                                                  # generic case
-            else :
-                a_s = (y2-y1) / (x2-x1)
-                b_s = y1 - a_s*x1
-                y_a1 = a_s*x_a + b_s
-                y_b1 = a_s*x_b + b_s
-                if                                          \
-                    ( (y_a1 < y_a) and (y_b1 > y_b) ) or    \
-                    ( (y_a1 > y_a) and (y_b1 < y_b) )       \
-                :
-                    a = (y_b-y_a) / (x_b-x_a)
-                    b = y_a - a*x_a
-                    x_i = (b_s-b) / (a-a_s)
-                    y_i = a*x_i + b
-                    if are_in_row(y_a, y_i, y_b) :
-                        coordinates.append([x_i, y_i])
-                        intersections.append(index)
+    if not hasattr(polygon, 'intersections') :
+        polygon = prepare_polygon(polygon)
+    (indexes, edges, t, x, y) = polygon.intersections([segment])
+    order = edges.argsort(kind='stable')
+    coordinates = [
+        [x_i, y_i] for (x_i, y_i) in zip(x[order].tolist(), y[order].tolist())
+    ]
+    intersections = edges[order].tolist()
 
     return(coordinates, intersections)
 
 # ==============================================================================
                                                                # drill sequences
+# ..............................................................................
+                                 # o-word numbering restarted, for a new program
+def restart_o_words(first=FIRST_O_WORD):
+    o_words['next'] = first
+
+# ..............................................................................
+                                        # next free o-word number of the program
+def next_o_word():
+    number = o_words['next']
+    o_words['next'] += 1
+
+    return(number)
+
 # ..............................................................................
                                                 # g-code for initial positioning
+#
+# The initialization starts a new program: the o-word numbers of the
+# multiple passes subroutines and loops restart from FIRST_O_WORD, so that
+# a script generates the same g-code whatever it has generated before.
+#
 def go_to_start(
     start_x=0, start_y=0,
     machining_parameters=default_machining_parameters,
@@ -616,6 +876,7 @@ def go_to_start(
     displacement_height      = machining_parameters['displacement_height']
     fast_displacement_speed  = machining_parameters['fast_displacement_speed']
     drill_displacement_speed = machining_parameters['drill_displacement_speed']
+    restart_o_words()
 
     g_code = ";\n; initialization\n;\n"
     if machine == 'X_Carve' :
@@ -633,9 +894,22 @@ def go_to_start(
 
     return(g_code)
 
+# ..............................................................................
+                                                       # repeatable drill g-code
+def drill_gcode_pass(drill_g_code):
+                                                                  # plain string
+    if isinstance(drill_g_code, str) :
+        yield drill_g_code
+                                # line generator function, called for every pass
+    elif callable(drill_g_code) :
+        yield from drill_g_code()
+                                                             # sequence of lines
+    else :
+        yield from drill_g_code
+
 # ..............................................................................
                                                           # build drill sequence
-def build_drawing_element(
+def build_drawing_element_lines(
     drill_g_code,
     start_x=0, start_y=0,
     machining_parameters=default_machining_parameters,
@@ -647,78 +921,169 @@ def build_drawing_element(
     drill_diameter          = machining_parameters['drill_diameter']
     fast_displacement_speed = machining_parameters['fast_displacement_speed']
     drill_bore_speed        = machining_parameters['drill_bore_speed']
-    g_code = ''
+    pass_mode = machining_parameters.get('pass_mode', 'unrolled')
+    if pass_mode not in PASS_MODES :
+        raise ValueError("unknown pass mode \"%s\"" % pass_mode)
+                          # a one-shot iterator can only be replayed from memory
+    if (pass_mode == 'unrolled') and not isinstance(drill_g_code, str) :
+        if (not callable(drill_g_code)) and \
+            (iter(drill_g_code) is drill_g_code) \
+        :
+            drill_g_code = list(drill_g_code)
                                                                    # add comment
     if comment != '' :
-        g_code += '; ' + comment + "\n"
+        yield '; ' + comment + "\n"
                                                              # select tool width
     if drill_diameter > 0 :
-        g_code += select_tool(drill_diameter)
+        yield select_tool(drill_diameter)
                                                                 # move to origin
     if (start_x != 0) or (start_y != 0) :
-        g_code += move_fast(start_x, start_y, 0, fast_displacement_speed)
-                                                                   # single pass 
+        yield move_fast(start_x, start_y, 0, fast_displacement_speed)
+                                                                   # single pass
     if pass_depth == 0 :
-        g_code += move_steady(
+        yield move_steady(
             0, 0, -displacement_height-drill_depth, drill_bore_speed
         )
-        g_code += drill_g_code
-                                                         # multiple passes drill
-    else :
-        g_code += move_steady(0, 0, -displacement_height, drill_bore_speed)
+        yield from drill_gcode_pass(drill_g_code)
+                                               # multiple passes drill, unrolled
+    elif pass_mode == 'unrolled' :
+        yield move_steady(0, 0, -displacement_height, drill_bore_speed)
         pass_nb = math.ceil(drill_depth/pass_depth)
         for index in range(pass_nb-1) :
-            g_code += move_steady(0, 0, -pass_depth, drill_bore_speed)
-            g_code += drill_g_code
+            yield move_steady(0, 0, -pass_depth, drill_bore_speed)
+            yield from drill_gcode_pass(drill_g_code)
         remaining_depth = drill_depth - (pass_nb-1)*pass_depth
-        g_code += move_steady(0, 0, -remaining_depth, drill_bore_speed)
-        g_code += drill_g_code
+        yield move_steady(0, 0, -remaining_depth, drill_bore_speed)
+        yield from drill_gcode_pass(drill_g_code)
+                          # multiple passes drill, calling a LinuxCNC subroutine
+    else :
+        subroutine = next_o_word()
+        yield "o%d sub\n" % subroutine
+        yield from drill_gcode_pass(drill_g_code)
+        yield "o%d endsub\n" % subroutine
+        yield move_steady(0, 0, -displacement_height, drill_bore_speed)
+        pass_nb = math.ceil(drill_depth/pass_depth)
+        if (pass_mode == 'loop') and (pass_nb > 1) :
+            loop = next_o_word()
+            yield "o%d repeat [%d]\n" % (loop, pass_nb-1)
+            yield move_steady(0, 0, -pass_depth, drill_bore_speed)
+            yield "o%d call\n" % subroutine
+            yield "o%d endrepeat\n" % loop
+        elif pass_mode == 'subroutine' :
+            for index in range(pass_nb-1) :
+                yield move_steady(0, 0, -pass_depth, drill_bore_speed)
+                yield "o%d call\n" % subroutine
+        remaining_depth = drill_depth - (pass_nb-1)*pass_depth
+        yield move_steady(0, 0, -remaining_depth, drill_bore_speed)
+        yield "o%d call\n" % subroutine
                                                 # back up to displacement height
-    g_code += move_fast(
+    yield move_fast(
         0, 0, drill_depth+displacement_height, fast_displacement_speed
     )
 
-    return g_code
+def build_drawing_element(
+    drill_g_code,
+    start_x=0, start_y=0,
+    machining_parameters=default_machining_parameters,
+    comment=''
+):
+    return(''.join(build_drawing_element_lines(
+        drill_g_code, start_x, start_y, machining_parameters, comment
+    )))
 
 # ..............................................................................
                                                    # drill set of vertical holes
-def build_hole_set(
+def build_hole_set_lines(
     hole_set,
     machining_parameters=default_machining_parameters,
-    comment=''
+    comment='',
+    optimise_order=False
 ):
     displacement_height     = machining_parameters['displacement_height']
     drill_depth             = machining_parameters['drill_depth']
     drill_diameter          = machining_parameters['drill_diameter']
     fast_displacement_speed = machining_parameters['fast_displacement_speed']
     drill_bore_speed        = machining_parameters['drill_bore_speed']
-
-    g_code = ''
                                                                    # add comment
     if comment != '' :
-        g_code += '; ' + comment + "\n"
+        yield '; ' + comment + "\n"
+                                            # reorder holes for a shorter travel
+    if optimise_order :
+        (hole_set, original_travel, travel) = optimise_travel(hole_set)
+        yield travel_comment(original_travel, travel)
                                                              # select tool width
     if drill_diameter > 0 :
-        g_code += select_tool(drill_diameter)
+        yield select_tool(drill_diameter)
                                                                    # loop on set
     [old_x, old_y] = [0, 0]
     for hole_coordinate in hole_set:
         [x, y] = hole_coordinate
-        g_code += move_fast(x-old_x, y-old_y, 0, fast_displacement_speed)
-        g_code += move_steady(
+        yield move_fast(x-old_x, y-old_y, 0, fast_displacement_speed)
+        yield move_steady(
             0, 0, -displacement_height-drill_depth, drill_bore_speed
         )
-        g_code += move_fast(
+        yield move_fast(
             0, 0, drill_depth+displacement_height, fast_displacement_speed
         )
         old_x = x
         old_y = y
-  
-    return g_code
+
+def build_hole_set(
+    hole_set,
+    machining_parameters=default_machining_parameters,
+    comment='',
+    optimise_order=False
+):
+    return(''.join(build_hole_set_lines(
+        hole_set, machining_parameters, comment, optimise_order
+    )))
+
+# ..............................................................................
+                       # drill independent drawing elements, one after the other
+#
+# Each element is a (drill_g_code, start_x, start_y, comment) tuple, the
+# start coordinates being relative to the current position, and must end
+# where it starts, as closed shapes do.
+#
+def build_drawing_element_set_lines(
+    drawing_elements,
+    machining_parameters=default_machining_parameters,
+    optimise_order=False
+):
+    drawing_elements = list(drawing_elements)
+                                         # reorder elements for a shorter travel
+    if optimise_order :
+        start_points = [
+            [start_x, start_y]
+                for (drill_g_code, start_x, start_y, comment)
+                in drawing_elements
+        ]
+        (order, original_travel, travel) = optimise_travel(
+            start_points, return_order=True
+        )
+        drawing_elements = [drawing_elements[index] for index in order]
+        yield travel_comment(original_travel, travel)
+                                # drill elements from the previous element start
+    [old_x, old_y] = [0, 0]
+    for (drill_g_code, start_x, start_y, comment) in drawing_elements :
+        yield from build_drawing_element_lines(
+            drill_g_code, start_x-old_x, start_y-old_y,
+            machining_parameters, comment
+        )
+        [old_x, old_y] = [start_x, start_y]
+
+def build_drawing_element_set(
+    drawing_elements,
+    machining_parameters=default_machining_parameters,
+    optimise_order=False
+):
+    return(''.join(build_drawing_element_set_lines(
+        drawing_elements, machining_parameters, optimise_order
+    )))
 
 # ..............................................................................
                                       # drill set of lines with drill tool width
-def build_slit_set(
+def build_slit_set_lines(
     start_x=0, start_y=0,
     dx=0, dy=0, x_spacing=0, y_spacing=0, slit_nb=1,
     machining_parameters=default_machining_parameters,
@@ -731,35 +1096,162 @@ def build_slit_set(
     fast_displacement_speed  = machining_parameters['fast_displacement_speed']
     drill_displacement_speed = machining_parameters['drill_displacement_speed']
     drill_bore_speed         = machining_parameters['drill_bore_speed']
-
-    g_code = ''
                                                                    # add comment
     if comment != '' :
-        g_code += '; ' + comment + "\n"
+        yield '; ' + comment + "\n"
                                                              # select tool width
     if drill_diameter > 0 :
-        g_code += select_tool(drill_diameter)
+        yield select_tool(drill_diameter)
                                                                 # move to origin
     if (start_x != 0) or (start_y != 0) :
-        g_code += move_fast(start_x, start_y, 0, fast_displacement_speed)
+        yield move_fast(start_x, start_y, 0, fast_displacement_speed)
                                                                          # slits
     for slit_index in range(slit_nb) :
         if slit_nb > 1 :
-            g_code += "; slit %d\n" % (slit_index + 1)
-        g_code += move_fast(0, 0, -displacement_height, fast_displacement_speed)
+            yield "; slit %d\n" % (slit_index + 1)
+        yield move_fast(0, 0, -displacement_height, fast_displacement_speed)
         double_pass_nb = math.ceil(drill_depth/(2*pass_depth))
         for pass_index in range(double_pass_nb) :
-            g_code += move_steady(0, 0, -pass_depth, drill_bore_speed)
-            g_code += move_steady(dx, dy, 0, drill_displacement_speed)
-            g_code += move_steady(0, 0, -pass_depth, drill_bore_speed)
-            g_code += move_steady(-dx, -dy, 0, drill_displacement_speed)
-        g_code += move_steady(
+            yield move_steady(0, 0, -pass_depth, drill_bore_speed)
+            yield move_steady(dx, dy, 0, drill_displacement_speed)
+            yield move_steady(0, 0, -pass_depth, drill_bore_speed)
+            yield move_steady(-dx, -dy, 0, drill_displacement_speed)
+        yield move_steady(
             0, 0, 2*double_pass_nb*pass_depth, fast_displacement_speed
         )
-        g_code += move_fast(0, 0, displacement_height, fast_displacement_speed)
+        yield move_fast(0, 0, displacement_height, fast_displacement_speed)
         if slit_index+1 < slit_nb :
-            g_code += move_fast(
+            yield move_fast(
                 x_spacing, y_spacing, 0, fast_displacement_speed
             )
 
-    return(g_code)
+def build_slit_set(
+    start_x=0, start_y=0,
+    dx=0, dy=0, x_spacing=0, y_spacing=0, slit_nb=1,
+    machining_parameters=default_machining_parameters,
+    comment=''
+):
+    return(''.join(build_slit_set_lines(
+        start_x, start_y, dx, dy, x_spacing, y_spacing, slit_nb,
+        machining_parameters, comment
+    )))
+
+# ..............................................................................
+                      # clear a pocket with holes, with as few lifts as possible
+#
+# The tool center paths come from pocket_lib, which needs NumPy: zig-zag
+# passes followed by a contour along the walls, or contour-parallel passes.
+# The coordinates are relative to the current position, to which the tool
+# comes back at the end.
+#
+def build_pocket_lines(
+    polygon, holes=(),
+    machining_parameters=default_machining_parameters,
+    comment='',
+    stepover=0.5, pattern='zigzag'
+):
+    import pocket_lib
+    displacement_height      = machining_parameters['displacement_height']
+    drill_depth              = machining_parameters['drill_depth']
+    pass_depth               = machining_parameters['pass_depth']
+    drill_diameter           = machining_parameters['drill_diameter']
+    fast_displacement_speed  = machining_parameters['fast_displacement_speed']
+    drill_displacement_speed = machining_parameters['drill_displacement_speed']
+    drill_bore_speed         = machining_parameters['drill_bore_speed']
+    paths = pocket_lib.pocket_paths(
+        polygon, holes, drill_diameter, stepover, pattern
+    )
+                                                                   # add comment
+    if comment != '' :
+        yield '; ' + comment + "\n"
+    yield "; %d tool paths per depth\n" % len(paths)
+                                                             # select tool width
+    if drill_diameter > 0 :
+        yield select_tool(drill_diameter)
+                                                            # depth of each pass
+    if pass_depth == 0 :
+        depths = [drill_depth]
+    else :
+        pass_nb = math.ceil(drill_depth/pass_depth)
+        depths = [(index+1)*pass_depth for index in range(pass_nb-1)]
+        depths.append(drill_depth)
+                                                   # cut all paths at each depth
+    [old_x, old_y] = [0, 0]
+    for depth in depths :
+        for path in paths :
+            [x, y] = path[0]
+            yield move_fast(x-old_x, y-old_y, 0, fast_displacement_speed)
+            yield move_fast(0, 0, -displacement_height, fast_displacement_speed)
+            yield move_steady(0, 0, -depth, drill_bore_speed)
+            for [new_x, new_y] in path[1:] :
+                yield move_steady(
+                    new_x-x, new_y-y, 0, drill_displacement_speed
+                )
+                [x, y] = [new_x, new_y]
+            yield move_fast(
+                0, 0, depth+displacement_height, fast_displacement_speed
+            )
+            [old_x, old_y] = [x, y]
+                                                    # back to the start position
+    yield move_fast(-old_x, -old_y, 0, fast_displacement_speed)
+
+def build_pocket(
+    polygon, holes=(),
+    machining_parameters=default_machining_parameters,
+    comment='',
+    stepover=0.5, pattern='zigzag'
+):
+    return(''.join(build_pocket_lines(
+        polygon, holes, machining_parameters, comment, stepover, pattern
+    )))
+
+# ==============================================================================
+                                                                 # g-code output
+# ..............................................................................
+                                    # UTF-8 size of g-code, quick on plain ASCII
+def byte_length(g_code):
+    if g_code.isascii() :
+        return(len(g_code))
+
+    return(len(g_code.encode()))
+
+# ..............................................................................
+                                # stream g-code lines into a file or any io sink
+class GCodeWriter:
+
+    def __init__(self, sink, close_sink=False):
+        self.sink = sink
+        self.close_sink = close_sink
+        self.line_nb = 0
+        self.byte_nb = 0
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+                                # write a piece of g-code made of complete lines
+    def write(self, g_code):
+        if g_code :
+            self.sink.write(g_code)
+            self.line_nb += g_code.count("\n")
+            self.byte_nb += byte_length(g_code)
+
+                                     # write g-code pieces as they are generated
+    def write_lines(self, g_code_lines):
+        for g_code in g_code_lines :
+            self.write(g_code)
+
+    def close(self):
+        if self.close_sink :
+            self.sink.close()
+        else :
+            self.sink.flush()
+
+# ..............................................................................
+                                              # g-code writer on a buffered file
+def open_gcode_writer(file_specification, buffer_size=1024*1024):
+    g_code_file = open(file_specification, 'w', buffering=buffer_size)
+
+    return(GCodeWriter(g_code_file, close_sink=True))
@@ -0,0 +1,523 @@
+import os
+import re
+import sys
+import mmap
+import string
+import collections
+import concurrent.futures
+
+# ==============================================================================
+                                                                  # move records
+# ..............................................................................
+                                # displacement from (x1, y1, z1) to (x2, y2, z2)
+#
+# kind is the motion g-code ('G0', 'G1', 'G2' or 'G3'), tool is the last
+# selected tool diameter (None before any tool selection) and center_x,
+# center_y give the arc center of 'G2' and 'G3' moves.
+#
+Move = collections.namedtuple('Move', [
+    'kind',
+    'x1', 'y1', 'z1',
+    'x2', 'y2', 'z2',
+    'feed', 'tool', 'line_nb',
+    'center_x', 'center_y'
+])
+
+# ==============================================================================
+                                                                     # tokenizer
+COMMENT_PATTERN = re.compile(r'\([^)]*\)|;.*')
+TOKEN_CACHE_SIZE = 4*1024
+WORD_PATTERN = re.compile(r'([A-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+BYTES_COMMENT_PATTERN = re.compile(COMMENT_PATTERN.pattern.encode())
+BYTES_WORD_PATTERN = re.compile(WORD_PATTERN.pattern.encode())
+LETTER_CODES = {ord(letter) : letter for letter in string.ascii_uppercase}
+                      # characters of the WORD_PATTERN values, without exponents
+VALUE_CHARACTERS = string.digits + '.+-'
+BYTES_VALUE_CHARACTERS = VALUE_CHARACTERS.encode()
+
+# ..............................................................................
+               # G-word values and other word values of a line, without comments
+def tokenize(line):
+    if isinstance(line, bytes) :
+        return(tokenize_bytes(line))
+    code = line.upper()
+    if ('(' in code) or (';' in code) :
+        code = COMMENT_PATTERN.sub(' ', code)
+    g_codes = []
+    values = {}
+                                           # fast path for space-separated words
+#
+# float() also reads exponents and underscores, so the words with other
+# characters than those of WORD_PATTERN go through the regular expression.
+#
+    try :
+        for word in code.split() :
+            letter = word[0]
+            if not ('A' <= letter <= 'Z') :
+                raise ValueError(word)
+            if word.rstrip(VALUE_CHARACTERS) != letter :
+                raise ValueError(word)
+            if letter == 'G' :
+                g_codes.append(float(word[1:]))
+            else :
+                values[letter] = float(word[1:])
+                                                     # compact or unusual syntax
+    except ValueError :
+        g_codes = []
+        values = {}
+        for (letter, value) in WORD_PATTERN.findall(code) :
+            if letter == 'G' :
+                g_codes.append(float(value))
+            else :
+                values[letter] = float(value)
+
+    return(tuple(g_codes), values)
+
+# ..............................................................................
+               # tokenize a raw bytes line, only the word letters become strings
+def tokenize_bytes(line):
+    code = line.upper()
+    if (b'(' in code) or (b';' in code) :
+        code = BYTES_COMMENT_PATTERN.sub(b' ', code)
+    g_codes = []
+    values = {}
+                                           # fast path for space-separated words
+    try :
+        for word in code.split() :
+            letter = LETTER_CODES[word[0]]
+            if len(word.rstrip(BYTES_VALUE_CHARACTERS)) != 1 :
+                raise ValueError(word)
+            if letter == 'G' :
+                g_codes.append(float(word[1:]))
+            else :
+                values[letter] = float(word[1:])
+                                                     # compact or unusual syntax
+    except (KeyError, ValueError) :
+        g_codes = []
+        values = {}
+        for (letter, value) in BYTES_WORD_PATTERN.findall(code) :
+            if letter == b'G' :
+                g_codes.append(float(value))
+            else :
+                values[letter.decode()] = float(value)
+
+    return(tuple(g_codes), values)
+
+# ==============================================================================
+                                                              # LinuxCNC o-words
+O_WORD_STARTS = ('o', 'O', b'o', b'O')
+
+# ..............................................................................
+                      # numbered lines of an o-word block, up to its end keyword
+def o_word_block(numbered_lines, label, end_keyword):
+    block = []
+    for (line_nb, line) in numbered_lines :
+        words = line.upper().split()
+        if isinstance(line, bytes) :
+            words = [word.decode() for word in words[:2]]
+        if (words[:2] == [label, end_keyword]) :
+            break
+        block.append((line_nb, line))
+
+    return(block)
+
+# ..............................................................................
+                    # expand subroutine calls and repeat loops of numbered lines
+def expand_o_words(numbered_lines, subroutines=None):
+    if subroutines is None :
+        subroutines = {}
+    numbered_lines = iter(numbered_lines)
+    for (line_nb, line) in numbered_lines :
+        if line.lstrip()[:1] not in O_WORD_STARTS :
+            yield (line_nb, line)
+            continue
+        if isinstance(line, bytes) :
+            line = line.decode()
+        words = line.upper().split()
+        if len(words) > 1 :
+            (label, keyword) = words[:2]
+                                                   # store subroutine definition
+            if keyword == 'SUB' :
+                subroutines[label] = o_word_block(
+                    numbered_lines, label, 'ENDSUB'
+                )
+                continue
+                                                             # replay subroutine
+            if keyword == 'CALL' :
+                yield from expand_o_words(
+                    subroutines.get(label, []), subroutines
+                )
+                continue
+                                                              # replay loop body
+            if keyword == 'REPEAT' :
+                repeat_nb = int(float(words[2].strip('[]')))
+                block = o_word_block(numbered_lines, label, 'ENDREPEAT')
+                for index in range(repeat_nb) :
+                    yield from expand_o_words(block, subroutines)
+                continue
+        yield (line_nb, line)
+
+# ==============================================================================
+                                                                        # parser
+# ..............................................................................
+                           # g-code parser keeping the modal state between lines
+class GCodeParser:
+
+    def __init__(self):
+        self.absolute_mode = True
+        self.origin_x = 0
+        self.origin_y = 0
+        self.origin_z = 0
+        self.x = 0
+        self.y = 0
+        self.z = 0
+        self.feed = 0
+        self.tool = None
+        self.motion_mode = None
+        self.token_cache = {}
+
+# ..............................................................................
+                                  # determine new coordinates after displacement
+    def new_coordinates(self, values):
+        if self.absolute_mode :
+            x = self.origin_x + values.get('X', self.x - self.origin_x)
+            y = self.origin_y + values.get('Y', self.y - self.origin_y)
+            z = self.origin_z + values.get('Z', self.z - self.origin_z)
+        else :
+            x = self.x + values.get('X', 0)
+            y = self.y + values.get('Y', 0)
+            z = self.z + values.get('Z', 0)
+
+        return(x, y, z)
+
+# ..............................................................................
+                                                               # G-word handlers
+                                                        # absolute/relative mode
+    def set_absolute_mode(self, values):
+        self.absolute_mode = True
+
+    def set_relative_mode(self, values):
+        self.absolute_mode = False
+
+                                                    # set position as new origin
+    def set_origin(self, values):
+        (self.origin_x, self.origin_y, self.origin_z) = \
+            self.new_coordinates(values)
+
+                                                                 # displacements
+    def move(self, kind, values, line_nb):
+        self.motion_mode = kind
+        (x, y, z) = self.new_coordinates(values)
+        (center_x, center_y) = (None, None)
+        if kind in ('G2', 'G3') :
+            center_x = self.x + values.get('I', 0)
+            center_y = self.y + values.get('J', 0)
+        move = Move(
+            kind,
+            self.x, self.y, self.z,
+            x, y, z,
+            self.feed, self.tool, line_nb,
+            center_x, center_y
+        )
+        (self.x, self.y, self.z) = (x, y, z)
+
+        return(move)
+
+# ..............................................................................
+                             # update state with a line, return the move or None
+    def parse_line(self, line, line_nb=0):
+                           # repeated lines (multiple passes) are tokenized once
+        tokens = self.token_cache.get(line)
+        if tokens is None :
+            tokens = tokenize(line)
+            if len(self.token_cache) >= TOKEN_CACHE_SIZE :
+                self.token_cache.clear()
+            self.token_cache[line] = tokens
+        (g_codes, values) = tokens
+        if 'O' in values :
+            return(None)
+                                                # tool (drill diameter) and feed
+        if 'T' in values :
+            self.tool = values['T']
+        if 'F' in values :
+            self.feed = values['F']
+                                                              # dispatch G-words
+        motion = None
+        for g_code in g_codes :
+            if g_code in MOTION_KINDS :
+                motion = MOTION_KINDS[g_code]
+            elif g_code in G_CODE_HANDLERS :
+                G_CODE_HANDLERS[g_code](self, values)
+                                    # axis words alone continue the modal motion
+        if (motion is None) and not g_codes :
+            if ('X' in values) or ('Y' in values) or ('Z' in values) :
+                motion = self.motion_mode
+        if motion is None :
+            return(None)
+
+        return(self.move(motion, values, line_nb))
+
+# ..............................................................................
+                                               # moves from an iterable of lines
+    def parse(self, lines, first_line_nb=1):
+        numbered_lines = enumerate(lines, first_line_nb)
+        for (line_nb, line) in expand_o_words(numbered_lines) :
+            move = self.parse_line(line, line_nb)
+            if move is not None :
+                yield move
+
+# ..............................................................................
+                                        # moves from an iterable of g-code lines
+def parse_gcode(lines):
+    return(GCodeParser().parse(lines))
+
+# ..............................................................................
+                                                      # moves from a g-code file
+def parse_gcode_file(file_specification):
+    yield from parse_gcode(read_gcode_lines(file_specification))
+
+# ..............................................................................
+                        # raw bytes lines of a file, memory-mapped when possible
+#
+# The lines are tokenized as bytes, without decoding them into strings.
+# Pipes, standard input ('-') and empty files can't be mapped and are read
+# through a buffered binary stream instead.
+#
+def read_gcode_lines(file_specification):
+    if file_specification == '-' :
+        yield from sys.stdin.buffer
+        return
+    with open(file_specification, 'rb') as gcode_file :
+        try :
+            mapped_file = mmap.mmap(
+                gcode_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        except (ValueError, OSError) :
+            yield from gcode_file
+            return
+        with mapped_file :
+            yield from iter(mapped_file.readline, b'')
+
+# ..............................................................................
+                                                        # G-word dispatch tables
+MOTION_KINDS = {0 : 'G0', 1 : 'G1', 2 : 'G2', 3 : 'G3'}
+
+G_CODE_HANDLERS = {
+    90 : GCodeParser.set_absolute_mode,
+    91 : GCodeParser.set_relative_mode,
+    92 : GCodeParser.set_origin,
+}
+
+# ==============================================================================
+                                                              # parallel parsing
+#
+# The file is split into byte ranges which are scanned in parallel with an
+# unknown entry state: every coordinate of the exit position and origin is
+# kept as an offset to the entry position, to the entry origin or to zero,
+# for both possible entry coordinate modes. A sequential prefix scan over
+# the chunk summaries then gives the exact entry state of each chunk, and
+# the chunks are parsed in parallel from these states.
+#
+PARALLEL_CHUNK_SIZE = 16*1024*1024
+AXES = ('X', 'Y', 'Z')
+
+# ..............................................................................
+                                               # lines of a byte range of a file
+def read_chunk_lines(file_specification, start, end):
+    with open(file_specification, 'rb') as gcode_file :
+        gcode_file.seek(start)
+        data = gcode_file.read(end - start)
+
+    return(data.splitlines())
+
+# ..............................................................................
+                                       # byte ranges starting at line beginnings
+def chunk_ranges(file_specification, chunk_nb):
+    file_size = os.path.getsize(file_specification)
+    boundaries = [0]
+    with open(file_specification, 'rb') as gcode_file :
+        for index in range(1, chunk_nb) :
+            gcode_file.seek(index*file_size // chunk_nb)
+            gcode_file.readline()
+            boundary = gcode_file.tell()
+            if boundaries[-1] < boundary < file_size :
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+
+    return(list(zip(boundaries[:-1], boundaries[1:])))
+
+# ..............................................................................
+                        # position and origin relative to an unknown entry state
+#
+# Each coordinate is a (base, offset) pair where base is 'P' for the entry
+# position, 'O' for the entry origin and None for zero.
+#
+class SymbolicState:
+
+    def __init__(self, absolute_mode):
+        self.absolute_mode = absolute_mode
+        self.position = [('P', 0.0)] * 3
+        self.origin = [('O', 0.0)] * 3
+
+    def new_coordinates(self, values):
+        coordinates = []
+        for (axis, (base, offset)) in zip(AXES, self.position) :
+            if axis not in values :
+                coordinates.append((base, offset))
+            elif self.absolute_mode :
+                (origin_base, origin_offset) = self.origin[AXES.index(axis)]
+                coordinates.append((origin_base, origin_offset + values[axis]))
+            else :
+                coordinates.append((base, offset + values[axis]))
+
+        return(coordinates)
+
+    def update(self, g_codes, values, motion):
+        for g_code in g_codes :
+            if g_code == 90 :
+                self.absolute_mode = True
+            elif g_code == 91 :
+                self.absolute_mode = False
+            elif g_code == 92 :
+                self.origin = self.new_coordinates(values)
+        if motion :
+            self.position = self.new_coordinates(values)
+
+# ..............................................................................
+                      # resolve symbolic coordinates with the actual entry state
+def resolve_coordinates(coordinates, position, origin):
+    resolved = []
+    for (index, (base, offset)) in enumerate(coordinates) :
+        if base == 'P' :
+            offset = position[index] + offset
+        elif base == 'O' :
+            offset = origin[index] + offset
+        resolved.append(offset)
+
+    return(resolved)
+
+# ..............................................................................
+                                      # scan a chunk with an unknown entry state
+def scan_chunk(chunk):
+    (file_specification, start, end) = chunk
+    lines = read_chunk_lines(file_specification, start, end)
+    summary = {
+        'line_nb'         : len(lines),
+        'has_o_words'     : False,
+        'needs_motion'    : False,
+        'absolute_mode'   : None,
+        'feed'            : None,
+        'tool'            : None,
+        'motion_mode'     : None,
+    }
+    states = {True : SymbolicState(True), False : SymbolicState(False)}
+    for line in lines :
+        if line.lstrip()[:1] in O_WORD_STARTS :
+            summary['has_o_words'] = True
+            break
+        (g_codes, values) = tokenize(line)
+        if 'T' in values :
+            summary['tool'] = values['T']
+        if 'F' in values :
+            summary['feed'] = values['F']
+        motion = False
+        for g_code in g_codes :
+            if g_code in MOTION_KINDS :
+                motion = True
+                summary['motion_mode'] = MOTION_KINDS[g_code]
+            elif g_code in (90, 91) :
+                summary['absolute_mode'] = (g_code == 90)
+                                    # axis words alone continue the modal motion
+        if not g_codes :
+            if ('X' in values) or ('Y' in values) or ('Z' in values) :
+                motion = True
+                if summary['motion_mode'] is None :
+                    summary['needs_motion'] = True
+        for state in states.values() :
+            state.update(g_codes, values, motion)
+    summary['states'] = {
+        entry_mode : (state.position, state.origin)
+            for (entry_mode, state) in states.items()
+    }
+
+    return(summary)
+
+# ..............................................................................
+                                     # parse a chunk from its actual entry state
+def parse_chunk(chunk):
+    (file_specification, start, end, entry_state, first_line_nb) = chunk
+    parser = GCodeParser()
+    for (attribute, value) in entry_state.items() :
+        setattr(parser, attribute, value)
+    lines = read_chunk_lines(file_specification, start, end)
+
+    return([tuple(move) for move in parser.parse(lines, first_line_nb)])
+
+# ..............................................................................
+                # entry state of a chunk from the exit state of the previous one
+def next_entry_state(entry_state, summary):
+    (position, origin) = summary['states'][entry_state['absolute_mode']]
+    entry_position = (entry_state['x'], entry_state['y'], entry_state['z'])
+    entry_origin = (
+        entry_state['origin_x'], entry_state['origin_y'],
+        entry_state['origin_z']
+    )
+    exit_state = dict(entry_state)
+    (exit_state['x'], exit_state['y'], exit_state['z']) = \
+        resolve_coordinates(position, entry_position, entry_origin)
+    (exit_state['origin_x'], exit_state['origin_y'], exit_state['origin_z']) =\
+        resolve_coordinates(origin, entry_position, entry_origin)
+    for attribute in ('absolute_mode', 'feed', 'tool', 'motion_mode') :
+        if summary[attribute] is not None :
+            exit_state[attribute] = summary[attribute]
+
+    return(exit_state)
+
+# ..............................................................................
+                            # moves from a g-code file, parsed in a process pool
+def parse_gcode_file_parallel(
+    file_specification, worker_nb=None, chunk_size=PARALLEL_CHUNK_SIZE
+):
+    worker_nb = worker_nb or os.cpu_count()
+    file_size = os.path.getsize(file_specification)
+    chunk_nb = max(worker_nb, -(-file_size // chunk_size))
+    if (worker_nb < 2) or (file_size < chunk_size) :
+        yield from parse_gcode_file(file_specification)
+        return
+    ranges = chunk_ranges(file_specification, chunk_nb)
+    with concurrent.futures.ProcessPoolExecutor(worker_nb) as executor :
+                                         # scan chunks with unknown entry states
+        summaries = list(executor.map(scan_chunk, [
+            (file_specification, start, end) for (start, end) in ranges
+        ]))
+        if any(summary['has_o_words'] for summary in summaries) :
+            yield from parse_gcode_file(file_specification)
+            return
+                                       # prefix scan for the actual entry states
+        entry_state = {
+            attribute : value
+                for (attribute, value) in vars(GCodeParser()).items()
+                if attribute != 'token_cache'
+        }
+        chunks = []
+        first_line_nb = 1
+        for ((start, end), summary) in zip(ranges, summaries) :
+            motion_unknown = (entry_state['motion_mode'] is None)
+            if summary['needs_motion'] and motion_unknown :
+                yield from parse_gcode_file(file_specification)
+                return
+            chunks.append(
+                (file_specification, start, end, entry_state, first_line_nb)
+            )
+            entry_state = next_entry_state(entry_state, summary)
+            first_line_nb += summary['line_nb']
+                      # parse chunks, keeping a bounded number of them in flight
+        pending = collections.deque()
+        for chunk in chunks :
+            pending.append(executor.submit(parse_chunk, chunk))
+            if len(pending) > 2*worker_nb :
+                for move in pending.popleft().result() :
+                    yield Move._make(move)
+        while pending :
+            for move in pending.popleft().result() :
+                yield Move._make(move)
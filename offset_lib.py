@@ -0,0 +1,559 @@
+import math
+import numpy
+
+# ==============================================================================
+                                                                     # constants
+MITER_LIMIT = 5
+REVERSAL_COSINE = -0.999
+EPSILON = 1E-9
+DEFAULT_ARC_TOLERANCE = 0.05
+PAIR_BLOCK_SIZE = 1000000
+SWEEP_PAIR_RATIO = 32
+JITTER = 1E-10
+JITTER_SEED = 1
+
+# ==============================================================================
+                                                                         # rings
+#
+# A ring is a closed polygon given as a list of [x, y] points, without
+# repeating its first point. Outlines run counterclockwise and holes
+# clockwise, so that the filled region is always on the left.
+#
+# ..............................................................................
+                              # signed area, positive for counterclockwise rings
+def signed_area(ring):
+    area = 0
+    for index in range(len(ring)) :
+        (x1, y1) = ring[index-1]
+        (x2, y2) = ring[index]
+        area += x1*y2 - x2*y1
+
+    return(area/2)
+
+# ..............................................................................
+          # ring without repeated points and without points along straight lines
+def clean_ring(ring, tolerance=EPSILON):
+    cleaned = []
+    for (x, y) in ring :
+        if cleaned and (
+            math.hypot(x - cleaned[-1][0], y - cleaned[-1][1]) <= tolerance
+        ) :
+            continue
+        cleaned.append([float(x), float(y)])
+    while (len(cleaned) > 1) and (math.hypot(
+        cleaned[0][0] - cleaned[-1][0], cleaned[0][1] - cleaned[-1][1]
+    ) <= tolerance) :
+        cleaned.pop()
+                                       # straight continuations, spikes are kept
+    straight = []
+    for index in range(len(cleaned)) :
+        (x1, y1) = cleaned[index-1]
+        (x, y) = cleaned[index]
+        (x2, y2) = cleaned[(index+1) % len(cleaned)]
+        (dx1, dy1, dx2, dy2) = (x - x1, y - y1, x2 - x, y2 - y)
+        cross = dx1*dy2 - dy1*dx2
+        scale = math.hypot(dx1, dy1)*math.hypot(dx2, dy2)
+        straight.append(
+            (abs(cross) <= tolerance*scale) and (dx1*dx2 + dy1*dy2 > 0)
+        )
+    cleaned = [
+        point for (point, is_straight) in zip(cleaned, straight)
+            if not is_straight
+    ]
+    if len(cleaned) < 3 :
+        return([])
+
+    return(cleaned)
+
+# ==============================================================================
+                                                                    # raw offset
+# ..............................................................................
+                # points of a ring moved by a distance to the right of its edges
+#
+# Outer corners are joined with a miter, squared off at the distance from
+# the vertex when the miter gets longer than MITER_LIMIT times the
+# distance, or with an arc. Inner corners are joined at the crossing of
+# both offset edges when it lies on them, and else go back through the
+# original vertex, as in Clipper: this makes a small reversed loop which
+# the winding cleanup removes. Inner corners turning back almost on their
+# edge get an outer join around their end instead, as in Clipper2, for
+# the narrow notch they make to be filled.
+#
+def raw_offset(
+    ring, distance, join='miter', arc_tolerance=DEFAULT_ARC_TOLERANCE
+):
+    point_nb = len(ring)
+    (lengths, normals) = ([], [])
+    for index in range(point_nb) :
+        (x1, y1) = ring[index]
+        (x2, y2) = ring[(index+1) % point_nb]
+        length = math.hypot(x2 - x1, y2 - y1)
+        lengths.append(length)
+        normals.append(((y2 - y1)/length, -(x2 - x1)/length))
+    points = []
+    for index in range(point_nb) :
+        (x, y) = ring[index]
+        (normal1_x, normal1_y) = normals[index-1]
+        (normal2_x, normal2_y) = normals[index]
+           # turn between the edge directions, which are the normals turned left
+        turn = normal1_x*normal2_y - normal1_y*normal2_x
+        cosine = normal1_x*normal2_x + normal1_y*normal2_y
+        start = [x + distance*normal1_x, y + distance*normal1_y]
+        end = [x + distance*normal2_x, y + distance*normal2_y]
+        miter = (1 + cosine > 2/MITER_LIMIT**2)
+        angle = math.atan2(turn, cosine)
+        inner = (turn*distance < 0)
+                        # path reversals are wrapped around their end, as spikes
+        if inner and (cosine <= REVERSAL_COSINE) :
+            angle -= math.copysign(2*math.pi, angle)
+            inner = False
+        if inner :
+            trim = abs(distance*turn)/(1 + cosine) if miter else math.inf
+            if 2*trim > min(lengths[index-1], lengths[index]) :
+                points += [start, [x, y], end]
+                continue
+        elif join == 'arc' :
+            points += arc_join(
+                x, y, normal1_x, normal1_y, angle, distance, arc_tolerance
+            )
+            continue
+        elif not miter :
+            points += square_join(x, y, normal1_x, normal1_y, angle, distance)
+            continue
+        factor = distance/(1 + cosine)
+        points.append([
+            x + (normal1_x + normal2_x)*factor,
+            y + (normal1_y + normal2_y)*factor
+        ])
+
+    return(points)
+
+# ..............................................................................
+                              # corner squared off at the distance from a vertex
+#
+# The square edge is tangent to the arc join at its middle, as in Clipper.
+#
+def square_join(x, y, normal_x, normal_y, angle, distance):
+    reach = distance/math.cos(angle/4)
+    points = []
+    for fraction in (1/4, 3/4) :
+        (cosine, sine) = (math.cos(angle*fraction), math.sin(angle*fraction))
+        points.append([
+            x + reach*(normal_x*cosine - normal_y*sine),
+            y + reach*(normal_x*sine + normal_y*cosine)
+        ])
+
+    return(points)
+
+# ..............................................................................
+                  # arc around a vertex, from the offset point of the first edge
+def arc_join(x, y, normal_x, normal_y, angle, distance, arc_tolerance):
+    radius = abs(distance)
+    facet_angle = 2*math.acos(max(-1, 1 - arc_tolerance/radius))
+    facet_nb = max(1, math.ceil(abs(angle)/facet_angle))
+    points = []
+    for index in range(facet_nb+1) :
+        (cosine, sine) = (
+            math.cos(angle*index/facet_nb), math.sin(angle*index/facet_nb)
+        )
+        points.append([
+            x + distance*(normal_x*cosine - normal_y*sine),
+            y + distance*(normal_x*sine + normal_y*cosine)
+        ])
+
+    return(points)
+
+# ==============================================================================
+                                                     # self-intersection removal
+# ..............................................................................
+             # segments overlapping in x, as queries on the segments sorted in x
+#
+# The segments are sorted by their left end and each one is paired with the
+# following ones starting before its right end. The queries are given as
+# by box_pair_queries, the owners being stored boxes preceding their
+# partners.
+#
+def sweep_pair_queries(x_min, x_max):
+    sorting = numpy.argsort(x_min, kind='stable')
+    ends = numpy.searchsorted(x_min[sorting], x_max[sorting], 'right')
+    starts = numpy.arange(1, len(sorting)+1)
+    counts = numpy.maximum(ends - starts, 0)
+
+    return(
+        sorting, sorting, starts, counts, numpy.ones(len(sorting), dtype=bool)
+    )
+
+# ..............................................................................
+             # segments with overlapping bounding boxes, as queries on box lists
+#
+# The x ranges of the boxes are indexed in a segment tree built over their
+# sorted end coordinates: each range is stored in the O(log n) nodes which
+# cover it exactly, and each box start is registered in all nodes on the
+# path from its leaf to the root. Two boxes overlapping in x meet in the
+# node storing one of them on the path of the other one's start, once, or
+# twice when both start at the same x. In each node, the registered boxes
+# overlapping a stored one in y are those with a bottom within its y range,
+# plus those containing its bottom, the other way round. Both are found by
+# binary searches in the boxes sorted by node and bottom, for all nodes at
+# once.
+#
+# Each query is given as an owner box, a start and a count of partner boxes
+# in a sorted box list, and whether the owner is the stored box.
+#
+def box_pair_queries(x_min, x_max, y_min, y_max):
+    x_values = numpy.unique(numpy.concatenate((x_min, x_max)))
+    (lows, highs) = (
+        numpy.searchsorted(x_values, x_min), numpy.searchsorted(x_values, x_max)
+    )
+    leaf_nb = 1 << max(len(x_values) - 1, 0).bit_length()
+    depth = leaf_nb.bit_length() - 1
+                                           # nodes covering exactly the x ranges
+    boxes = numpy.arange(len(x_min))
+    (left, right) = (lows + leaf_nb, highs + leaf_nb + 1)
+    (stored_boxes, stored_nodes) = ([], [])
+    while len(boxes) :
+        odd = (left & 1) == 1
+        stored_boxes.append(boxes[odd])
+        stored_nodes.append(left[odd])
+        left = left + odd
+        odd = (right & 1) == 1
+        right = right - odd
+        stored_boxes.append(boxes[odd])
+        stored_nodes.append(right[odd])
+        (left, right) = (left >> 1, right >> 1)
+        active = left < right
+        (boxes, left, right) = (boxes[active], left[active], right[active])
+    stored_boxes = numpy.concatenate(stored_boxes)
+    stored_nodes = numpy.concatenate(stored_nodes)
+                                              # nodes above the box start leaves
+    started_boxes = numpy.tile(numpy.arange(len(x_min)), depth + 1)
+    started_nodes = numpy.concatenate([
+        (lows + leaf_nb) >> level for level in range(depth + 1)
+    ])
+                                          # boxes sorted by node and bottom rank
+    y_values = numpy.unique(numpy.concatenate((y_min, y_max)))
+    bottoms = numpy.searchsorted(y_values, y_min)
+    tops = numpy.searchsorted(y_values, y_max)
+    rank_nb = len(y_values)
+    stored_keys = stored_nodes*rank_nb + bottoms[stored_boxes]
+    sorting = numpy.argsort(stored_keys, kind='stable')
+    (stored_keys, stored_list) = (
+        stored_keys[sorting], stored_boxes[sorting]
+    )
+    started_keys = started_nodes*rank_nb + bottoms[started_boxes]
+    sorting = numpy.argsort(started_keys, kind='stable')
+    (started_keys, started_list) = (
+        started_keys[sorting], started_boxes[sorting]
+    )
+                                   # started boxes with a bottom in a stored box
+    node_keys = stored_nodes*rank_nb
+    stored_starts = numpy.searchsorted(
+        started_keys, node_keys + bottoms[stored_boxes], 'left'
+    )
+    stored_counts = numpy.searchsorted(
+        started_keys, node_keys + tops[stored_boxes], 'right'
+    ) - stored_starts
+                         # stored boxes with a bottom above a started box bottom
+    node_keys = started_nodes*rank_nb
+    started_starts = numpy.searchsorted(
+        stored_keys, node_keys + bottoms[started_boxes], 'right'
+    )
+    started_counts = numpy.searchsorted(
+        stored_keys, node_keys + tops[started_boxes], 'right'
+    ) - started_starts
+
+    return(
+        numpy.concatenate((stored_boxes, started_boxes)),
+        numpy.concatenate((started_list, stored_list)),
+        numpy.concatenate((stored_starts, started_starts + len(started_list))),
+        numpy.concatenate((stored_counts, started_counts)),
+        numpy.concatenate((
+            numpy.ones(len(stored_boxes), dtype=bool),
+            numpy.zeros(len(started_boxes), dtype=bool)
+        ))
+    )
+
+# ..............................................................................
+                  # crossing segment pairs, among the overlapping bounding boxes
+#
+# The pairs overlapping in x are taken from a sort-and-sweep along x when
+# there are at most SWEEP_PAIR_RATIO of them per segment, as for most
+# outlines. Else, as for outlines with many long edges side by side, only
+# the pairs of overlapping bounding boxes are generated, from the segment
+# tree of box_pair_queries. The pairs are handled in blocks of at most
+# PAIR_BLOCK_SIZE, and the crossing points of a block are computed at once.
+# Of the pairs met twice, the one whose stored box has the lower index is
+# kept. Each pair is ordered by the left end of its segments.
+#
+# Finding the m overlapping box pairs takes O(n log n + m) for n segments
+# with the sweep and O(n log^2 n + m) with the segment tree, whose n log n
+# entries are sorted once. Densely sampled outlines offset beyond their
+# curvature radius have many crossings, and so many box pairs.
+#
+def segment_crossings(x1, y1, x2, y2, adjacent):
+    (x_min, x_max) = (numpy.minimum(x1, x2), numpy.maximum(x1, x2))
+    (y_min, y_max) = (numpy.minimum(y1, y2), numpy.maximum(y1, y2))
+    queries = sweep_pair_queries(x_min, x_max)
+    if queries[3].sum() > SWEEP_PAIR_RATIO*len(x_min) :
+        queries = box_pair_queries(x_min, x_max, y_min, y_max)
+    (owners, partners, starts, counts, stored) = queries
+    ranks = numpy.empty(len(x_min), dtype=numpy.int64)
+    ranks[numpy.argsort(x_min, kind='stable')] = numpy.arange(len(x_min))
+    pair_ends = numpy.cumsum(counts)
+    blocks = []
+    block_start = 0
+    while block_start < len(counts) :
+        block_end = int(numpy.searchsorted(
+            pair_ends, pair_ends[block_start] - counts[block_start]
+                + PAIR_BLOCK_SIZE, 'right'
+        ))
+        block_end = max(block_end, block_start + 1)
+        block_counts = counts[block_start:block_end]
+        offsets = numpy.arange(int(block_counts.sum())) - numpy.repeat(
+            numpy.cumsum(block_counts) - block_counts, block_counts
+        )
+        firsts = numpy.repeat(owners[block_start:block_end], block_counts)
+        seconds = partners[
+            numpy.repeat(starts[block_start:block_end], block_counts) + offsets
+        ]
+        is_stored = numpy.repeat(stored[block_start:block_end], block_counts)
+        (stored_boxes, started_boxes) = (
+            numpy.where(is_stored, firsts, seconds),
+            numpy.where(is_stored, seconds, firsts)
+        )
+        kept = (stored_boxes != started_boxes) & (
+            (x_min[stored_boxes] < x_min[started_boxes])
+                | (stored_boxes < started_boxes)
+        ) & (y_min[firsts] <= y_max[seconds]) & \
+            (y_min[seconds] <= y_max[firsts])
+        (firsts, seconds) = (firsts[kept], seconds[kept])
+        swapped = ranks[firsts] > ranks[seconds]
+        (firsts, seconds) = (
+            numpy.where(swapped, seconds, firsts),
+            numpy.where(swapped, firsts, seconds)
+        )
+        blocks.append(block_crossings(
+            x1, y1, x2, y2, firsts, seconds, adjacent
+        ))
+        block_start = block_end
+    if not blocks :
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        blocks.append(block_crossings(x1, y1, x2, y2, empty, empty, adjacent))
+
+    return([
+        numpy.concatenate([block[index] for block in blocks])
+            for index in range(7)
+    ])
+
+# ..............................................................................
+                                    # crossing points of candidate segment pairs
+def block_crossings(x1, y1, x2, y2, firsts, seconds, adjacent):
+                                                     # not adjacent along a ring
+    candidate = ~adjacent(firsts, seconds)
+    (firsts, seconds) = (firsts[candidate], seconds[candidate])
+         # ends on different sides of the other segment's line, counting ends on
+                 # the line on its left side as for the scanlines of polygon_lib
+    (r_x, r_y) = (x2[firsts] - x1[firsts], y2[firsts] - y1[firsts])
+    (s_x, s_y) = (x2[seconds] - x1[seconds], y2[seconds] - y1[seconds])
+    (q_x, q_y) = (x1[seconds] - x1[firsts], y1[seconds] - y1[firsts])
+    (p_x, p_y) = (x2[seconds] - x1[firsts], y2[seconds] - y1[firsts])
+    (o_x, o_y) = (x2[firsts] - x1[seconds], y2[firsts] - y1[seconds])
+    crossing = \
+        ((r_x*q_y - r_y*q_x >= 0) != (r_x*p_y - r_y*p_x >= 0)) & \
+        ((s_x*q_y - s_y*q_x <= 0) != (s_x*o_y - s_y*o_x >= 0))
+    denominator = r_x*s_y - r_y*s_x
+    with numpy.errstate(divide='ignore', invalid='ignore') :
+        t = numpy.clip((q_x*s_y - q_y*s_x) / denominator, 0, 1)
+        u = numpy.clip((q_x*r_y - q_y*r_x) / denominator, 0, 1)
+    (firsts, seconds) = (firsts[crossing], seconds[crossing])
+    (t, u) = (t[crossing], u[crossing])
+    crossing_x = x1[firsts] + t*r_x[crossing]
+    crossing_y = y1[firsts] + t*r_y[crossing]
+
+    return(
+        firsts, seconds, t, u, crossing_x, crossing_y, denominator[crossing]
+    )
+
+# ..............................................................................
+                               # winding number of a point for a set of segments
+def winding_number(x, y, x1, y1, x2, y2):
+    is_left = (x2 - x1)*(y - y1) - (x - x1)*(y2 - y1)
+    upwards = (y1 <= y) & (y2 > y) & (is_left > 0)
+    downwards = (y1 > y) & (y2 <= y) & (is_left < 0)
+
+    return(int(upwards.sum()) - int(downwards.sum()))
+
+# ..............................................................................
+                # outlines of the region covered at least once by a set of rings
+#
+# Along a ring, the winding number on the left of its edges changes by one
+# at each crossing, depending on the direction of the crossed edge. It is
+# found at the lowest point of each ring, where the space just below is
+# only covered by the other rings. The edges having the covered region on
+# their left and an uncovered one on their right are kept and linked again
+# into rings.
+#
+# The points are first moved by a tiny pseudo-random amount, so that no
+# point lies exactly on another edge and no edges overlap, and the kept
+# vertices get their exact coordinates back.
+#
+def positive_union(rings):
+    rings = [ring for ring in rings if len(ring) >= 3]
+    if not rings :
+        return([])
+    ring_starts = numpy.cumsum([0] + [len(ring) for ring in rings])
+    points = numpy.array(
+        [point for ring in rings for point in ring], dtype=numpy.float64
+    )
+    exact_points = [tuple(point) for point in points.tolist()]
+    points += JITTER*max(numpy.abs(points).max(), 1) * \
+        numpy.random.default_rng(JITTER_SEED).uniform(-1, 1, points.shape)
+    ring_indexes = numpy.repeat(
+        numpy.arange(len(rings)), [len(ring) for ring in rings]
+    )
+    next_points = numpy.arange(len(points)) + 1
+    next_points[ring_starts[1:] - 1] = ring_starts[:-1]
+    (x1, y1) = (points[:, 0], points[:, 1])
+    (x2, y2) = (x1[next_points], y1[next_points])
+
+    def adjacent(firsts, seconds):
+        return(
+            (next_points[firsts] == seconds) | (next_points[seconds] == firsts)
+        )
+
+    (firsts, seconds, t, u, crossing_x, crossing_y, cross) = \
+        segment_crossings(x1, y1, x2, y2, adjacent)
+             # crossings along each segment, with the winding change on its left
+    crossings = {}
+    crossing_points = list(zip(crossing_x.tolist(), crossing_y.tolist()))
+    for (first, second, first_t, second_u, point, sign) in zip(
+        firsts.tolist(), seconds.tolist(), t.tolist(), u.tolist(),
+        crossing_points, cross.tolist()
+    ) :
+        crossings.setdefault(first, []).append(
+            (first_t, point, 1 if sign < 0 else -1)
+        )
+        crossings.setdefault(second, []).append(
+            (second_u, point, -1 if sign < 0 else 1)
+        )
+                                    # walk along each ring from its lowest point
+    point_list = [tuple(point) for point in points.tolist()]
+    edges = {}
+    for (ring_index, ring) in enumerate(rings) :
+        (start, end) = (
+            int(ring_starts[ring_index]), int(ring_starts[ring_index+1])
+        )
+        lowest = min(range(start, end), key=lambda index:
+            (point_list[index][1], point_list[index][0])
+        )
+        others = ring_indexes != ring_index
+        winding = winding_number(
+            point_list[lowest][0], point_list[lowest][1],
+            x1[others], y1[others], x2[others], y2[others]
+        )
+        previous = lowest - 1 if lowest > start else end - 1
+        winding += lowest_edge_winding(
+            point_list[previous], point_list[lowest],
+            point_list[int(next_points[lowest])]
+        )
+        for offset in range(end - start) :
+            segment = start + (lowest - start + offset) % (end - start)
+            point = point_list[segment]
+            for (parameter, crossing_point, change) in sorted(
+                crossings.get(segment, [])
+            ) :
+                if (winding == 1) and (crossing_point != point) :
+                    edges.setdefault(point, []).append(crossing_point)
+                (point, winding) = (crossing_point, winding + change)
+            following = point_list[int(next_points[segment])]
+            if (winding == 1) and (following != point) :
+                edges.setdefault(point, []).append(following)
+
+    return(link_edges(edges, dict(zip(point_list, exact_points))))
+
+# ..............................................................................
+          # winding on the left of the edge leaving the lowest point of its ring
+def lowest_edge_winding(previous, lowest, following):
+    leaving_angle = math.atan2(
+        following[1] - lowest[1], following[0] - lowest[0]
+    )
+    arriving_angle = math.atan2(
+        previous[1] - lowest[1], previous[0] - lowest[0]
+    )
+
+    return(1 if arriving_angle > leaving_angle else 0)
+
+# ..............................................................................
+                    # rings linked from edges given as start point to end points
+def link_edges(edges, exact_points=None):
+    if exact_points is None :
+        exact_points = {}
+    rings = []
+    while edges :
+        start = next(iter(edges))
+        ring = []
+        point = start
+        while point in edges :
+            ring.append(list(exact_points.get(point, point)))
+            ends = edges[point]
+            following = ends.pop()
+            if not ends :
+                del edges[point]
+            point = following
+            if point == start :
+                break
+        ring = clean_ring(ring)
+        if abs(signed_area(ring)) > EPSILON :
+            rings.append(ring)
+
+    return(rings)
+
+# ==============================================================================
+                                                                    # offsetting
+# ..............................................................................
+         # rings of a region grown by a distance, shrunk for a negative distance
+def offset_rings(
+    rings, distance, join='miter', arc_tolerance=DEFAULT_ARC_TOLERANCE
+):
+    rings = [clean_ring(ring) for ring in rings]
+    rings = [ring for ring in rings if ring]
+    if distance == 0 :
+        return(rings)
+
+    return(positive_union([
+        raw_offset(ring, distance, join, arc_tolerance) for ring in rings
+    ]))
+
+# ..............................................................................
+                     # single ring moved by a distance to the right of its edges
+#
+# This is the expansion of a counterclockwise outline. The largest ring of
+# the result is returned, starting close to the original start point.
+#
+def offset_ring(
+    ring, distance, join='miter', arc_tolerance=DEFAULT_ARC_TOLERANCE
+):
+    ring = clean_ring(ring)
+    if not ring :
+        return([])
+    clockwise = signed_area(ring) < 0
+    if clockwise :
+        (ring, distance) = (ring[::-1], -distance)
+    raw = raw_offset(ring, distance, join, arc_tolerance)
+    offset = positive_union([raw])
+    if not offset :
+        return([])
+    offset = max(offset, key=signed_area)
+    if clockwise :
+        (raw, offset) = (raw[::-1], offset[::-1])
+                       # keep the original start point when nothing was cut away
+    if len(offset) != len(clean_ring(raw)) :
+        (x, y) = raw[0]
+        start = min(range(len(offset)), key=lambda index:
+            math.hypot(offset[index][0] - x, offset[index][1] - y)
+        )
+        offset = offset[start:] + offset[:start]
+    else :
+        offset = clean_ring(raw)
+
+    return(offset)
@@ -0,0 +1,319 @@
+import math
+import gcode_lib
+import gcode_parser
+
+# ==============================================================================
+                                                                     # constants
+AXES = ('X', 'Y', 'Z')
+MOTION_CODES = {0 : 'G0', 1 : 'G1', 2 : 'G2', 3 : 'G3'}
+MOTION_LETTERS = frozenset('XYZIJF')
+                             # G-words and letters leaving the motions unchanged
+          # units, tool length offsets and coordinate systems change the meaning
+      # of the following coordinates and make the optimiser forget the positions
+INERT_G_CODES = frozenset((4, 17, 40, 90, 91, 92, 94))
+INERT_LETTERS = frozenset('TMSPN')
+                             # merged segments deviation and coordinate decimals
+DEFAULT_TOLERANCE = 1E-3
+DEFAULT_DECIMALS = 3
+
+# ==============================================================================
+                                                                     # optimiser
+# ..............................................................................
+                                              # number without superfluous zeros
+def format_number(value, decimals):
+    text = "%.*f" % (decimals, value)
+    if '.' in text :
+        text = text.rstrip('0').rstrip('.')
+    if text in ('-0', '') :
+        text = '0'
+
+    return(text)
+
+# ..............................................................................
+                                  # streaming peephole optimiser of g-code lines
+#
+# Motion lines are rewritten with:
+#   - the feed only where it changes, G0 feeds being dropped altogether
+#     with drop_rapid_feeds
+#   - the axis words which move, unchanged absolute coordinates being left
+#     out
+#   - the coordinates rounded to the given decimals, relative displacements
+#     being rounded from the exact positions for the errors not to add up
+# and zero-length G0 and G1 moves are dropped. Consecutive G0 or G1 moves
+# at the same height and feed are merged while the points they leave out
+# stay within tolerance of the merged segment.
+#
+# The other lines are kept. Lines the optimiser does not follow, such as
+# o-word control flow, make it forget the positions and feed, as the
+# following moves may run from elsewhere.
+#
+class PeepholeOptimiser:
+
+    def __init__(
+        self,
+        tolerance=DEFAULT_TOLERANCE, decimals=DEFAULT_DECIMALS,
+        strip_comments=False, drop_rapid_feeds=False
+    ):
+        self.tolerance = tolerance
+        self.decimals = decimals
+        self.strip_comments = strip_comments
+        self.drop_rapid_feeds = drop_rapid_feeds
+        self.absolute_mode = True
+        self.reset()
+        self.input_line_nb = 0
+        self.input_byte_nb = 0
+        self.line_nb = 0
+        self.byte_nb = 0
+        self.merged_move_nb = 0
+        self.dropped_move_nb = 0
+
+                                             # forget the positions and the feed
+    def reset(self):
+        self.position = dict.fromkeys(AXES)
+        self.emitted = dict.fromkeys(AXES)
+        self.local_axes = set()
+        self.feed = None
+        self.emitted_feed = None
+        self.run = None
+
+                                         # optimised lines of g-code line pieces
+    def optimise(self, g_code_pieces):
+        for g_code in g_code_pieces :
+            for line in g_code.splitlines() :
+                self.input_line_nb += 1
+                self.input_byte_nb += gcode_lib.byte_length(line) + 1
+                for output_line in self.process(line) :
+                    self.line_nb += 1
+                    self.byte_nb += gcode_lib.byte_length(output_line)
+                    yield output_line
+        for output_line in self.flush() :
+            self.line_nb += 1
+            self.byte_nb += gcode_lib.byte_length(output_line)
+            yield output_line
+
+                                                     # optimised lines of a line
+    def process(self, line):
+        (g_codes, values) = gcode_parser.tokenize(line)
+        is_motion = (len(g_codes) == 1) and (g_codes[0] in MOTION_CODES) \
+            and MOTION_LETTERS.issuperset(values) \
+            and ('(' not in line) and (';' not in line)
+        if is_motion :
+            yield from self.move(MOTION_CODES[g_codes[0]], values)
+            return
+        yield from self.flush()
+        stripped = line.strip()
+        is_comment = (not stripped) or stripped.startswith((';', '('))
+        if not (self.strip_comments and is_comment) :
+            yield line + "\n"
+        if not is_comment :
+            self.follow(g_codes, values)
+
+                                   # update the state with a line kept unchanged
+    def follow(self, g_codes, values):
+        if 'O' in values :
+            self.reset()
+            return
+        if 90 in g_codes :
+            self.absolute_mode = True
+            for axis in self.local_axes :
+                self.position[axis] = None
+                self.emitted[axis] = None
+            self.local_axes.clear()
+        if 91 in g_codes :
+            self.absolute_mode = False
+        if 92 in g_codes :
+            for axis in AXES :
+                if axis in values :
+                    self.position[axis] = values[axis]
+                    self.emitted[axis] = values[axis]
+                    self.local_axes.discard(axis)
+        if 'F' in values :
+            self.feed = values['F']
+            self.emitted_feed = values['F']
+        letters = INERT_LETTERS | {'F'}
+        if 92 in g_codes :
+            letters |= set(AXES)
+        if not (
+            INERT_G_CODES.issuperset(g_codes) and letters.issuperset(values)
+        ) :
+            self.reset()
+
+                                                        # exact target of a move
+    def target(self, values):
+        target = {}
+        for axis in AXES :
+            if self.absolute_mode :
+                target[axis] = values.get(axis, self.position[axis])
+            else :
+                if self.position[axis] is None :
+                    self.position[axis] = 0
+                    self.emitted[axis] = 0
+                    self.local_axes.add(axis)
+                target[axis] = self.position[axis] + values.get(axis, 0)
+
+        return(target)
+
+                                              # optimised lines of a motion line
+    def move(self, kind, values):
+        if 'F' in values :
+            self.feed = values['F']
+        start = self.position
+        target = self.target(values)
+        self.position = target
+        if kind in ('G2', 'G3') :
+            yield from self.flush()
+            yield from self.emit(
+                kind, target, self.feed,
+                (start, values.get('I', 0), values.get('J', 0))
+            )
+            return
+                                                        # drop zero-length moves
+        if target == start :
+            self.dropped_move_nb += 1
+            return
+                                                      # merge collinear segments
+        if self.extend_run(kind, start, target) :
+            self.merged_move_nb += 1
+            return
+        yield from self.flush()
+        self.run = {
+            'kind' : kind, 'feed' : self.feed,
+            'start' : start, 'end' : target,
+            'reference' : None, 'low' : -math.pi, 'high' : math.pi,
+            'max_distance' : 0
+        }
+        if None not in (start['X'], start['Y'], target['X'], target['Y']) :
+            self.run['reference'] = math.atan2(
+                target['Y'] - start['Y'], target['X'] - start['X']
+            )
+
+                            # extend the pending run of moves up to a new target
+#
+# The directions from the run start which keep the intermediate points
+# within tolerance of the merged segment form an interval, narrowed by
+# each new point. The points must also get further away from the start.
+#
+    def extend_run(self, kind, start, target):
+        run = self.run
+        if (run is None) or (run['reference'] is None) :
+            return(False)
+        if (kind != run['kind']) or (self.feed != run['feed']) :
+            return(False)
+        run_start = run['start']
+        if not (run_start['Z'] == start['Z'] == target['Z']) :
+            return(False)
+        if None in (target['X'], target['Y']) :
+            return(False)
+        (x0, y0) = (run_start['X'], run_start['Y'])
+        start_distance = math.hypot(start['X'] - x0, start['Y'] - y0)
+        max_distance = max(run['max_distance'], start_distance)
+        if math.hypot(target['X'] - x0, target['Y'] - y0) < max_distance :
+            return(False)
+        (low, high) = (run['low'], run['high'])
+        if start_distance > self.tolerance :
+            angle = self.relative_angle(start['X'] - x0, start['Y'] - y0)
+            spread = math.asin(self.tolerance/start_distance)
+            low = max(low, angle - spread)
+            high = min(high, angle + spread)
+        angle = self.relative_angle(target['X'] - x0, target['Y'] - y0)
+        if not (low <= angle <= high) :
+            return(False)
+        run.update(
+            end=target, low=low, high=high, max_distance=max_distance
+        )
+
+        return(True)
+
+                                       # direction relative to the run reference
+    def relative_angle(self, dx, dy):
+        angle = math.atan2(dy, dx) - self.run['reference']
+
+        return((angle + math.pi) % (2*math.pi) - math.pi)
+
+                                                          # emit the pending run
+    def flush(self):
+        if self.run is not None :
+            run = self.run
+            self.run = None
+            yield from self.emit(run['kind'], run['end'], run['feed'])
+
+                                                    # line of a move to a target
+#
+# The arc centers are given from the start point as offsets I and J, which
+# are corrected by the rounding error of the emitted start point.
+#
+    def emit(self, kind, target, feed, arc=None):
+        emitted_start = dict(self.emitted)
+        words = []
+        for axis in AXES :
+            value = target[axis]
+            if value is None :
+                continue
+            value = round(value, self.decimals)
+            if self.absolute_mode :
+                if value == self.emitted[axis] :
+                    continue
+                word_value = value
+            else :
+                word_value = round(value - self.emitted[axis], self.decimals)
+                if word_value == 0 :
+                    continue
+            self.emitted[axis] = value
+            words.append(axis + format_number(word_value, self.decimals))
+        if arc is not None :
+                    # controllers reject arcs without any axis word in the plane
+            if not any(word[0] in 'XY' for word in words) :
+                for axis in ('X', 'Y') :
+                    if not self.absolute_mode :
+                        words.insert(0, axis + format_number(0, self.decimals))
+                        break
+                    if self.emitted[axis] is not None :
+                        words.insert(0, axis + format_number(
+                            self.emitted[axis], self.decimals
+                        ))
+                        break
+            (start, i, j) = arc
+            for (letter, axis, offset) in (('I', 'X', i), ('J', 'Y', j)) :
+                if None not in (start[axis], emitted_start[axis]) :
+                    offset += start[axis] - emitted_start[axis]
+                words.append(letter + format_number(offset, self.decimals))
+        elif not words :
+            self.dropped_move_nb += 1
+            return
+        if (kind == 'G0') and self.drop_rapid_feeds :
+            pass
+        elif (feed is not None) and (feed != self.emitted_feed) :
+            words.append("f%g" % feed)
+            self.emitted_feed = feed
+        yield kind + ' ' + ' '.join(words) + "\n"
+
+                                                # line and byte counts reduction
+    def report(self):
+        return(
+            "%d lines instead of %d (%+.1f %%), " % (
+                self.line_nb, self.input_line_nb,
+                percentage(self.line_nb, self.input_line_nb)
+            ) +
+            "%d bytes instead of %d (%+.1f %%), " % (
+                self.byte_nb, self.input_byte_nb,
+                percentage(self.byte_nb, self.input_byte_nb)
+            ) +
+            "%d moves merged, %d moves dropped" % (
+                self.merged_move_nb, self.dropped_move_nb
+            )
+        )
+
+# ..............................................................................
+                                                    # relative change of a count
+def percentage(count, reference):
+    return(100*(count - reference)/max(reference, 1))
+
+# ..............................................................................
+                                        # g-code file optimised into another one
+def optimise_gcode_file(input_file_spec, output_file_spec, **options):
+    optimiser = PeepholeOptimiser(**options)
+    with open(input_file_spec) as input_file :
+        with gcode_lib.open_gcode_writer(output_file_spec) as writer :
+            writer.write_lines(optimiser.optimise(input_file))
+
+    return(optimiser)
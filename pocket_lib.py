@@ -0,0 +1,272 @@
+import math
+import numpy
+import offset_lib
+import polygon_lib
+
+# ==============================================================================
+                                                                     # constants
+PATTERNS = ('zigzag', 'contour')
+LINK_MARGIN = 1E-6
+SCANLINE_MARGIN = 1E-3
+
+# ==============================================================================
+                                                            # tool center region
+# ..............................................................................
+                         # ring cleaned and turned counterclockwise or clockwise
+def oriented_ring(ring, counterclockwise=True):
+    ring = offset_lib.clean_ring(ring)
+    if (offset_lib.signed_area(ring) > 0) != counterclockwise :
+        ring = ring[::-1]
+
+    return(ring)
+
+# ..............................................................................
+                # region where the tool center stays inside the pocket, as rings
+def tool_region(
+    polygon, holes=(), tool_radius=0,
+    arc_tolerance=offset_lib.DEFAULT_ARC_TOLERANCE
+):
+    rings = [oriented_ring(polygon)]
+    rings += [oriented_ring(hole, counterclockwise=False) for hole in holes]
+
+    return(offset_lib.offset_rings(
+        [ring for ring in rings if ring], -tool_radius, 'arc', arc_tolerance
+    ))
+
+# ..............................................................................
+                           # rings prepared for crossing and containment queries
+def prepare_region(rings):
+    return(polygon_lib.PreparedPolygon(rings[0], rings[1:], closed=True))
+
+# ==============================================================================
+                                                                # zig-zag passes
+# ..............................................................................
+    # inside intervals of horizontal scanlines, as line index, x start and x end
+#
+# All scanlines are intersected with the region at once, and the sorted
+# crossings of each line are paired by parity.
+#
+def scan_intervals(prepared, y_values, x_min, x_max):
+    segments = numpy.column_stack((
+        numpy.full(len(y_values), x_min - 1), y_values,
+        numpy.full(len(y_values), x_max + 1), y_values
+    ))
+    (lines, edges, t, x, y) = prepared.intersections(segments)
+    line_starts = numpy.searchsorted(lines, numpy.arange(len(y_values) + 1))
+    counts = numpy.diff(line_starts)
+    positions = numpy.arange(len(lines)) - line_starts[lines]
+    first = (positions % 2 == 0) & \
+        (positions < counts[lines] - counts[lines] % 2)
+    starts = numpy.flatnonzero(first)
+
+    return(lines[starts], x[starts], x[starts + 1])
+
+# ..............................................................................
+                                 # scanline intervals chained into zig-zag paths
+#
+# Each path going on from one line takes the free interval of the next
+# line which overlaps its last interval, entering it at the same side as
+# it left the previous one. The other intervals start new paths. The paths
+# are then split at the steps between lines which leave the link region,
+# all checked at once. The scanlines are moved off the vertex heights by
+# SCANLINE_MARGIN, so that they run along no horizontal edge.
+#
+def zigzag_paths(prepared, link_region, rings, step):
+    points = numpy.array([point for ring in rings for point in ring])
+    ((x_min, y_min), (x_max, y_max)) = (points.min(axis=0), points.max(axis=0))
+    line_nb = max(math.ceil((y_max - y_min)/step) - 1, 0)
+    y_values = y_min + (numpy.arange(line_nb) + 1)*(y_max - y_min)/(line_nb + 1)
+    vertex_y = numpy.unique(points[:, 1])
+    below = numpy.clip(
+        numpy.searchsorted(vertex_y, y_values) - 1, 0, len(vertex_y) - 1
+    )
+    above = numpy.minimum(below + 1, len(vertex_y) - 1)
+    nearest = numpy.where(
+        y_values - vertex_y[below] < vertex_y[above] - y_values,
+        vertex_y[below], vertex_y[above]
+    )
+    y_values = numpy.where(
+        abs(y_values - nearest) < SCANLINE_MARGIN,
+        nearest + numpy.where(y_values < nearest, -1, 1)*SCANLINE_MARGIN,
+        y_values
+    )
+    (lines, starts, ends) = scan_intervals(prepared, y_values, x_min, x_max)
+    line_starts = numpy.searchsorted(lines, numpy.arange(line_nb + 1)).tolist()
+    (lines, starts, ends) = (lines.tolist(), starts.tolist(), ends.tolist())
+    y_values = y_values.tolist()
+    paths = []
+    steps = []
+    open_paths = []
+    for line in range(line_nb) :
+        y = y_values[line]
+        intervals = list(range(line_starts[line], line_starts[line+1]))
+        free = set(intervals)
+        next_open_paths = []
+        for (path_index, interval) in open_paths :
+            path = paths[path_index]
+            (x_end, y_end) = path[-1]
+            overlapping = [
+                index for index in intervals if (index in free) and
+                    (starts[index] <= ends[interval]) and
+                    (ends[index] >= starts[interval])
+            ]
+            if not overlapping :
+                continue
+            index = min(overlapping, key=lambda index:
+                min(abs(starts[index] - x_end), abs(ends[index] - x_end))
+            )
+            free.discard(index)
+            steps.append((path_index, len(path)))
+            if x_end == ends[interval] :
+                path += [[ends[index], y], [starts[index], y]]
+            else :
+                path += [[starts[index], y], [ends[index], y]]
+            next_open_paths.append((path_index, index))
+        for index in intervals :
+            if index in free :
+                paths.append([[starts[index], y], [ends[index], y]])
+                next_open_paths.append((len(paths) - 1, index))
+        open_paths = next_open_paths
+                                              # paths split at the outside steps
+    inside = inside_links([
+        paths[path_index][position-1:position+1]
+            for (path_index, position) in steps
+    ], link_region)
+    cuts = [[0] for path in paths]
+    for ((path_index, position), is_inside) in zip(steps, inside.tolist()) :
+        if not is_inside :
+            cuts[path_index].append(position)
+    split_paths = []
+    for (path, path_cuts) in zip(paths, cuts) :
+        path_cuts.append(len(path))
+        split_paths += [
+            path[start:end] for (start, end) in zip(path_cuts, path_cuts[1:])
+        ]
+
+    return(split_paths)
+
+# ==============================================================================
+                                                       # contour-parallel passes
+# ..............................................................................
+               # rings of the region shrunk by successive steps, innermost first
+#
+# The inner levels are offset from the region simplified within half the
+# arc tolerance, which keeps them fast to compute on detailed outlines.
+#
+def contour_rings(rings, step, arc_tolerance=offset_lib.DEFAULT_ARC_TOLERANCE):
+    simplified = [
+        polygon_lib.simplify_points(ring, arc_tolerance/2, closed=True).tolist()
+            for ring in rings
+    ]
+    levels = [rings]
+    while True :
+        level = offset_lib.offset_rings(
+            simplified, -step*len(levels), 'arc', arc_tolerance
+        )
+        if not level :
+            break
+        levels.append(level)
+
+    return([ring for level in levels[::-1] for ring in level])
+
+# ==============================================================================
+                                                     # path ordering and linking
+# ..............................................................................
+                           # paths in nearest neighbour order from a start point
+#
+# Open paths can be run backwards, closed rings start at their vertex
+# nearest to the previous end and come back to it.
+#
+def order_paths(paths, rings=(), start=(0, 0)):
+    (x, y) = start
+    ordered = []
+    remaining = list(paths)
+    while remaining :
+        ends = numpy.array([
+            [path[0], path[-1]] for path in remaining
+        ]).reshape(-1, 2, 2)
+        distances = numpy.hypot(ends[:, :, 0] - x, ends[:, :, 1] - y)
+        (index, side) = numpy.unravel_index(distances.argmin(), distances.shape)
+        path = remaining.pop(int(index))
+        if side == 1 :
+            path = path[::-1]
+        ordered.append(path)
+        (x, y) = path[-1]
+    for ring in rings :
+        ring_points = numpy.asarray(ring)
+        nearest = int(numpy.hypot(
+            ring_points[:, 0] - x, ring_points[:, 1] - y
+        ).argmin())
+        path = ring[nearest:] + ring[:nearest+1]
+        ordered.append(path)
+        (x, y) = path[-1]
+
+    return(ordered)
+
+# ..............................................................................
+                           # links, as point pairs, which stay inside the region
+#
+# A link is inside when it crosses no boundary of the tool center region
+# grown by LINK_MARGIN and its middle point lies inside, so that links
+# along the walls are kept too.
+#
+def inside_links(links, link_region):
+    links = numpy.array(links, dtype=numpy.float64).reshape(-1, 2, 2)
+    indexes = link_region.intersections(links)[0]
+    inside = numpy.bincount(indexes, minlength=len(links)) == 0
+    inside &= link_region.contains(links.mean(axis=1))
+
+    return(inside)
+
+# ..............................................................................
+             # consecutive paths joined where the link between them stays inside
+def link_paths(paths, link_region):
+    if len(paths) < 2 :
+        return(paths)
+    inside = inside_links([
+        [path[-1], next_path[0]] for (path, next_path) in zip(paths, paths[1:])
+    ], link_region)
+    linked = [list(paths[0])]
+    for (path, is_inside) in zip(paths[1:], inside.tolist()) :
+        if is_inside :
+            linked[-1] += path
+        else :
+            linked.append(list(path))
+
+    return(linked)
+
+# ==============================================================================
+                                                               # pocket clearing
+# ..............................................................................
+                               # tool center paths clearing a polygon with holes
+#
+# The passes are spaced by the stepover fraction of the tool diameter. The
+# zig-zag pattern ends with a contour along the walls. The paths are lists
+# of points, to be cut without lifting the tool.
+#
+def pocket_paths(
+    polygon, holes=(), tool_diameter=1, stepover=0.5, pattern='zigzag',
+    start=(0, 0), arc_tolerance=offset_lib.DEFAULT_ARC_TOLERANCE
+):
+    if pattern not in PATTERNS :
+        raise ValueError("unknown pocket pattern \"%s\"" % pattern)
+    if not 0 < stepover <= 1 :
+        raise ValueError("stepover must be within ]0, 1]")
+    step = stepover*tool_diameter
+    rings = tool_region(polygon, holes, tool_diameter/2, arc_tolerance)
+    if not rings :
+        return([])
+    prepared = prepare_region(rings)
+    link_region = prepare_region(offset_lib.offset_rings(rings, LINK_MARGIN))
+    if pattern == 'zigzag' :
+        paths = order_paths(
+            zigzag_paths(prepared, link_region, rings, step), start=start
+        )
+        end = paths[-1][-1] if paths else start
+        paths += order_paths([], rings, end)
+    else :
+        paths = order_paths(
+            [], contour_rings(rings, step, arc_tolerance), start
+        )
+
+    return(link_paths(paths, link_region))
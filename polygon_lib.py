@@ -0,0 +1,504 @@
+import numpy
+
+# ==============================================================================
+                                                                     # constants
+CHUNK_SIZE = 64*1024
+EDGES_PER_CELL = 2
+MAX_CELL_SPAN = 4096
+QUERY_BLOCK_SIZE = 4096
+CELL_MARGIN = 1E-9
+               # reference point of the grid cells, in cell units, away from the
+                     # cell center and diagonals which grid-aligned edges follow
+REFERENCE_POINT = (0.4142135623730951, 0.5772156649015329)
+
+# ==============================================================================
+                                                             # affine transforms
+# ..............................................................................
+                                             # 3x3 matrix of an affine transform
+def affine_matrix(xx=1, xy=0, yx=0, yy=1, delta_x=0, delta_y=0):
+    return(numpy.array([
+        [xx, xy, delta_x],
+        [yx, yy, delta_y],
+        [0 , 0 , 1      ],
+    ], dtype=numpy.float64))
+
+# ..............................................................................
+                                  # apply an affine transform to an (N, 2) array
+def apply_matrix(points, matrix):
+    if matrix is None :
+        return(points)
+    transformed = points @ matrix[:2, :2].T
+    transformed += matrix[:2, 2]
+
+    return(transformed)
+
+# ==============================================================================
+                                                         # array-backed polygons
+# ..............................................................................
+                                     # polygon stored as an (N, 2) float64 array
+#
+# Transforms are not applied to the coordinates straight away: they are
+# composed into a single 3x3 matrix which is applied in one pass when the
+# coordinates are consumed. The few points appended by extract_offset are
+# kept apart, already transformed.
+#
+class Polygon:
+
+    def __init__(self, coordinates=(), matrix=None, tail=None, bounds=None):
+        if isinstance(coordinates, Polygon) :
+            coordinates = coordinates.points
+        self.source = numpy.asarray(coordinates, dtype=numpy.float64)
+        self.source = self.source.reshape(-1, 2)
+        self.matrix = matrix
+        self.tail = tail
+        self.bounds = bounds
+        self.cached_points = None
+
+                           # derived polygon sharing the same source coordinates
+    def transformed(self, matrix):
+        tail = self.tail
+        if tail is not None :
+            tail = apply_matrix(tail, matrix)
+        if self.matrix is not None :
+            matrix = matrix @ self.matrix
+        return(Polygon(self.source, matrix, tail, self.bounds))
+
+                                       # coordinates with the transforms applied
+    @property
+    def points(self):
+        if self.cached_points is None :
+            self.cached_points = apply_matrix(self.source, self.matrix)
+            if self.tail is not None :
+                self.cached_points = numpy.vstack(
+                    (self.cached_points, self.tail)
+                )
+        return(self.cached_points)
+
+                                                       # list-of-lists interface
+    def __len__(self):
+        length = len(self.source)
+        if self.tail is not None :
+            length += len(self.tail)
+        return(length)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) :
+            return(Polygon(self.points[index]))
+        if self.cached_points is None :
+            if index < 0 :
+                index += len(self)
+            if 0 <= index < len(self.source) :
+                point = self.source[index:index+1]
+                return(apply_matrix(point, self.matrix)[0].tolist())
+        return(self.points[index].tolist())
+
+                                  # transform chunk by chunk to keep memory flat
+    def __iter__(self):
+        if self.cached_points is not None :
+            yield from self.cached_points.tolist()
+        else :
+            for start in range(0, len(self.source), CHUNK_SIZE) :
+                yield from apply_matrix(
+                    self.source[start:start+CHUNK_SIZE], self.matrix
+                ).tolist()
+            if self.tail is not None :
+                yield from self.tail.tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None :
+            return(self.points)
+        return(self.points.astype(dtype))
+
+    def __repr__(self):
+        return("Polygon(%s)" % self.points.tolist())
+
+    def tolist(self):
+        return(self.points.tolist())
+
+# ..............................................................................
+                                                                    # transforms
+                                                      # generic affine transform
+    def transform(self, matrix):
+        return(self.transformed(numpy.asarray(matrix, dtype=numpy.float64)))
+
+                                             # flip vertically around the x-axis
+    def flip_vertical(self):
+        return(self.transformed(affine_matrix(yy=-1)))
+
+                                           # flip horizontally around the y-axis
+    def flip_horizontal(self):
+        return(self.transformed(affine_matrix(xx=-1)))
+
+                                                   # offset by a constant vector
+    def offset(self, delta_x, delta_y):
+        return(self.transformed(affine_matrix(
+            delta_x=delta_x, delta_y=delta_y
+        )))
+
+                                                          # scale by x-y factors
+    def scale(self, scale_x, scale_y=0):
+        if scale_y == 0 :
+            scale_y = scale_x
+        return(self.transformed(affine_matrix(xx=scale_x, yy=scale_y)))
+
+                                               # rotate around coordinate [0, 0]
+    def rotate(self, angle):
+        (cosine, sine) = (numpy.cos(angle), numpy.sin(angle))
+        return(self.transformed(affine_matrix(cosine, -sine, sine, cosine)))
+
+                                                       # min and max coordinates
+    def min_max(self):
+        if self.cached_points is not None :
+            points = self.cached_points
+                         # flips, offsets and scales map the source bounding box
+        elif (self.matrix is None) or                                   \
+            (self.matrix[0, 1] == 0 and self.matrix[1, 0] == 0)         \
+        :
+            if self.bounds is None :
+                self.bounds = numpy.array([
+                    self.source.min(axis=0), self.source.max(axis=0)
+                ])
+            points = apply_matrix(self.bounds, self.matrix)
+            if self.tail is not None :
+                points = numpy.vstack((points, self.tail))
+        else :
+            points = self.points
+        (x_min, y_min) = points.min(axis=0).tolist()
+        (x_max, y_max) = points.max(axis=0).tolist()
+        return(x_min, y_min, x_max, y_max)
+
+                                  # extract first coordinate and offset the rest
+    def extract_offset(self, close_shape=True):
+                   # points all in the tail, an empty polygon has no first point
+        if len(self.source) == 0 :
+            if len(self) == 0 :
+                raise IndexError("empty polygon has no first coordinate")
+            return(Polygon(self.points).extract_offset(close_shape))
+        (x_offset, y_offset) = self[0]
+        extracted = self.transformed(affine_matrix(
+            delta_x=-x_offset, delta_y=-y_offset
+        ))
+           # the first point is dropped, the closing point is exactly the origin
+        extracted.source = self.source[1:]
+        extracted.bounds = None
+        if close_shape :
+            closing_point = numpy.zeros((1, 2))
+            if extracted.tail is None :
+                extracted.tail = closing_point
+            else :
+                extracted.tail = numpy.vstack((extracted.tail, closing_point))
+        return(x_offset, y_offset, extracted)
+
+                                                  # simplified within a distance
+    def simplify(self, tolerance, closed=False):
+        return(Polygon(simplify_points(self.points, tolerance, closed)))
+
+# ==============================================================================
+                                                       # polyline simplification
+# ..............................................................................
+                            # points kept by the Ramer-Douglas-Peucker algorithm
+#
+# The distances of all points of a span to its chord are computed at once,
+# and the span is split at the farthest point until every point lies within
+# tolerance of the chord of its span.
+#
+def simplification_mask(points, tolerance):
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(points)-1)]
+    while spans :
+        (first, last) = spans.pop()
+        if last - first < 2 :
+            continue
+        chord = points[last] - points[first]
+        offsets = points[first+1:last] - points[first]
+        chord_length = numpy.hypot(chord[0], chord[1])
+        if chord_length > 0 :
+            distances = numpy.abs(
+                chord[0]*offsets[:, 1] - chord[1]*offsets[:, 0]
+            ) / chord_length
+        else :
+            distances = numpy.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(numpy.argmax(distances))
+        if distances[farthest] > tolerance :
+            split = first + 1 + farthest
+            keep[split] = True
+            spans.append((first, split))
+            spans.append((split, last))
+
+    return(keep)
+
+# ..............................................................................
+                                   # simplified polyline, or polygon when closed
+def simplify_points(points, tolerance, closed=False):
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    if len(points) < 3 :
+        return(points)
+    if closed :
+        ring = numpy.vstack((points, points[:1]))
+        return(ring[simplification_mask(ring, tolerance)][:-1])
+
+    return(points[simplification_mask(points, tolerance)])
+
+# ==============================================================================
+                                                             # prepared polygons
+# ..............................................................................
+         # polygon edges indexed in a uniform grid for many intersection queries
+#
+# The edges go from each point to the next one, with a closing edge for a
+# closed polygon, followed by the closed hole rings. Each edge is entered in
+# the grid cells it passes through, and a query segment is only tested
+# against the edges of its own cells.
+#
+# An edge crosses a segment when its ends lie on different sides of the
+# segment's line, an end on the line counting on the left side. Vertices
+# on a scanline are so counted once, edges along it never, and no slopes
+# are needed for vertical or horizontal segments.
+#
+class PreparedPolygon:
+
+    def __init__(self, polygon, holes=(), closed=False):
+        rings = [(numpy.asarray(polygon, dtype=numpy.float64), closed)]
+        rings += [
+            (numpy.asarray(hole, dtype=numpy.float64), True) for hole in holes
+        ]
+        (starts, ends) = ([], [])
+        for (points, is_closed) in rings :
+            points = points.reshape(-1, 2)
+            if len(points) < 2 :
+                continue
+            starts.append(points[:-1])
+            ends.append(points[1:])
+            if is_closed :
+                starts.append(points[-1:])
+                ends.append(points[:1])
+        if starts :
+            (starts, ends) = (numpy.vstack(starts), numpy.vstack(ends))
+        else :
+            (starts, ends) = (numpy.zeros((0, 2)), numpy.zeros((0, 2)))
+        (self.x1, self.y1) = (starts[:, 0], starts[:, 1])
+        (self.x2, self.y2) = (ends[:, 0], ends[:, 1])
+        self.build_grid()
+        self.center_inside = None
+
+    def __len__(self):
+        return(len(self.x1))
+
+                      # cell size for a few edges per cell, edges sorted by cell
+    def build_grid(self):
+        if len(self) == 0 :
+            (self.origin, self.cell_size, self.shape) = ((0, 0), 1, (1, 1))
+            self.cell_starts = numpy.zeros(2, dtype=numpy.int64)
+            self.cell_edges = numpy.zeros(0, dtype=numpy.int64)
+            return
+        x = numpy.concatenate((self.x1, self.x2))
+        y = numpy.concatenate((self.y1, self.y2))
+        (x_min, y_min) = (x.min(), y.min())
+        (width, height) = (x.max() - x_min, y.max() - y_min)
+        cell_size = max(
+            numpy.sqrt(width*height*EDGES_PER_CELL/len(self)),
+            numpy.mean(
+                numpy.abs(self.x2 - self.x1) + numpy.abs(self.y2 - self.y1)
+            ),
+            max(width, height)/MAX_CELL_SPAN
+        )
+        if cell_size == 0 :
+            cell_size = 1
+        self.origin = (x_min, y_min)
+        self.cell_size = cell_size
+        self.shape = (
+            int(width/cell_size) + 1, int(height/cell_size) + 1
+        )
+        (edges, cells) = self.segment_cells(
+            self.x1, self.y1, self.x2, self.y2
+        )
+        pairs = numpy.unique(cells*len(self) + edges)
+        self.cell_edges = pairs % len(self)
+        self.cell_starts = numpy.searchsorted(
+            pairs // len(self), numpy.arange(self.shape[0]*self.shape[1] + 1)
+        )
+
+             # cells passed through by segments, as segment indexes and cell ids
+    def segment_cells(self, x1, y1, x2, y2):
+        (origin_x, origin_y) = self.origin
+        (u1, u2) = (x1 - origin_x, x2 - origin_x)
+        (v1, v2) = (y1 - origin_y, y2 - origin_y)
+        (u1, v1, u2, v2) = [
+            coordinate/self.cell_size for coordinate in (u1, v1, u2, v2)
+        ]
+        steep = numpy.abs(v2 - v1) > numpy.abs(u2 - u1)
+        (flat_indexes, columns, rows) = line_cells(
+            u1[~steep], v1[~steep], u2[~steep], v2[~steep], *self.shape
+        )
+        (steep_indexes, steep_rows, steep_columns) = line_cells(
+            v1[steep], u1[steep], v2[steep], u2[steep], *self.shape[::-1]
+        )
+        indexes = numpy.concatenate((
+            numpy.flatnonzero(~steep)[flat_indexes],
+            numpy.flatnonzero(steep)[steep_indexes]
+        ))
+        columns = numpy.concatenate((columns, steep_columns))
+        rows = numpy.concatenate((rows, steep_rows))
+
+        return(indexes, rows*self.shape[0] + columns)
+
+                           # crossings of segments given as [[x1, y1], [x2, y2]]
+#
+# Returns the segment indexes, edge indexes, positions t along the segments
+# and crossing coordinates, sorted by segment and position.
+#
+    def intersections(self, segments):
+        segments = numpy.asarray(segments, dtype=numpy.float64)
+        segments = segments.reshape(-1, 4)
+        blocks = [
+            self.block_intersections(
+                segments[start:start+QUERY_BLOCK_SIZE], start
+            ) for start in range(0, len(segments), QUERY_BLOCK_SIZE)
+        ]
+        if not blocks :
+            blocks = [self.block_intersections(segments, 0)]
+        (indexes, edges, t, x, y) = [
+            numpy.concatenate([block[field] for block in blocks])
+                for field in range(5)
+        ]
+        sorting = numpy.lexsort((t, indexes))
+
+        return(
+            indexes[sorting], edges[sorting], t[sorting],
+            x[sorting], y[sorting]
+        )
+
+    def block_intersections(self, segments, first_index):
+        (q_x1, q_y1, q_x2, q_y2) = segments.T
+                                         # candidate pairs from the shared cells
+        (indexes, cells) = self.segment_cells(q_x1, q_y1, q_x2, q_y2)
+        starts = self.cell_starts[cells]
+        counts = self.cell_starts[cells+1] - starts
+        indexes = numpy.repeat(indexes, counts)
+        edges = self.cell_edges[
+            numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts)
+                + numpy.arange(counts.sum())
+        ]
+                            # edge ends on different sides of the segment's line
+        (start_x, start_y) = (q_x1[indexes], q_y1[indexes])
+        (d_x, d_y) = (q_x2[indexes] - start_x, q_y2[indexes] - start_y)
+        (a_x, a_y) = (self.x1[edges] - start_x, self.y1[edges] - start_y)
+        (b_x, b_y) = (self.x2[edges] - start_x, self.y2[edges] - start_y)
+        crossing = (d_x*a_y - d_y*a_x >= 0) != (d_x*b_y - d_y*b_x >= 0)
+        (e_x, e_y) = (b_x - a_x, b_y - a_y)
+        with numpy.errstate(divide='ignore', invalid='ignore') :
+            t = (a_x*e_y - a_y*e_x) / (d_x*e_y - d_y*e_x)
+        crossing &= (t >= 0) & (t <= 1)
+        (indexes, edges, t) = (indexes[crossing], edges[crossing], t[crossing])
+         # coordinates along the segment keep horizontal and vertical ones exact
+        x = start_x[crossing] + t*d_x[crossing]
+        y = start_y[crossing] + t*d_y[crossing]
+                                                  # edges found in several cells
+        pairs = indexes*max(len(self), 1) + edges
+        sorting = numpy.argsort(pairs, kind='stable')
+        kept = sorting[numpy.diff(pairs[sorting], prepend=-1) != 0]
+
+        return(
+            indexes[kept] + first_index, edges[kept], t[kept], x[kept], y[kept]
+        )
+
+                                                # points inside the closed rings
+#
+# A reference point per cell, near its center, is classified once with a
+# scanline per row of cells. A point is then inside when its cell
+# reference point is and the segment between them crosses an even number
+# of edges.
+#
+    def contains(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        if self.center_inside is None :
+            self.center_inside = self.classify_centers()
+        (column_nb, row_nb) = self.shape
+        columns = numpy.floor((points[:, 0] - self.origin[0])/self.cell_size)
+        rows = numpy.floor((points[:, 1] - self.origin[1])/self.cell_size)
+        in_grid = (columns >= 0) & (columns < column_nb) & \
+            (rows >= 0) & (rows < row_nb)
+        (columns, rows) = (
+            columns[in_grid].astype(numpy.int64),
+            rows[in_grid].astype(numpy.int64)
+        )
+        segments = numpy.column_stack((
+            points[in_grid],
+            self.origin[0] + (columns + REFERENCE_POINT[0])*self.cell_size,
+            self.origin[1] + (rows + REFERENCE_POINT[1])*self.cell_size
+        ))
+        crossing_nbs = numpy.bincount(
+            self.intersections(segments)[0], minlength=len(segments)
+        )
+        inside = numpy.zeros(len(points), dtype=bool)
+        inside[in_grid] = \
+            self.center_inside[rows, columns] != (crossing_nbs % 2 == 1)
+
+        return(inside)
+
+    def classify_centers(self):
+        (column_nb, row_nb) = self.shape
+        (origin_x, origin_y) = self.origin
+        center_x = origin_x \
+            + (numpy.arange(column_nb) + REFERENCE_POINT[0])*self.cell_size
+        center_y = origin_y \
+            + (numpy.arange(row_nb) + REFERENCE_POINT[1])*self.cell_size
+        scanlines = numpy.column_stack((
+            numpy.full(row_nb, origin_x - self.cell_size), center_y,
+            numpy.full(row_nb, center_x[-1]), center_y
+        ))
+        (rows, edges, t, x, y) = self.intersections(scanlines)
+        row_starts = numpy.searchsorted(rows, numpy.arange(row_nb + 1))
+        center_inside = numpy.zeros((row_nb, column_nb), dtype=bool)
+        for row in range(row_nb) :
+            crossings = x[row_starts[row]:row_starts[row+1]]
+            center_inside[row] = \
+                numpy.searchsorted(crossings, center_x) % 2 == 1
+
+        return(center_inside)
+
+# ..............................................................................
+                   # grid cells along segments of slope at most 1, in cell units
+#
+# The cells are listed column by column. In each column a segment spans
+# two rows at most, and three once widened by CELL_MARGIN against
+# rounding, all of which are listed.
+#
+def line_cells(u1, v1, u2, v2, column_nb, row_nb):
+    swap = u1 > u2
+    (u1, u2) = (numpy.where(swap, u2, u1), numpy.where(swap, u1, u2))
+    (v1, v2) = (numpy.where(swap, v2, v1), numpy.where(swap, v1, v2))
+    first = numpy.clip(numpy.floor(u1 - CELL_MARGIN), 0, column_nb-1)
+    last = numpy.clip(numpy.floor(u2 + CELL_MARGIN), 0, column_nb-1)
+    counts = (last - first + 1).astype(numpy.int64)
+    counts[(u2 < -CELL_MARGIN) | (u1 > column_nb + CELL_MARGIN)] = 0
+    indexes = numpy.repeat(numpy.arange(len(u1)), counts)
+    columns = numpy.repeat(first, counts) + numpy.arange(counts.sum()) \
+        - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+                      # rows at both ends of the segment part within each column
+    with numpy.errstate(divide='ignore', invalid='ignore') :
+        slope = numpy.where(u2 > u1, (v2 - v1)/(u2 - u1), 0)[indexes]
+    (u_start, v_start) = (u1[indexes], v1[indexes])
+    low = numpy.maximum(u_start, columns) - u_start
+    high = numpy.minimum(u2[indexes], columns + 1) - u_start
+    (v_low, v_high) = (v_start + low*slope, v_start + high*slope)
+    flat = u2[indexes] == u_start
+    v_high = numpy.where(flat, v2[indexes], v_high)
+    first_rows = numpy.clip(
+        numpy.floor(numpy.minimum(v_low, v_high) - CELL_MARGIN), -1, row_nb
+    )
+    last_rows = numpy.clip(
+        numpy.floor(numpy.maximum(v_low, v_high) + CELL_MARGIN), -1, row_nb
+    )
+                                      # every row from the first to the last one
+    counts = (last_rows - first_rows + 1).astype(numpy.int64)
+    indexes = numpy.repeat(indexes, counts)
+    columns = numpy.repeat(columns, counts)
+    rows = numpy.repeat(first_rows, counts) + numpy.arange(counts.sum()) \
+        - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    inside = (rows >= 0) & (rows < row_nb)
+
+    return(
+        indexes[inside], columns[inside].astype(numpy.int64),
+        rows[inside].astype(numpy.int64)
+    )
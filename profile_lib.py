@@ -0,0 +1,223 @@
+import sys
+import json
+import time
+import inspect
+import importlib.util
+import functools
+import gcode_lib
+
+# ==============================================================================
+                                                                     # constants
+#
+# Profiled functions per module, with the argument naming their records.
+# The string functions of gcode_lib join their *_lines generators, which
+# are the ones instrumented.
+#
+PROFILED_FUNCTIONS = {
+    'gcode_lib' : {
+        'build_drawing_element_lines' : 'comment',
+        'build_hole_set_lines'        : 'comment',
+        'build_slit_set_lines'        : 'comment',
+        'polygon_gcode_lines'         : None
+    },
+    'text_lib' : {
+        'line_g_code' : 'line'
+    }
+}
+MOTION_CODES = ('G0', 'G1', 'G2', 'G3')
+COUNTERS = ('calls', 'seconds', 'lines', 'bytes', 'segments')
+
+# ==============================================================================
+                                                                      # counters
+                                    # counters per (function, comment) name pair
+records = {}
+                        # original functions, as (module, name, function) tuples
+originals = []
+
+# ..............................................................................
+                                               # counters of a function and name
+def record(function_name, comment):
+    key = (function_name, comment)
+    if key not in records :
+        records[key] = dict.fromkeys(COUNTERS, 0)
+
+    return(records[key])
+
+# ..............................................................................
+                                       # lines, bytes and moves of g-code pieces
+def count_g_code(counters, g_code):
+    counters['lines'] += g_code.count("\n")
+    counters['bytes'] += gcode_lib.byte_length(g_code)
+    for line in g_code.splitlines() :
+        if line.split(' ', 1)[0] in MOTION_CODES :
+            counters['segments'] += 1
+
+# ..............................................................................
+                              # record name of a call, from one of its arguments
+def call_comment(signature, comment_argument, arguments, keywords):
+    if comment_argument is None :
+        return('')
+    bound = signature.bind(*arguments, **keywords)
+    bound.apply_defaults()
+
+    comment = str(bound.arguments.get(comment_argument, ''))
+
+    return(' '.join(
+        line.strip(' ;') for line in comment.splitlines() if line.strip(' ;')
+    ))
+
+# ==============================================================================
+                                                               # instrumentation
+# ..............................................................................
+                         # generator counting and timing the pieces it generates
+def profiled_generator(function_name, function, comment_argument):
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def profiled(*arguments, **keywords):
+        counters = record(function_name, call_comment(
+            signature, comment_argument, arguments, keywords
+        ))
+        counters['calls'] += 1
+        generator = function(*arguments, **keywords)
+        while True :
+            start_time = time.perf_counter()
+            try :
+                g_code = next(generator)
+            except StopIteration :
+                counters['seconds'] += time.perf_counter() - start_time
+                return
+            counters['seconds'] += time.perf_counter() - start_time
+            count_g_code(counters, g_code)
+            yield g_code
+
+    return(profiled)
+
+# ..............................................................................
+                                       # function counting and timing its g-code
+def profiled_function(function_name, function, comment_argument):
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def profiled(*arguments, **keywords):
+        counters = record(function_name, call_comment(
+            signature, comment_argument, arguments, keywords
+        ))
+        counters['calls'] += 1
+        start_time = time.perf_counter()
+        g_code = function(*arguments, **keywords)
+        counters['seconds'] += time.perf_counter() - start_time
+        count_g_code(counters, g_code)
+
+        return(g_code)
+
+    return(profiled)
+
+# ..............................................................................
+               # replace the profiled functions of a module by instrumented ones
+def instrument(module):
+    functions = PROFILED_FUNCTIONS[module.__name__]
+    for (name, comment_argument) in functions.items() :
+        function = getattr(module, name)
+        function_name = name
+        if name.endswith('_lines') :
+            function_name = name[:-len('_lines')]
+        if inspect.isgeneratorfunction(function) :
+            profiled = profiled_generator(
+                function_name, function, comment_argument
+            )
+        else :
+            profiled = profiled_function(
+                function_name, function, comment_argument
+            )
+        originals.append((module, name, function))
+        setattr(module, name, profiled)
+
+# ..............................................................................
+            # import finder instrumenting the profiled modules imported later on
+class ImportInstrumenter:
+
+    def find_spec(self, name, path=None, target=None):
+        if name not in PROFILED_FUNCTIONS :
+            return(None)
+        sys.meta_path.remove(self)
+        try :
+            spec = importlib.util.find_spec(name)
+        finally :
+            sys.meta_path.insert(0, self)
+        if (spec is None) or (spec.loader is None) :
+            return(spec)
+        exec_module = spec.loader.exec_module
+
+        def instrumented_exec_module(module):
+            exec_module(module)
+            instrument(module)
+
+        spec.loader.exec_module = instrumented_exec_module
+
+        return(spec)
+
+import_instrumenter = ImportInstrumenter()
+
+# ..............................................................................
+                                                               # start profiling
+#
+# The module functions are replaced by instrumented ones, so that nothing
+# changes while profiling is disabled. Modules imported after enabling,
+# such as text_lib in a job script, are instrumented on import.
+#
+def enable():
+    if import_instrumenter in sys.meta_path :
+        return
+    for module_name in PROFILED_FUNCTIONS :
+        if module_name in sys.modules :
+            instrument(sys.modules[module_name])
+    sys.meta_path.insert(0, import_instrumenter)
+
+# ..............................................................................
+                              # stop profiling, restoring the original functions
+def disable():
+    if import_instrumenter in sys.meta_path :
+        sys.meta_path.remove(import_instrumenter)
+    while originals :
+        (module, name, function) = originals.pop()
+        setattr(module, name, function)
+
+# ..............................................................................
+                                                  # forget the recorded counters
+def reset():
+    records.clear()
+
+# ==============================================================================
+                                                                       # reports
+# ..............................................................................
+                                     # records, from the longest to the shortest
+def summary():
+    return([
+        dict(function=function_name, comment=comment, **counters)
+            for ((function_name, comment), counters) in sorted(
+                records.items(), key=lambda item: -item[1]['seconds']
+            )
+    ])
+
+# ..............................................................................
+                                                       # records as a text table
+def summary_table():
+    lines = ["%-22s %-24s %6s %10s %9s %10s %9s" % (
+        'function', 'comment', 'calls', 'time [ms]',
+        'lines', 'bytes', 'segments'
+    )]
+    for entry in summary() :
+        lines.append("%-22s %-24s %6d %10.3f %9d %10d %9d" % (
+            entry['function'], entry['comment'][:24], entry['calls'],
+            1E3*entry['seconds'],
+            entry['lines'], entry['bytes'], entry['segments']
+        ))
+
+    return("\n".join(lines) + "\n")
+
+# ..............................................................................
+                                                      # records into a JSON file
+def dump_json(file_specification):
+    with open(file_specification, 'w') as json_file :
+        json.dump(summary(), json_file, indent=2)
@@ -0,0 +1,426 @@
+import math
+import itertools
+import collections
+import numpy
+
+# ==============================================================================
+                                                                     # constants
+POINTS_PER_CELL = 2
+MAX_CELL_SPAN = 4096
+MAX_REFINEMENT_NB = 8
+NEIGHBOUR_NB = 8
+OR_OPT_LENGTHS = (1, 2, 3)
+MIN_GAIN = 1E-9
+
+# ==============================================================================
+                                                                  # spatial grid
+# ..............................................................................
+                 # square cells holding point indexes, for nearest point queries
+class SpatialGrid:
+
+    def __init__(self, points, indexes=None):
+        self.points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        if indexes is None :
+            indexes = range(len(self.points))
+        indexes = numpy.asarray(indexes, dtype=numpy.int64)
+        self.count = len(indexes)
+        self.initial_count = self.count
+        selected = self.points[indexes]
+        (self.x_min, self.y_min) = selected.min(axis=0).tolist()
+        (x_max, y_max) = selected.max(axis=0).tolist()
+        (width, height) = (x_max - self.x_min, y_max - self.y_min)
+     # about POINTS_PER_CELL points per occupied cell, even for clustered points
+        self.cell_size = max(
+            math.sqrt(width*height*POINTS_PER_CELL/self.count),
+            max(width, height)/math.sqrt(self.count*POINTS_PER_CELL)
+        )
+        minimal_cell_size = max(width, height)/MAX_CELL_SPAN
+        if self.cell_size == 0 :
+            (self.cell_size, minimal_cell_size) = (1.0, 1.0)
+        for refinement in range(MAX_REFINEMENT_NB) :
+            cells = numpy.floor(
+                (selected - (self.x_min, self.y_min)) / self.cell_size
+            ).astype(numpy.int64)
+            occupancy = self.count / len(numpy.unique(
+                cells[:, 0]*(cells[:, 1].max() + 1) + cells[:, 1]
+            ))
+            if (occupancy <= 4*POINTS_PER_CELL) or \
+                (self.cell_size <= minimal_cell_size) \
+            :
+                break
+            self.cell_size = max(
+                self.cell_size/math.sqrt(occupancy/POINTS_PER_CELL),
+                minimal_cell_size
+            )
+        self.column_nb = int(width/self.cell_size) + 1
+        self.row_nb = int(height/self.cell_size) + 1
+                                                                # fill the cells
+        cells = numpy.floor(
+            (selected - (self.x_min, self.y_min)) / self.cell_size
+        ).astype(numpy.int64)
+        self.cells = {}
+        for (index, column, row) in zip(
+            indexes.tolist(), cells[:, 0].tolist(), cells[:, 1].tolist()
+        ) :
+            self.cells.setdefault((column, row), []).append(index)
+        self.xs = self.points[:, 0].tolist()
+        self.ys = self.points[:, 1].tolist()
+
+    def cell(self, x, y):
+        return(
+            math.floor((x - self.x_min)/self.cell_size),
+            math.floor((y - self.y_min)/self.cell_size)
+        )
+
+    def remove(self, index):
+        cell = self.cell(self.xs[index], self.ys[index])
+        self.cells[cell].remove(index)
+        if not self.cells[cell] :
+            del self.cells[cell]
+        self.count -= 1
+
+                                     # nearest point indexes, sorted by distance
+    def nearest(self, x, y, count=1, exclude=None):
+                       # queries outside of the grid start from its closest cell
+        (column, row) = self.cell(x, y)
+        column = min(max(column, 0), self.column_nb-1)
+        row = min(max(row, 0), self.row_nb-1)
+        cell_x = self.x_min + column*self.cell_size
+        cell_y = self.y_min + row*self.cell_size
+        offset = math.hypot(
+            max(0, cell_x - x, x - cell_x - self.cell_size),
+            max(0, cell_y - y, y - cell_y - self.cell_size)
+        )
+        ring_nb = max(self.column_nb, self.row_nb) + 1
+        found = []
+        for ring in range(ring_nb) :
+       # scanning the remaining points is cheaper than scanning many empty cells
+            if (2*ring + 1)**2 > 4*self.count + 9 :
+                return(self.nearest_by_scan(x, y, count, exclude))
+            for cell in ring_cells(column, row, ring) :
+                for index in self.cells.get(cell, ()) :
+                    if index != exclude :
+                        found.append((math.hypot(
+                            self.xs[index] - x, self.ys[index] - y
+                        ), index))
+                      # points beyond this ring are farther than ring cell sizes
+            if len(found) >= count :
+                found.sort()
+                if found[count-1][0] <= ring*self.cell_size - offset :
+                    break
+        found.sort()
+
+        return([index for (distance, index) in found[:count]])
+
+    def nearest_by_scan(self, x, y, count=1, exclude=None):
+        indexes = numpy.fromiter(
+            itertools.chain.from_iterable(self.cells.values()),
+            dtype=numpy.int64, count=self.count
+        )
+        indexes = indexes[indexes != exclude]
+        steps = self.points[indexes] - (x, y)
+        distances = numpy.hypot(steps[:, 0], steps[:, 1])
+        nearest = numpy.argsort(distances, kind='stable')[:count]
+
+        return(indexes[nearest].tolist())
+
+# ..............................................................................
+                                 # cells at a given Chebyshev distance of a cell
+def ring_cells(column, row, ring):
+    if ring == 0 :
+        return([(column, row)])
+    cells = []
+    for offset in range(-ring, ring+1) :
+        cells.append((column + offset, row - ring))
+        cells.append((column + offset, row + ring))
+    for offset in range(-ring+1, ring) :
+        cells.append((column - ring, row + offset))
+        cells.append((column + ring, row + offset))
+
+    return(cells)
+
+# ==============================================================================
+                                                             # tour construction
+# ..............................................................................
+                                         # nearest neighbour lists of all points
+#
+# Candidate pairs are taken from the 3x3 blocks of grid cells around each
+# point, all at once with the points sorted by cell. Points with too few
+# candidates are completed by grid queries.
+#
+def neighbour_lists(points, neighbour_nb=NEIGHBOUR_NB):
+    grid = SpatialGrid(points)
+    points = grid.points
+    point_nb = len(points)
+    cells = numpy.floor(
+        (points - (grid.x_min, grid.y_min)) / grid.cell_size
+    ).astype(numpy.int64) + 1
+    stride = grid.row_nb + 3
+    keys = cells[:, 0]*stride + cells[:, 1]
+    sorting = numpy.argsort(keys, kind='stable')
+    sorted_keys = keys[sorting]
+                                   # candidate pairs from the neighbouring cells
+    owners = []
+    candidates = []
+    for column_offset in (-1, 0, 1) :
+        for row_offset in (-1, 0, 1) :
+            target_keys = keys + column_offset*stride + row_offset
+            starts = numpy.searchsorted(sorted_keys, target_keys, 'left')
+            counts = numpy.searchsorted(sorted_keys, target_keys, 'right') \
+                - starts
+            pair_owners = numpy.repeat(numpy.arange(point_nb), counts)
+            first_pairs = numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            pair_positions = numpy.repeat(starts, counts) \
+                + numpy.arange(len(pair_owners)) - first_pairs
+            owners.append(pair_owners)
+            candidates.append(sorting[pair_positions])
+    owners = numpy.concatenate(owners)
+    candidates = numpy.concatenate(candidates)
+    distinct = owners != candidates
+    (owners, candidates) = (owners[distinct], candidates[distinct])
+                                     # keep the nearest candidates of each point
+    steps = points[candidates] - points[owners]
+    distances = numpy.hypot(steps[:, 0], steps[:, 1])
+    sorting = numpy.lexsort((distances, owners))
+    (owners, candidates) = (owners[sorting], candidates[sorting])
+    group_starts = numpy.searchsorted(owners, numpy.arange(point_nb), 'left')
+    ranks = numpy.arange(len(owners)) - group_starts[owners]
+    kept = ranks < neighbour_nb
+    neighbours = [[] for index in range(point_nb)]
+    for (owner, candidate) in zip(
+        owners[kept].tolist(), candidates[kept].tolist()
+    ) :
+        neighbours[owner].append(candidate)
+    for (index, (x, y)) in enumerate(points.tolist()) :
+        if len(neighbours[index]) < min(neighbour_nb, point_nb-1) :
+            neighbours[index] = grid.nearest(x, y, neighbour_nb, index)
+
+    return(neighbours)
+
+# ..............................................................................
+                     # greedy order, always going to the nearest remaining point
+def nearest_neighbour_order(points, start=(0, 0), neighbours=None):
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    if neighbours is None :
+        neighbours = [[] for point in points]
+    grid = SpatialGrid(points)
+    visited = bytearray(len(points))
+    order = []
+    (x, y) = start
+    index = None
+    while len(order) < len(points) :
+                 # the nearest neighbours are looked at before querying the grid
+        next_index = None
+        if index is not None :
+            for neighbour in neighbours[index] :
+                if not visited[neighbour] :
+                    next_index = neighbour
+                    break
+        if next_index is None :
+            next_index = grid.nearest(x, y)[0]
+        index = next_index
+        order.append(index)
+        visited[index] = 1
+        grid.remove(index)
+        (x, y) = points[index].tolist()
+                                           # shrink the grid when it gets sparse
+        if grid.count and (grid.count < grid.initial_count // 4) :
+            grid = SpatialGrid(points, [
+                remaining for remaining in range(len(points))
+                    if not visited[remaining]
+            ])
+
+    return(order)
+
+# ==============================================================================
+                                                              # tour improvement
+#
+# The path starts at a fixed point and is left open at its end. Moves only
+# consider the nearest neighbours of a node and are applied as soon as they
+# shorten the path. The nodes next to changed edges are queued again until
+# no move improves the path.
+#
+# ..............................................................................
+            # distance between two path nodes, the open end being at no distance
+def node_distance(xs, ys, node1, node2):
+    if (node1 is None) or (node2 is None) :
+        return(0)
+
+    return(math.hypot(xs[node1] - xs[node2], ys[node1] - ys[node2]))
+
+# ..............................................................................
+                                                    # reverse a part of the path
+def reverse_path(path, position, first, last):
+    path[first:last+1] = path[first:last+1][::-1].copy()
+    position[path[first:last+1]] = numpy.arange(first, last+1)
+
+# ..............................................................................
+      # 2-opt: replace two edges by two shorter ones, reversing the path between
+def two_opt_move(path, position, xs, ys, neighbours, node):
+    last = len(path) - 1
+    index = int(position[node])
+                                      # edges leaving the node and its neighbour
+    if index < last :
+        successor = int(path[index+1])
+        gain1 = node_distance(xs, ys, node, successor)
+        for neighbour in neighbours[node] :
+            gain = gain1 - node_distance(xs, ys, node, neighbour)
+            if gain <= MIN_GAIN :
+                break
+            neighbour_index = int(position[neighbour])
+            if neighbour_index <= index + 1 :
+                continue
+            next_node = None
+            if neighbour_index < last :
+                next_node = int(path[neighbour_index+1])
+            gain += node_distance(xs, ys, neighbour, next_node) \
+                - node_distance(xs, ys, successor, next_node)
+            if gain > MIN_GAIN :
+                reverse_path(path, position, index+1, neighbour_index)
+                return([node, successor, neighbour, next_node])
+                                     # edges entering the node and its neighbour
+    predecessor = int(path[index-1])
+    gain1 = node_distance(xs, ys, predecessor, node)
+    for neighbour in neighbours[node] :
+        gain = gain1 - node_distance(xs, ys, node, neighbour)
+        if gain <= MIN_GAIN :
+            break
+        neighbour_index = int(position[neighbour])
+        if neighbour_index >= index - 1 :
+            continue
+        before = int(path[neighbour_index-1])
+        gain += node_distance(xs, ys, before, neighbour) \
+            - node_distance(xs, ys, before, predecessor)
+        if gain > MIN_GAIN :
+            reverse_path(path, position, neighbour_index, index-1)
+            return([node, predecessor, neighbour, before])
+
+    return(None)
+
+# ..............................................................................
+              # Or-opt: move a run of up to 3 nodes starting or ending at a node
+def or_opt_move(path, position, xs, ys, neighbours, node):
+    last = len(path) - 1
+    index = int(position[node])
+    for length in OR_OPT_LENGTHS :
+        for first in (index, index - length + 1) :
+            if (first < 1) or (first + length - 1 > last) :
+                continue
+            touched = move_segment(
+                path, position, xs, ys, neighbours, first, length
+            )
+            if touched :
+                return(touched)
+
+    return(None)
+
+def move_segment(path, position, xs, ys, neighbours, first, length):
+    last = len(path) - 1
+    end = first + length - 1
+    (head, tail) = (int(path[first]), int(path[end]))
+    before = int(path[first-1])
+    after = int(path[end+1]) if end < last else None
+    removal_gain = node_distance(xs, ys, before, head) \
+        + node_distance(xs, ys, tail, after) \
+        - node_distance(xs, ys, before, after)
+    if removal_gain <= MIN_GAIN :
+        return(None)
+                                  # edges next to the neighbours of the run ends
+    for end_node in (head, tail) :
+        for neighbour in neighbours[end_node] :
+            if node_distance(xs, ys, end_node, neighbour) >= removal_gain :
+                break
+            neighbour_index = int(position[neighbour])
+            if first <= neighbour_index <= end :
+                continue
+            for edge_index in (neighbour_index - 1, neighbour_index) :
+                if first - 1 <= edge_index <= end :
+                    continue
+                node1 = int(path[edge_index])
+                node2 = int(path[edge_index+1]) if edge_index < last else None
+                edge_length = node_distance(xs, ys, node1, node2)
+                forward_cost = node_distance(xs, ys, node1, head) \
+                    + node_distance(xs, ys, tail, node2) - edge_length
+                backward_cost = node_distance(xs, ys, node1, tail) \
+                    + node_distance(xs, ys, head, node2) - edge_length
+                if removal_gain - min(forward_cost, backward_cost) <= MIN_GAIN :
+                    continue
+                                             # move the run, reversed if shorter
+                segment = path[first:end+1].copy()
+                if backward_cost < forward_cost :
+                    segment = segment[::-1]
+                if edge_index < first :
+                    (low, high) = (edge_index+1, end+1)
+                    path[low:high] = numpy.concatenate(
+                        (segment, path[edge_index+1:first])
+                    )
+                else :
+                    (low, high) = (first, edge_index+1)
+                    path[low:high] = numpy.concatenate(
+                        (path[end+1:edge_index+1], segment)
+                    )
+                position[path[low:high]] = numpy.arange(low, high)
+                return([before, after, head, tail, node1, node2])
+
+    return(None)
+
+# ..............................................................................
+                                      # apply improving moves until none is left
+def improve_path(path, position, xs, ys, neighbours):
+    node_nb = len(neighbours)
+    queued = bytearray([1]) * node_nb
+    active = collections.deque(range(node_nb))
+    while active :
+        node = active.popleft()
+        queued[node] = 0
+        touched = two_opt_move(path, position, xs, ys, neighbours, node)
+        if touched is None :
+            touched = or_opt_move(path, position, xs, ys, neighbours, node)
+        if touched is None :
+            continue
+        for touched_node in touched + [node] :
+            if (touched_node is not None) and (touched_node < node_nb) :
+                if not queued[touched_node] :
+                    queued[touched_node] = 1
+                    active.append(touched_node)
+
+# ==============================================================================
+                                                           # travel optimisation
+# ..............................................................................
+           # length of the travel from a start point through the points in order
+def travel_length(points, order, start=(0, 0)):
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    if len(order) == 0 :
+        return(0.0)
+    path = numpy.vstack(([start], points[numpy.asarray(order)]))
+    steps = numpy.diff(path, axis=0)
+
+    return(float(numpy.hypot(steps[:, 0], steps[:, 1]).sum()))
+
+# ..............................................................................
+                          # point order minimising the travel from a start point
+#
+# Returns the order and the travel lengths in the original and new orders.
+# The original order is kept when the heuristics find no shorter one.
+#
+def optimise_order(points, start=(0, 0)):
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    point_nb = len(points)
+    original_length = travel_length(points, range(point_nb), start)
+    if point_nb < 2 :
+        return(list(range(point_nb)), original_length, original_length)
+    neighbours = neighbour_lists(points, min(NEIGHBOUR_NB, point_nb-1))
+    order = nearest_neighbour_order(points, start, neighbours)
+                # the start is an extra node, fixed at the beginning of the path
+    xs = points[:, 0].tolist() + [float(start[0])]
+    ys = points[:, 1].tolist() + [float(start[1])]
+    path = numpy.array([point_nb] + order, dtype=numpy.int64)
+    position = numpy.empty(point_nb+1, dtype=numpy.int64)
+    position[path] = numpy.arange(point_nb+1)
+    improve_path(path, position, xs, ys, neighbours)
+    order = path[1:].tolist()
+    length = travel_length(points, order, start)
+    if length >= original_length :
+        (order, length) = (list(range(point_nb)), original_length)
+
+    return(order, original_length, length)
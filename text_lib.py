@@ -2,6 +2,9 @@
 import os
 import math
 import re
+import itertools
+import collections
+import concurrent.futures
 import gcode_lib
 
 # ------------------------------------------------------------------------------
@@ -21,6 +24,15 @@ uc_circle_radius = uc_letter_width/2
 
 LIFT_UP = True
 LIFT_DISPLACEMENT_HEIGHT = True
+                               # maximal number of compiled glyphs kept per font
+GLYPH_CACHE_SIZE = 1024
+   # label batches with fewer different labels are generated in a single process
+PARALLEL_LABEL_NB = 64
+                 # tool height above the surface for hops up to SHORT_HOP_LENGTH
+CLEARANCE_HEIGHT = 1
+SHORT_HOP_LENGTH = 20
+                           # distance below which strokes touch, in letter units
+STROKE_TOLERANCE = 1E-6
 
 # ------------------------------------------------------------------------------
                                                            # drilling parameters
@@ -142,7 +154,8 @@ def move_arc(
     g_code = gcode_lib.circle_arc_gcode(
         radius*machining_parameters['drill_diameter'], facet_nb,
         start_angle, end_angle,
-        machining_parameters['drill_displacement_speed']
+        machining_parameters['drill_displacement_speed'],
+        machining_parameters.get('use_arcs', False)
     )
 
     return (g_code)
@@ -236,6 +249,16 @@ def line_set_to_gcode(
 
     return(g_code, entry_point, exit_point)
 
+# ..............................................................................
+                                                    # comment naming a character
+def character_comment(character):
+    if character == '(' :
+        return("; opening parenthesis\n")
+    elif character == ')' :
+        return("; closing parenthesis\n")
+    else :
+        return("; %s\n" % character)
+
 # ..............................................................................
                                                     # g-code set for a character
 def character_data(
@@ -252,12 +275,7 @@ def character_data(
         line_set = font_dictionary[character]
     if line_set :
                                                                        # comment
-        if character == '(' :
-            g_code = "; opening parenthesis\n"
-        elif character == ')' :
-            g_code = "; closing parenthesis\n"
-        else :
-            g_code = "; %s\n" % character
+        g_code = character_comment(character)
                                                                      # dive down
         g_code += lift_drill(not LIFT_UP, machining_parameters)
                                                                    # drill lines
@@ -270,17 +288,108 @@ def character_data(
 
     return(g_code, entry_point, exit_point)
 
-# ------------------------------------------------------------------------------
-def line_g_code(
-    line, font_file_spec,
-    machining_parameters=letter_machining_parameters,
-    lift_for_drill_back=False
-) :
-                                                             # write line g-code
-    drill_tool_diameter = machining_parameters['drill_diameter']
-    text_g_code = gcode_lib.select_tool(drill_tool_diameter)
-                                                              # drill characters
-    font_information = open(font_file_spec, 'r').read().split("\n")
+# ==============================================================================
+                                                                 # glyph strokes
+# ..............................................................................
+                                      # glyph split into strokes, with its width
+#
+# A stroke is a list of (command, parameters, start, end) pieces which are
+# drilled without lifting the tool. The moves in the font cut as lines
+# when made at depth, and split the strokes when made above the surface
+# (between 'u' and 'd') or as the first command: the strokes are linked
+# again when drilling. The width is the one used to place the next glyph.
+#
+def glyph_strokes(line_set):
+    strokes = []
+    if not line_set :
+        return(strokes, 0)
+    commands = re.findall(r'[a-zA-Z]', line_set)
+    parameters = re.split(r'\s*[a-zA-Z]\s*', line_set)[1:]
+    (x, y) = (0, 0)
+    lifted = False
+    stroke = []
+    for (index, (command, parameter_string)) in enumerate(
+        zip(commands, parameters)
+    ) :
+        values = [float(value) for value in parameter_string.split()]
+        delta_x = 0
+        delta_y = 0
+        if command == 'h' :
+            values = values[:1]
+            delta_x = values[0]
+        elif command == 'v' :
+            values = values[:1]
+            delta_y = values[0]
+        elif command == 'l' :
+            values = values[:2]
+            (delta_x, delta_y) = values
+        elif command == 'a' :
+            values = values[:3]
+            radius      = values[0]
+            start_angle = values[1]*math.pi/180
+            end_angle   = values[2]*math.pi/180
+            delta_x = radius*(math.cos(end_angle) - math.cos(start_angle))
+            delta_y = radius*(math.sin(end_angle) - math.sin(start_angle))
+        elif command == 'm' :
+            values = values[:2]
+            (delta_x, delta_y) = values
+        elif command in 'ud' :
+            lifted = (command == 'u')
+        cutting = (command == 'm') and (index > 0) and not lifted
+        if (command in 'hvla') or cutting :
+            stroke.append(
+                (command, tuple(values), (x, y), (x + delta_x, y + delta_y))
+            )
+        elif stroke :
+            strokes.append(stroke)
+            stroke = []
+        x += delta_x
+        y += delta_y
+    if stroke :
+        strokes.append(stroke)
+    exit_point = line_set_to_gcode(line_set)[2]
+
+    return(strokes, x - exit_point[0])
+
+# ..............................................................................
+                                                          # stroke run backwards
+def reverse_stroke(stroke):
+    reversed_stroke = []
+    for (command, values, start, end) in stroke[::-1] :
+        if command == 'a' :
+            values = (values[0], values[2], values[1])
+        else :
+            values = tuple(-value for value in values)
+        reversed_stroke.append((command, values, end, start))
+
+    return(reversed_stroke)
+
+# ..............................................................................
+                                   # g-code of a stroke, from its start at depth
+def stroke_g_code(stroke, machining_parameters=letter_machining_parameters):
+    g_code = ''
+    for (command, values, start, end) in stroke :
+        if command == 'h' :
+            g_code += move_horizontal(values[0], machining_parameters)
+        elif command == 'v' :
+            g_code += move_vertical(values[0], machining_parameters)
+        elif command in 'lm' :
+            g_code += move_diagonal(values[0], values[1], machining_parameters)
+        else :
+            g_code += move_arc(
+                values[0], values[1]*math.pi/180, values[2]*math.pi/180,
+                machining_parameters
+            )
+
+    return(g_code)
+
+# ==============================================================================
+                                                                # compiled fonts
+# ..............................................................................
+                                          # character to line set of a font file
+def parse_font(font_file_spec):
+    with open(font_file_spec, 'r') as font_file :
+        font_information = font_file.read().split("\n")
     font_dictionary = {}
     for character_information in font_information :
         if character_information.startswith(':') :
@@ -291,9 +400,116 @@ def line_g_code(
             [character, line_set] = re.split(r'\s*:\s*', character_information)
             if character.startswith('\\') :
               character = character[1]
-#            print(character)
-#            print(line_set)
             font_dictionary[character] = line_set
+
+    return(font_dictionary)
+
+# ..............................................................................
+                       # font parsed once, with glyphs compiled to g-code on use
+#
+# The g-code of a glyph depends on the machining parameters, so these are
+# part of the key of the compiled glyphs. The least recently used glyphs
+# are dropped once the cache holds cache_size of them.
+#
+class Font:
+
+    def __init__(self, font_file_spec, cache_size=GLYPH_CACHE_SIZE):
+        self.file_spec = font_file_spec
+        self.line_sets = parse_font(font_file_spec)
+        self.cache_size = cache_size
+        self.glyphs = collections.OrderedDict()
+        self.strokes = {}
+
+    def __contains__(self, character):
+        return(character in self.line_sets)
+
+                                       # g-code, entry and exit point of a glyph
+    def character_data(
+        self, character,
+        machining_parameters=letter_machining_parameters,
+        lift_for_drill_back=False
+    ):
+        key = (
+            character, lift_for_drill_back,
+            tuple(sorted(machining_parameters.items()))
+        )
+        (g_code, entry_point, exit_point) = self.compiled(
+            key, lambda : character_data(
+                character, self.line_sets,
+                machining_parameters, lift_for_drill_back
+            )
+        )
+
+        return(g_code, list(entry_point), list(exit_point))
+
+                                                  # strokes and width of a glyph
+    def character_strokes(self, character):
+        if character not in self.strokes :
+            self.strokes[character] = glyph_strokes(
+                self.line_sets.get(character, '')
+            )
+
+        return(self.strokes[character])
+
+                              # g-code of a glyph stroke, possibly run backwards
+    def stroke_g_code(
+        self, character, index, backwards=False,
+        machining_parameters=letter_machining_parameters
+    ):
+        key = (
+            character, index, backwards,
+            tuple(sorted(machining_parameters.items()))
+        )
+        stroke = self.character_strokes(character)[0][index]
+        if backwards :
+            stroke = reverse_stroke(stroke)
+
+        return(self.compiled(
+            key, lambda : stroke_g_code(stroke, machining_parameters)
+        ))
+
+                                    # compiled glyph data, built on a cache miss
+    def compiled(self, key, build):
+        glyph = self.glyphs.get(key)
+        if glyph is None :
+            glyph = build()
+            self.glyphs[key] = glyph
+            if len(self.glyphs) > self.cache_size :
+                self.glyphs.popitem(last=False)
+        else :
+            self.glyphs.move_to_end(key)
+
+        return(glyph)
+
+# ..............................................................................
+                             # font of a file, cached per file modification time
+fonts = {}
+
+def load_font(font_file_spec):
+    if isinstance(font_file_spec, Font) :
+        return(font_file_spec)
+    font_file_spec = os.path.abspath(font_file_spec)
+    modification_time = os.stat(font_file_spec).st_mtime_ns
+    cached = fonts.get(font_file_spec)
+    if cached and (cached[0] == modification_time) :
+        return(cached[1])
+    font = Font(font_file_spec)
+    fonts[font_file_spec] = (modification_time, font)
+
+    return(font)
+
+# ==============================================================================
+                                                                    # text lines
+# ..............................................................................
+    # g-code of a line of text from the current position, without tool selection
+def line_drill_g_code(
+    line, font_file_spec,
+    machining_parameters=letter_machining_parameters,
+    lift_for_drill_back=False
+) :
+    text_g_code = ''
+                                                              # drill characters
+    font = load_font(font_file_spec)
     displacement_height = machining_parameters['displacement_height']
     drill_diameter      = machining_parameters['drill_diameter']
     displacement_speed  = machining_parameters['fast_displacement_speed']
@@ -305,10 +521,8 @@ def line_g_code(
                 - (space_spacing - letter_spacing)
         else :
                                                             # get character data
-            (char_g_code, entry_point, exit_point) = character_data(
-                character, font_dictionary,
-                letter_machining_parameters,
-                lift_for_drill_back
+            (char_g_code, entry_point, exit_point) = font.character_data(
+                character, machining_parameters, lift_for_drill_back
             )
                                                        # move to character start
             text_g_code += gcode_lib.move_fast(
@@ -332,3 +546,338 @@ def line_g_code(
         old_exit_point = exit_point
 
     return(text_g_code)
+
+# ..............................................................................
+       # g-code of a line of text drilled stroke by stroke, minimising the lifts
+#
+# The glyphs are placed as by line_drill_g_code. The strokes of each glyph
+# are drilled in nearest neighbour order, possibly backwards, from the end
+# of the previous stroke. The tool stays down between touching strokes and
+# only lifts to the clearance height for short hops.
+#
+def line_stroke_g_code(
+    line, font_file_spec,
+    machining_parameters=letter_machining_parameters
+) :
+    font = load_font(font_file_spec)
+    displacement_height = machining_parameters['displacement_height']
+    drill_diameter      = machining_parameters['drill_diameter']
+    displacement_speed  = machining_parameters['fast_displacement_speed']
+    clearance_height = machining_parameters.get(
+        'clearance_height', CLEARANCE_HEIGHT
+    )
+    short_hop_length = machining_parameters.get(
+        'short_hop_length', SHORT_HOP_LENGTH
+    )
+    text_g_code = []
+    (x, y) = (0, 0)
+    height = displacement_height
+    origin_x = 0
+    for character in line :
+        if character == ' ' :
+                                              # add offset for character spacing
+            origin_x += space_spacing - letter_spacing
+            continue
+        (strokes, width) = font.character_strokes(character)
+        if strokes :
+            text_g_code.append(character_comment(character))
+                                                # drill strokes in nearest order
+        remaining = list(range(len(strokes)))
+        while remaining :
+            hops = []
+            for index in remaining :
+                stroke = strokes[index]
+                for (backwards, (point_x, point_y)) in (
+                    (False, stroke[0][2]), (True, stroke[-1][3])
+                ) :
+                    hops.append((
+                        math.hypot(origin_x + point_x - x, point_y - y),
+                        index, backwards
+                    ))
+            (hop, index, backwards) = min(hops)
+            remaining.remove(index)
+            stroke = strokes[index]
+            if backwards :
+                stroke = reverse_stroke(stroke)
+            (start_x, start_y) = stroke[0][2]
+            (end_x, end_y) = stroke[-1][3]
+                                                   # go on with touching strokes
+            if (height is not None) or (hop > STROKE_TOLERANCE) :
+                if height is None :
+                    text_g_code.append(
+                        lift_drill(LIFT_UP, machining_parameters)
+                    )
+                    height = 0
+                                                  # lift just enough for the hop
+                hop_height = displacement_height
+                if hop*drill_diameter <= short_hop_length :
+                    hop_height = clearance_height
+                if height < hop_height :
+                    text_g_code.append(gcode_lib.move_fast(
+                        0, 0, hop_height - height, displacement_speed
+                    ))
+                    height = hop_height
+                text_g_code.append(gcode_lib.move_fast(
+                    drill_diameter*(origin_x + start_x - x),
+                    drill_diameter*(start_y - y),
+                    0,
+                    displacement_speed
+                ))
+                text_g_code.append(gcode_lib.move_fast(
+                    0, 0, -height, displacement_speed
+                ))
+                text_g_code.append(
+                    lift_drill(not LIFT_UP, machining_parameters)
+                )
+                height = None
+            text_g_code.append(font.stroke_g_code(
+                character, index, backwards, machining_parameters
+            ))
+            (x, y) = (origin_x + end_x, end_y)
+        origin_x += width + letter_spacing
+                                               # go up for the next displacement
+    if height is None :
+        text_g_code.append(lift_drill(LIFT_UP, machining_parameters))
+        height = 0
+    text_g_code.append(gcode_lib.move_fast(
+        0, 0, displacement_height - height, displacement_speed
+    ))
+
+    return(''.join(text_g_code))
+
+# ------------------------------------------------------------------------------
+def line_g_code(
+    line, font_file_spec,
+    machining_parameters=letter_machining_parameters,
+    lift_for_drill_back=False,
+    optimise_lifts=False
+) :
+                                                             # write line g-code
+    drill_tool_diameter = machining_parameters['drill_diameter']
+    text_g_code = gcode_lib.select_tool(drill_tool_diameter)
+    if optimise_lifts :
+        text_g_code += line_stroke_g_code(
+            line, font_file_spec, machining_parameters
+        )
+    else :
+        text_g_code += line_drill_g_code(
+            line, font_file_spec, machining_parameters, lift_for_drill_back
+        )
+
+    return(text_g_code)
+
+# ==============================================================================
+                                                                 # label batches
+MOVE_WORD_PATTERN = re.compile(r'([XYZIJf])(\S+)')
+
+# ..............................................................................
+                 # g-code line scaled and rotated, with its rounded displacement
+def transform_line(line, cosine, sine):
+    command = line.split(' ', 1)[0]
+    if command not in ('G0', 'G1', 'G2', 'G3') :
+        return(line, 0, 0)
+    words = dict(MOVE_WORD_PATTERN.findall(line))
+    (dx, dy) = (float(words.get('X', 0)), float(words.get('Y', 0)))
+    (dx, dy) = (cosine*dx - sine*dy, sine*dx + cosine*dy)
+    dz = float(words.get('Z', 0))
+    speed = float(words.get('f', 0))
+    if command == 'G0' :
+        line = gcode_lib.move_fast(dx, dy, dz, speed)
+    elif command == 'G1' :
+        line = gcode_lib.move_steady(dx, dy, dz, speed)
+    else :
+        (i, j) = (float(words.get('I', 0)), float(words.get('J', 0)))
+        line = gcode_lib.move_circular(
+            dx, dy, cosine*i - sine*j, sine*i + cosine*j,
+            command == 'G2', speed
+        )
+
+    return(line, float("%.3f" % dx), float("%.3f" % dy))
+
+# ..............................................................................
+       # relative g-code scaled and rotated around its start, with its end point
+#
+# The X, Y, I and J words of the moves are transformed and the end point
+# is summed from the rounded displacements, as the machine moves. Texts
+# repeat the same lines, whose transforms are kept in line_cache.
+#
+def transform_g_code(g_code, scale=1, rotation=0, line_cache=None):
+    if line_cache is None :
+        line_cache = {}
+    cosine = scale*math.cos(rotation)
+    sine = scale*math.sin(rotation)
+    transformed = []
+    (end_x, end_y) = (0, 0)
+    for line in g_code.splitlines(keepends=True) :
+        cached = line_cache.get(line)
+        if cached is None :
+            cached = transform_line(line, cosine, sine)
+            line_cache[line] = cached
+        transformed.append(cached[0])
+        end_x += cached[1]
+        end_y += cached[2]
+
+    return(''.join(transformed), (end_x, end_y))
+
+# ..............................................................................
+               # font and parameters shared by the labels generated in a process
+label_worker_arguments = {}
+
+def start_label_worker(
+    font, machining_parameters, lift_for_drill_back, optimise_lifts
+):
+    label_worker_arguments['font'] = font
+    label_worker_arguments['machining_parameters'] = machining_parameters
+    label_worker_arguments['lift_for_drill_back'] = lift_for_drill_back
+    label_worker_arguments['optimise_lifts'] = optimise_lifts
+    label_worker_arguments['line_caches'] = {}
+
+# ..............................................................................
+             # g-code and end point of a label given as text, scale and rotation
+def label_worker_g_code(label_shape):
+    (text, scale, rotation) = label_shape
+    if label_worker_arguments['optimise_lifts'] :
+        g_code = line_stroke_g_code(
+            text, label_worker_arguments['font'],
+            label_worker_arguments['machining_parameters']
+        )
+    else :
+        g_code = line_drill_g_code(
+            text, label_worker_arguments['font'],
+            label_worker_arguments['machining_parameters'],
+            label_worker_arguments['lift_for_drill_back']
+        )
+
+    line_cache = label_worker_arguments['line_caches'].setdefault(
+        (scale, rotation), {}
+    )
+
+    return(transform_g_code(g_code, scale, rotation, line_cache))
+
+# ..............................................................................
+     # travel between labels, each one going on from the end of the previous one
+def label_travel(starts, ends, order, start=(0, 0)):
+    (x, y) = start
+    travel = 0
+    for index in order :
+        travel += math.hypot(starts[index][0] - x, starts[index][1] - y)
+        (x, y) = ends[index]
+
+    return(travel)
+
+# ..............................................................................
+      # label order going on to the nearest label start from the end of the last
+#
+# The label starts are looked up in a route_lib grid, which needs NumPy.
+#
+def label_order(starts, ends, start=(0, 0)):
+    import route_lib
+    if not starts :
+        return([])
+    grid = route_lib.SpatialGrid(starts)
+    visited = bytearray(len(starts))
+    order = []
+    (x, y) = start
+    while grid.count :
+        index = grid.nearest(x, y)[0]
+        grid.remove(index)
+        visited[index] = 1
+        order.append(index)
+        (x, y) = ends[index]
+                                           # shrink the grid when it gets sparse
+        if grid.count and (grid.count < grid.initial_count // 4) :
+            grid = route_lib.SpatialGrid(starts, [
+                remaining for remaining in range(len(starts))
+                    if not visited[remaining]
+            ])
+
+    return(order)
+
+# ------------------------------------------------------------------------------
+                                                    # g-code for a set of labels
+#
+# Each label is a (text, x, y, scale, rotation) tuple, with x and y
+# relative to the current position and the rotation in radians. The glyphs
+# are compiled once and the font is shared by the worker processes which
+# generate the different labels. The labels are then drilled in an order
+# shortening the travel, reported as a comment. With optimise_lifts, they
+# are drilled stroke by stroke, as by line_stroke_g_code.
+#
+def label_set_g_code(
+    labels, font_file_spec,
+    machining_parameters=letter_machining_parameters,
+    lift_for_drill_back=False,
+    optimise_order=True,
+    worker_nb=None,
+    optimise_lifts=False
+) :
+    font = load_font(font_file_spec)
+    labels = [
+        (str(text), x, y, scale, rotation)
+            for (text, x, y, scale, rotation) in labels
+    ]
+    label_shapes = list(dict.fromkeys(
+        (text, scale, rotation) for (text, x, y, scale, rotation) in labels
+    ))
+                                             # compile the glyphs before sharing
+    characters = set(''.join(text for (text, scale, rotation) in label_shapes))
+    for character in characters - {' '} :
+        if optimise_lifts :
+            stroke_nb = len(font.character_strokes(character)[0])
+            for (index, backwards) in itertools.product(
+                range(stroke_nb), (False, True)
+            ) :
+                font.stroke_g_code(
+                    character, index, backwards, machining_parameters
+                )
+        else :
+            font.character_data(
+                character, machining_parameters, lift_for_drill_back
+            )
+                                                     # generate different labels
+    worker_nb = worker_nb or os.cpu_count()
+    arguments = (
+        font, machining_parameters, lift_for_drill_back, optimise_lifts
+    )
+    if (worker_nb < 2) or (len(label_shapes) < PARALLEL_LABEL_NB) :
+        start_label_worker(*arguments)
+        results = list(map(label_worker_g_code, label_shapes))
+    else :
+        with concurrent.futures.ProcessPoolExecutor(
+            worker_nb, initializer=start_label_worker, initargs=arguments
+        ) as executor :
+            results = list(executor.map(
+                label_worker_g_code, label_shapes,
+                chunksize=max(1, len(label_shapes) // (4*worker_nb))
+            ))
+    label_g_codes = dict(zip(label_shapes, results))
+                                                                  # order labels
+    starts = []
+    ends = []
+    for (text, x, y, scale, rotation) in labels :
+        (end_x, end_y) = label_g_codes[(text, scale, rotation)][1]
+        starts.append([x, y])
+        ends.append([x + end_x, y + end_y])
+    g_code = [gcode_lib.select_tool(machining_parameters['drill_diameter'])]
+    order = range(len(labels))
+    if optimise_order :
+        order = label_order(starts, ends)
+        g_code.append(gcode_lib.travel_comment(
+            label_travel(starts, ends, range(len(labels))),
+            label_travel(starts, ends, order)
+        ))
+                                    # drill labels, from the end of the last one
+    (x, y) = (0, 0)
+    for index in order :
+        (text, label_x, label_y, scale, rotation) = labels[index]
+        (label_g_code, (end_x, end_y)) = label_g_codes[(text, scale, rotation)]
+        g_code.append("; label %s\n" % text)
+        g_code.append(gcode_lib.move_fast(
+            label_x - x, label_y - y, 0,
+            machining_parameters['fast_displacement_speed']
+        ))
+        g_code.append(label_g_code)
+        x += float("%.3f" % (label_x - x)) + end_x
+        y += float("%.3f" % (label_y - y)) + end_y
+
+    return(''.join(g_code))
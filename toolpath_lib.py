@@ -0,0 +1,193 @@
+import os
+import hashlib
+import numpy
+import gcode_parser
+
+# ==============================================================================
+                                                                     # constants
+CHUNK_SIZE = 64*1024
+CACHE_SUFFIX = '.toolpath.npz'
+CACHE_VERSION = 1
+HASH_BLOCK_SIZE = 1024*1024
+
+KINDS = ('G0', 'G1', 'G2', 'G3')
+KIND_CODES = {kind : code for (code, kind) in enumerate(KINDS)}
+
+FLOAT_FIELDS = (
+    'x1', 'y1', 'z1', 'x2', 'y2', 'z2',
+    'feed', 'tool', 'center_x', 'center_y'
+)
+FIELDS = ('kind', 'line_nb') + FLOAT_FIELDS
+OPTIONAL_FIELDS = ('tool', 'center_x', 'center_y')
+
+# ==============================================================================
+                                                        # array-backed toolpaths
+# ..............................................................................
+                                # moves stored as one typed array per Move field
+#
+# kind holds the index of the motion g-code in KINDS, and a missing tool or
+# arc center is stored as NaN.
+#
+class Toolpath:
+
+    def __init__(self, arrays=None):
+        if arrays is None :
+            arrays = {}
+        self.kind = numpy.asarray(arrays.get('kind', ()), dtype=numpy.int8)
+        self.line_nb = numpy.asarray(
+            arrays.get('line_nb', ()), dtype=numpy.int64
+        )
+        for field in FLOAT_FIELDS :
+            setattr(self, field, numpy.asarray(
+                arrays.get(field, ()), dtype=numpy.float64
+            ))
+
+    def __len__(self):
+        return(len(self.kind))
+
+    def arrays(self):
+        return({field : getattr(self, field) for field in FIELDS})
+
+                          # rebuild the moves chunk by chunk to keep memory flat
+    def __iter__(self):
+        for start in range(0, len(self), CHUNK_SIZE) :
+            end = start + CHUNK_SIZE
+            columns = [
+                [KINDS[code] for code in self.kind[start:end].tolist()]
+            ]
+            for field in ('x1', 'y1', 'z1', 'x2', 'y2', 'z2', 'feed') :
+                columns.append(getattr(self, field)[start:end].tolist())
+            columns.append(optional_values(self.tool[start:end]))
+            columns.append(self.line_nb[start:end].tolist())
+            columns.append(optional_values(self.center_x[start:end]))
+            columns.append(optional_values(self.center_y[start:end]))
+            for move in zip(*columns) :
+                yield gcode_parser.Move._make(move)
+
+# ..............................................................................
+                                # list of array values with NaN replaced by None
+def optional_values(values):
+    return([
+        None if value != value else value for value in values.tolist()
+    ])
+
+# ..............................................................................
+                                             # toolpath from a sequence of moves
+def toolpath_from_moves(moves):
+    blocks = {field : [] for field in FIELDS}
+    moves = iter(moves)
+    while True :
+        chunk = [move for (index, move) in zip(range(CHUNK_SIZE), moves)]
+        if not chunk :
+            break
+        columns = dict(zip(gcode_parser.Move._fields, zip(*chunk)))
+        blocks['kind'].append(numpy.array(
+            [KIND_CODES[kind] for kind in columns['kind']], dtype=numpy.int8
+        ))
+        blocks['line_nb'].append(numpy.fromiter(
+            columns['line_nb'], dtype=numpy.int64, count=len(chunk)
+        ))
+                    # optional fields may hold None, which numpy converts to NaN
+        for field in FLOAT_FIELDS :
+            if field in OPTIONAL_FIELDS :
+                block = numpy.array(columns[field], dtype=numpy.float64)
+            else :
+                block = numpy.fromiter(
+                    columns[field], dtype=numpy.float64, count=len(chunk)
+                )
+            blocks[field].append(block)
+
+    return(Toolpath({
+        field : numpy.concatenate(block) for (field, block) in blocks.items()
+            if block
+    }))
+
+# ==============================================================================
+                                                                 # sidecar cache
+#
+# A toolpath parsed from a g-code file is saved next to it with the file
+# size, modification time and content hash. The cache is used as is when
+# size and time match, and after a hash check when only the time changed.
+#
+# ..............................................................................
+                                             # cache file name for a g-code file
+def cache_file_spec(gcode_file_spec):
+    return(gcode_file_spec + CACHE_SUFFIX)
+
+# ..............................................................................
+                                                        # content hash of a file
+def file_hash(file_specification):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_specification, 'rb') as hashed_file :
+        for block in iter(lambda: hashed_file.read(HASH_BLOCK_SIZE), b'') :
+            digest.update(block)
+
+    return(digest.hexdigest())
+
+# ..............................................................................
+                             # save a toolpath with the stamp of its source file
+def save_toolpath(toolpath, file_specification, stamp=None):
+    if stamp is None :
+        stamp = {}
+    with open(file_specification, 'wb') as cache_file :
+        numpy.savez(
+            cache_file,
+            version=CACHE_VERSION,
+            size=stamp.get('size', -1),
+            mtime=stamp.get('mtime', -1),
+            hash=stamp.get('hash', ''),
+            **toolpath.arrays()
+        )
+
+# ..............................................................................
+                              # load a toolpath and the stamp of its source file
+def load_toolpath(file_specification):
+    with numpy.load(file_specification) as cache :
+        stamp = {
+            'version' : int(cache['version']),
+            'size'    : int(cache['size']),
+            'mtime'   : int(cache['mtime']),
+            'hash'    : str(cache['hash']),
+        }
+        toolpath = Toolpath({field : cache[field] for field in FIELDS})
+
+    return(toolpath, stamp)
+
+# ..............................................................................
+            # toolpath of a g-code file, from the sidecar cache when it is valid
+def load_gcode_toolpath(gcode_file_spec, use_cache=True, worker_nb=1):
+    status = os.stat(gcode_file_spec)
+    stamp = {'size' : status.st_size, 'mtime' : status.st_mtime_ns}
+    cache_spec = cache_file_spec(gcode_file_spec)
+                                                                 # try the cache
+    if use_cache and os.path.isfile(cache_spec) :
+        try :
+            (toolpath, cached_stamp) = load_toolpath(cache_spec)
+        except (OSError, ValueError, KeyError) :
+            cached_stamp = {}
+        if (cached_stamp.get('version') == CACHE_VERSION) and \
+            (cached_stamp.get('size') == stamp['size'])       \
+        :
+            if cached_stamp['mtime'] == stamp['mtime'] :
+                return(toolpath)
+            stamp['hash'] = file_hash(gcode_file_spec)
+            if cached_stamp['hash'] == stamp['hash'] :
+                save_toolpath(toolpath, cache_spec, stamp)
+                return(toolpath)
+                                                                # parse the file
+    if worker_nb > 1 :
+        moves = gcode_parser.parse_gcode_file_parallel(
+            gcode_file_spec, worker_nb
+        )
+    else :
+        moves = gcode_parser.parse_gcode_file(gcode_file_spec)
+    toolpath = toolpath_from_moves(moves)
+    if use_cache :
+        if 'hash' not in stamp :
+            stamp['hash'] = file_hash(gcode_file_spec)
+        try :
+            save_toolpath(toolpath, cache_spec, stamp)
+        except OSError :
+            pass
+
+    return(toolpath)